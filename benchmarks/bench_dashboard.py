@@ -0,0 +1,155 @@
+"""Benchmark the latency of the dashboard queries, on datasets of synthetic logs.
+
+For each dataset size, measures the p50 and p95 latency, and the peak memory allocated (tracemalloc), of:
+- dashboard_data:        DashboardApp.get_dashboard_data() of all logs, using the incremental aggregates.
+- dashboard_data_range:  get_dashboard_data() of the logs of half of the time span, computing all tables.
+- table/<dashboard>:     get_dashboard_table_data() of each dashboard of DASHBOARDS_CONFIG, from all logs.
+- aggregate/<dashboard>: the incrementally maintained table of each dashboard.
+- context/<dashboard>:   context_data() drill-downs on rows of each dashboard with a contextual dashboard.
+
+Example, with the shipped configuration and datasets of 10k and 1M logs:
+    python benchmarks/bench_dashboard.py --rows 10000,1000000 -o dashboard.json
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+from common import build_config, metric, report, save_results
+from loggen import LogGenerator
+from pyweblogalyzer import DashboardApp, WebLogDataSet
+from pyweblogalyzer.cli import ENVVAR_CONFIG
+
+
+def measure(func, repeat, memory=True):
+    """Run func repeat times, and return a metric of its latency percentiles, and its peak memory allocated."""
+    durations = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    details = {"p95": float(numpy.percentile(durations, 95))}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            details["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return metric(float(numpy.percentile(durations, 50)), "s", False, **details)
+
+
+def load_dashboard(rows, args):
+    """Return a dashboard app on a dataset of synthetic logs, added by batches like the collector does."""
+    dataset = WebLogDataSet()
+    dashboard = DashboardApp(dataset, "pyweblogalyzer.config.Config", ENVVAR_CONFIG)
+    # Don't log the execution time of each request
+    dashboard.logger.setLevel(logging.WARNING)
+    # Spread the logs over the specified number of days
+    generator = LogGenerator(
+        build_config(args.config),
+        ips=args.ips,
+        urls=args.urls,
+        user_agents=args.user_agents,
+        seed=args.seed,
+        rate=rows / (args.days * 86400),
+    )
+    for batch in generator.batches(rows):
+        dataset.add_batch(batch)
+    return dashboard, dataset
+
+
+def table_kwargs(dashboard):
+    """Return the get_dashboard_table_data() arguments of a dashboard config, as get_dashboard_data() does."""
+    return dict(
+        display_cols=dashboard.get(DashboardApp.CONFIG_KEY_DISPLAY_COLS, []),
+        groupby_cols=dashboard.get(DashboardApp.CONFIG_KEY_GROUP_BY_COLS),
+        count_title=dashboard.get(DashboardApp.CONFIG_KEY_COUNT_TITLE, "count"),
+        time_group=dashboard.get(DashboardApp.CONFIG_KEY_TIME_GROUP),
+        time_title=dashboard.get(DashboardApp.CONFIG_KEY_TIME_TITLE, "tcount"),
+        allow_empty=dashboard.get(DashboardApp.CONFIG_KEY_ALLOW_EMPTY, False),
+    )
+
+
+def context_keys(app, dashboard, tabledata, count):
+    """Return the keys clicked on count rows evenly spread in a dashboard table, as sent by the dashboard page."""
+    ctxt_dashboard = app.config[DashboardApp.CONFIG_KEY_DASHBOARDS].get(dashboard.get(DashboardApp.CONFIG_KEY_ONCLICK))
+    column = ctxt_dashboard and ctxt_dashboard.get(DashboardApp.CONFIG_KEY_FILTER)
+    if column not in tabledata.columns or not len(tabledata):
+        return []
+    values = app._export_table(tabledata[[column]])
+    rows = numpy.unique(numpy.linspace(0, len(values) - 1, count).astype(int))
+    return [str(values[row][0]) for row in rows]
+
+
+def bench_size(rows, args):
+    app, dataset = load_dashboard(rows, args)
+    memory = not args.no_memory
+    logdata = dataset.get_dataframe()
+    results = {"dashboard_data": measure(app.get_dashboard_data, args.repeat, memory)}
+    start = logdata.index.min()
+    span = logdata.index.max() - start
+    results["dashboard_data_range"] = measure(
+        lambda: app.get_dashboard_data(start + span / 4, start + span * 3 / 4), args.repeat, memory
+    )
+
+    with app.app_context():
+        for dashboard_id, dashboard in app.config[DashboardApp.CONFIG_KEY_DASHBOARDS].items():
+            if dashboard.get(DashboardApp.CONFIG_KEY_CONTEXTUAL, False):
+                continue
+            kwargs = table_kwargs(dashboard)
+            results[f"table/{dashboard_id}"] = measure(
+                lambda: app.get_dashboard_table_data(dataset.get_dataframe(), **kwargs), args.repeat, memory
+            )
+            if dataset.get_aggregate(dashboard_id) is not None:
+                results[f"aggregate/{dashboard_id}"] = measure(
+                    lambda: dataset.get_aggregate(dashboard_id), args.repeat, memory
+                )
+
+            keys = context_keys(app, dashboard, app.get_dashboard_table_data(logdata, **kwargs), args.keys)
+            if keys:
+                results[f"context/{dashboard_id}"] = measure(
+                    lambda: [app.context_data(dashboard_id, key) for key in keys], args.repeat, memory
+                )
+                # Latency of a single drill-down
+                for name in ("value", "p95"):
+                    results[f"context/{dashboard_id}"][name] /= len(keys)
+    return {f"{rows}/{name}": result for name, result in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="10000,1000000", help="Comma separated sizes of the datasets, e.g. 10000000")
+    parser.add_argument("--days", type=float, default=7, help="Time span of the logs in days")
+    parser.add_argument("--ips", type=int, default=100000, help="Number of distinct IPs")
+    parser.add_argument("--urls", type=int, default=20000, help="Number of distinct URLs")
+    parser.add_argument("--user-agents", type=int, default=1000, help="Number of distinct user agents")
+    parser.add_argument("--seed", type=int, default=0, help="Random generator seed")
+    parser.add_argument("-k", "--keys", type=int, default=5, help="Number of contextual drill-downs per dashboard")
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="Runs of each query to compute the percentiles")
+    parser.add_argument("--no-memory", action="store_true", help="Don't measure the peak memory of the queries")
+    parser.add_argument("-c", "--config", help="Config file, e.g. with the DASHBOARDS_CONFIG to measure")
+    parser.add_argument("-o", "--output", help="JSON file to save the results")
+    parser.add_argument("-b", "--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Regression ratio failing the comparison")
+    args = parser.parse_args()
+
+    if args.config:
+        os.environ[ENVVAR_CONFIG] = os.path.abspath(args.config)
+    results = {}
+    for rows in map(int, args.rows.split(",")):
+        results.update(bench_size(rows, args))
+    if args.output:
+        params = {
+            name: value for name, value in vars(args).items() if name not in ("output", "baseline", "max_regression")
+        }
+        save_results(args.output, "dashboard", params, results)
+    sys.exit(report(results, args.baseline, args.max_regression))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark the ingestion of synthetic access logs.
+
+Measures:
+- parse:      lines per second parsed by LogParser.parse_lines, with no I/O.
+- collect:    lines per second read, parsed, enriched and added to the dataset by CollectorApp._parse_log_file.
+- memory:     bytes per row held by WebLogDataSet, measured with tracemalloc.
+- end_to_end: seconds from the creation of the collector until the dataframe of all logs is returned, with the
+              configured COLLECTION_WORKERS.
+
+Example, saving results and comparing them with a previous run:
+    python benchmarks/bench_ingest.py -n 200000 -o ingest.json --baseline previous.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from common import best_time, build_config, metric, report, save_results
+from loggen import LogGenerator
+from pyweblogalyzer import CollectorApp, WebLogDataSet
+from pyweblogalyzer.collector.parser import LogParser
+
+
+def bench_parse(config, log_lines, repeat):
+    parser = LogParser(config)
+    batch_lines = config["COLLECTION_BATCH_LINES"]
+
+    def parse():
+        return [parser.parse_lines(log_lines[idx:idx + batch_lines]) for idx in range(0, len(log_lines), batch_lines)]
+
+    duration, batches = best_time(parse, repeat)
+    return len(log_lines) / duration, batches
+
+
+def bench_collect(config, logfile, nlines, repeat):
+    def collect():
+        dataset = WebLogDataSet()
+        CollectorApp(dataset, config)._parse_log_file(logfile)
+        return dataset
+
+    # The collector creation is included, it is negligible compared to the parsing of large files
+    duration, dataset = best_time(collect, repeat)
+    if len(dataset) != nlines:
+        raise RuntimeError(f"{len(dataset)} logs collected out of {nlines}")
+    return nlines / duration
+
+
+def bench_memory(batches):
+    """Return the bytes per row allocated by a dataset when adding parsed batches."""
+    tracemalloc.start()
+    try:
+        dataset = WebLogDataSet()
+        for batch in batches:
+            dataset.add_batch(batch)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size / len(dataset)
+
+
+def bench_end_to_end(config, repeat):
+    def ingest():
+        dataset = WebLogDataSet()
+        collector = CollectorApp(dataset, config)
+        try:
+            logfiles = collector._build_file_list()
+            if config["COLLECTION_WORKERS"]:
+                collector._parse_log_files_parallel(logfiles)
+            else:
+                for logfile in logfiles:
+                    collector._parse_log_file(logfile)
+        finally:
+            if collector._pool:
+                collector._pool.shutdown()
+        return dataset.get_dataframe()
+
+    duration, _ = best_time(ingest, repeat)
+    return duration
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as folder:
+        logfile = os.path.join(folder, "access.log")
+        config = build_config(args.config, WEB_LOG_PATH=folder, COLLECTION_WORKERS=args.workers)
+        generator = LogGenerator(config, ips=args.ips, urls=args.urls, user_agents=args.user_agents, seed=args.seed)
+        size = generator.write(logfile, args.lines)
+        with open(logfile) as file:
+            log_lines = file.read().splitlines()
+
+        parse_rate, batches = bench_parse(config, log_lines, args.repeat)
+        del log_lines
+        results = {
+            "parse": metric(parse_rate, "lines/s", True),
+            "collect": metric(bench_collect(config, logfile, args.lines, args.repeat), "lines/s", True),
+            "memory": metric(bench_memory(batches), "bytes/row", False),
+            "end_to_end": metric(bench_end_to_end(config, args.repeat), "s", False),
+        }
+    params = {name: value for name, value in vars(args).items() if name not in ("output", "baseline", "max_regression")}
+    params["log_bytes"] = size
+    return params, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--lines", type=int, default=100000, help="Number of log lines")
+    parser.add_argument("--ips", type=int, default=1000, help="Number of distinct IPs")
+    parser.add_argument("--urls", type=int, default=500, help="Number of distinct URLs")
+    parser.add_argument("--user-agents", type=int, default=200, help="Number of distinct user agents")
+    parser.add_argument("--seed", type=int, default=0, help="Random generator seed")
+    parser.add_argument("-w", "--workers", type=int, default=0, help="COLLECTION_WORKERS of the end to end ingest")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Runs of each measure, the best one is kept")
+    parser.add_argument("-c", "--config", help="Config file, e.g. with the LOG__FORMAT or enrichers to use")
+    parser.add_argument("-o", "--output", help="JSON file to save the results")
+    parser.add_argument("-b", "--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="Regression ratio failing the comparison")
+    args = parser.parse_args()
+
+    params, results = run(args)
+    if args.output:
+        save_results(args.output, "ingest", params, results)
+    sys.exit(report(results, args.baseline, args.max_regression))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Helpers shared by the benchmarks: configuration, timings, and JSON results."""
+import json
+import os
+import platform
+import runpy
+import subprocess
+import sys
+import time
+
+from datetime import datetime, timezone
+from importlib import metadata
+
+from pyweblogalyzer.config import Config
+
+
+def build_config(config_file=None, **overrides):
+    """Return the default configuration as a dict, updated with the upper case settings of a config file.
+
+    Geoip databases are disabled unless set in the config file, to measure the parsing rather than the lookups.
+    """
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update(GEOIP_CITY_DB=None, GEOIP_ASN_DB=None)
+    if config_file:
+        config.update({key: value for key, value in runpy.run_path(config_file).items() if key.isupper()})
+    config.update(overrides)
+    return config
+
+
+def best_time(func, repeat):
+    """Run func repeat times, and return the shortest duration in seconds with the result of the last run."""
+    best = None
+    result = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = func()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def environment():
+    """Describe the environment of the results, to only compare comparable runs."""
+    try:
+        version = metadata.version("pyweblogalyzer")
+    except metadata.PackageNotFoundError:
+        version = None
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "version": version,
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_results(path, benchmark, params, results):
+    """Write the results of a benchmark as JSON, with its parameters and environment."""
+    report = {"benchmark": benchmark, "environment": environment(), "params": params, "results": results}
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+    return report
+
+
+def compare_results(results, baseline_path, max_regression):
+    """Print the change of each metric from a baseline results file, and return the metrics regressed by more than
+    max_regression (a ratio). Metrics are dicts with a value and whether higher is better."""
+    with open(baseline_path) as file:
+        baseline = json.load(file)["results"]
+    regressions = []
+    for name, metric in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous["value"]:
+            continue
+        change = metric["value"] / previous["value"] - 1
+        regression = -change if metric["higher_is_better"] else change
+        print(f"{name}: {previous['value']:.6g} -> {metric['value']:.6g} {metric['unit']} ({change:+.1%})")
+        if regression > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def metric(value, unit, higher_is_better, **details):
+    """Build a metric result. Only the value is compared with the baseline, details are informative."""
+    return dict(details, value=value, unit=unit, higher_is_better=higher_is_better)
+
+
+def report(results, baseline=None, max_regression=0.1):
+    """Print the results, and compare them with a baseline results file if specified. Returns the exit status, 1 if
+    some metrics regressed by more than max_regression."""
+    for name, result in results.items():
+        details = [
+            f"{key}={value:.6g}" for key, value in result.items() if key not in ("value", "unit", "higher_is_better")
+        ]
+        print(f"{name}: {result['value']:.6g} {result['unit']}" + (f" ({', '.join(details)})" if details else ""))
+    if baseline:
+        regressions = compare_results(results, baseline, max_regression)
+        if regressions:
+            print(f"Regressions of more than {max_regression:.0%}: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
@@ -0,0 +1,183 @@
+"""Generate synthetic access logs matching the configured log format.
+
+Values are drawn from pools of configurable cardinality, with a Zipf-like distribution so that a few IPs, URLs and
+user agents make most of the traffic, as in real logs. Runs are reproducible for a given seed.
+"""
+import argparse
+import itertools
+import random
+import string
+
+from datetime import datetime, timedelta, timezone
+
+import numpy
+import pandas
+
+from common import build_config
+from pyweblogalyzer.collector.parser import LogParser
+
+# Logs are generated by blocks of lines, drawn together
+BLOCK_LINES = 10000
+
+OPERATIONS = ["GET"] * 17 + ["POST"] * 2 + ["HEAD"]
+STATUSES = [200] * 40 + [304] * 5 + [404] * 3 + [301, 500]
+PROTOCOLS = ["HTTP/1.1"] * 3 + ["HTTP/2.0"]
+
+USER_AGENT_TEMPLATES = [
+    "Mozilla/5.0 (X11; Linux x86_64; rv:{major}.0) Gecko/20100101 Firefox/{major}.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/{major}.0.{minor}.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+    "Version/{major}.{minor} Safari/605.1.15",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 14_{minor} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+    "Version/{major}.0 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 11; SM-G{minor}) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/{major}.0.4472.120 Mobile Safari/537.36",
+    "Mozilla/5.0 (compatible; Googlebot/2.{minor}; +http://www.google.com/bot.html)",
+    "curl/7.{major}.{minor}",
+]
+
+
+def _zipf_weights(count):
+    return list(itertools.accumulate(1 / rank for rank in range(1, count + 1)))
+
+
+class LogGenerator:
+    """Generate log lines in the log format of a configuration, from pools of distinct values."""
+
+    def __init__(self, config, ips=1000, urls=500, user_agents=200, hostnames=3, seed=0, start=None, rate=100.0):
+        """Generate logs from the start datetime, at rate logs per second, with the specified number of distinct
+        ips, urls, user agents and hostnames."""
+        self._seed = seed
+        self._rng = random.Random(seed)
+        self._format = config["LOG__FORMAT"]
+        self._date_format = config["LOG_DATE_TIME_FORMAT"]
+        self._start = start or datetime(2021, 6, 1, tzinfo=timezone.utc)
+        self._rate = rate
+        self._count = 0
+        self._dates = {}
+        # Fields of the format, anonymous fields being filled with "-"
+        fields = [field for _, field, _, _ in string.Formatter().parse(self._format) if field is not None]
+        self._anonymous = ["-"] * fields.count("")
+        self._named = set(fields) - {""}
+
+        rng = self._rng
+        self._ips = [
+            f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+            for _ in range(ips)
+        ]
+        self._urls = [self._make_url(idx) for idx in range(urls)]
+        self._user_agents = [
+            rng.choice(USER_AGENT_TEMPLATES).format(major=rng.randint(50, 99), minor=idx) for idx in range(user_agents)
+        ]
+        self._hostnames = [f"www{idx}.example.com" for idx in range(hostnames)]
+        self._weights = {count: _zipf_weights(count) for count in (ips, urls, user_agents, hostnames)}
+
+    def _make_url(self, idx):
+        depth = self._rng.randint(1, 4)
+        path = "/".join(self._rng.choice(["blog", "static", "api", "img", "page", "docs"]) for _ in range(depth))
+        return f"/{path}/{idx}" + self._rng.choice(["", ".html", ".css", ".js", ".png", "?q=1"])
+
+    def _draw(self, values, count):
+        return self._rng.choices(values, cum_weights=self._weights[len(values)], k=count)
+
+    def _date(self, timestamp):
+        # Logs are dated by seconds, consecutive logs mostly share the same date string
+        second = int(timestamp)
+        if second not in self._dates:
+            if len(self._dates) > BLOCK_LINES:
+                self._dates.clear()
+            self._dates[second] = (self._start + timedelta(seconds=second)).strftime(self._date_format)
+        return self._dates[second]
+
+    def lines(self, count):
+        """Generate count log lines, following the previously generated ones."""
+        rng = self._rng
+        for block_start in range(0, count, BLOCK_LINES):
+            size = min(BLOCK_LINES, count - block_start)
+            ips = self._draw(self._ips, size)
+            urls = self._draw(self._urls, size)
+            referers = self._draw(self._urls, size)
+            user_agents = self._draw(self._user_agents, size)
+            hostnames = self._draw(self._hostnames, size)
+            for idx in range(size):
+                values = {
+                    "remote_ip": ips[idx],
+                    "datetime": self._date(self._count / self._rate),
+                    "request": f"{rng.choice(OPERATIONS)} {urls[idx]} {rng.choice(PROTOCOLS)}",
+                    "status": rng.choice(STATUSES),
+                    "bytes_sent": rng.randint(0, 200000),
+                    "referer": f"https://{hostnames[idx]}{referers[idx]}" if rng.random() < 0.7 else "-",
+                    "hostname": hostnames[idx],
+                    "user_agent": user_agents[idx],
+                    "request_time": f"{rng.expovariate(20):.3f}",
+                }
+                self._count += 1
+                yield self._format.format(
+                    *self._anonymous, **{name: values.get(name, "-") for name in self._named}
+                ) + "\n"
+
+    def batches(self, count, batch_rows=100000):
+        """Generate count parsed logs, as columns batches of at most batch_rows logs, to fill datasets quickly.
+
+        Logs are drawn from the same pools as the log lines, with no geolocation, but not in the same sequence.
+        """
+        rng = numpy.random.default_rng(self._seed)
+        user_agents = numpy.array([LogParser._parse_user_agent(user_agent) for user_agent in self._user_agents])
+        start = pandas.Timestamp(self._start).value
+        for block_start in range(0, count, batch_rows):
+            size = min(batch_rows, count - block_start)
+            user_agent_codes = self._draw_codes(rng, self._user_agents, size)
+            rows = numpy.arange(block_start, block_start + size)
+            yield {
+                "timestamp": start + (rows / self._rate).astype(numpy.int64) * 10**9,
+                "remote_ip": numpy.array(self._ips, dtype=object)[self._draw_codes(rng, self._ips, size)],
+                "http_url": numpy.array(self._urls, dtype=object)[self._draw_codes(rng, self._urls, size)],
+                "request_status": rng.choice(STATUSES, size),
+                "city": numpy.full(size, "unknown", dtype=object),
+                "country": numpy.full(size, "unknown", dtype=object),
+                "bytes_sent": rng.integers(0, 200000, size),
+                "request_time": rng.exponential(0.05, size).round(3),
+                "browser": user_agents[user_agent_codes, 0].astype(object),
+                "os": user_agents[user_agent_codes, 1].astype(object),
+                "device": user_agents[user_agent_codes, 2].astype(object),
+                "http_operation": rng.choice(OPERATIONS, size).astype(object),
+                "http_referer": numpy.full(size, "-", dtype=object),
+                "hostname": numpy.array(self._hostnames, dtype=object)[self._draw_codes(rng, self._hostnames, size)],
+                "protocol": rng.choice(PROTOCOLS, size).astype(object),
+                "lat": numpy.zeros(size),
+                "long": numpy.zeros(size),
+                "asn": numpy.full(size, "unknown", dtype=object),
+            }
+
+    def _draw_codes(self, rng, values, count):
+        weights = numpy.array(self._weights[len(values)])
+        return numpy.searchsorted(weights, rng.random(count) * weights[-1], side="right").clip(0, len(values) - 1)
+
+    def write(self, path, count):
+        """Write count log lines in a file, returns its size in bytes."""
+        with open(path, "w") as file:
+            file.writelines(self.lines(count))
+            return file.tell()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="Log file to generate")
+    parser.add_argument("-n", "--lines", type=int, default=100000, help="Number of log lines")
+    parser.add_argument("--ips", type=int, default=1000, help="Number of distinct IPs")
+    parser.add_argument("--urls", type=int, default=500, help="Number of distinct URLs")
+    parser.add_argument("--user-agents", type=int, default=200, help="Number of distinct user agents")
+    parser.add_argument("--seed", type=int, default=0, help="Random generator seed")
+    parser.add_argument("-c", "--config", help="Config file with the LOG__FORMAT of the logs")
+    args = parser.parse_args()
+
+    generator = LogGenerator(
+        build_config(args.config), ips=args.ips, urls=args.urls, user_agents=args.user_agents, seed=args.seed
+    )
+    size = generator.write(args.output, args.lines)
+    print(f"Generated {args.lines} logs in {args.output} ({size / 1024 / 1024:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,34 @@
 # Period in second to read new log data
 # COLLECTION_DELAY_SECS = 60
 
+# Number of worker processes parsing the log files in parallel. If 0, files are parsed in the collector thread.
+# COLLECTION_WORKERS = 0
+# Size in bytes of the chunks of large log files parsed by each worker. If 0, each file is parsed by one worker.
+# COLLECTION_CHUNK_BYTES = 32 * 1024 * 1024
+
+# Collection mode:
+# "poll":   Every COLLECTION_DELAY_SECS, parse the new logs of all files.
+# "follow": Keep the files open and parse the new lines as soon as they are written. Changes are detected with
+#           inotify if available, otherwise files are checked every FOLLOW_MAX_WAIT_SECS.
+# COLLECTION_MODE = "poll"
+# FOLLOW_MAX_WAIT_SECS = 1.0
+
+# Parsed logs are added to the dataset by batches of at most COLLECTION_BATCH_LINES. The dashboards only wait
+# for the dataset while a batch is added, not while logs are parsed.
+# COLLECTION_BATCH_LINES = 1000
+
+# Folder where the parsed logs and the positions in the log files are saved every SNAPSHOT_PERIOD_SECS. At startup,
+# the logs are loaded from the snapshot and only the following lines are parsed. If None, no snapshot is saved.
+# SNAPSHOT_PATH = "/config/snapshot"
+# SNAPSHOT_PERIOD_SECS = 300
+
+# Retention of the logs in the dataset: logs older than RETENTION_MAX_AGE_SECS, or exceeding RETENTION_MAX_ROWS,
+# are evicted (by chunks, so slightly more logs can be kept). None to keep all logs.
+# With RETENTION_ROLLUP, the time_group dashboards keep counting the evicted logs per period, to show the history.
+# RETENTION_MAX_AGE_SECS = None
+# RETENTION_MAX_ROWS = None
+# RETENTION_ROLLUP = True
+
 # Path to the access log file. If the path is a folder, all access.log files in the folder will be parsed.
 # Optionaly if a WEB_LOG_FILTER is specified, only files containing the filter will be processed.
 WEB_LOG_PATH = "/logs"
@@ -43,6 +71,20 @@ LOG__FORMAT = (
     ' "{referer}" {hostname} "{user_agent}" "{request_time}" "{}"'
 )
 
+# Log lines parser:
+# "auto":  Parse with a regex compiled from LOG__FORMAT, and use the parse library for lines not matching it
+#         (fields are matched up to the first character following them in the format).
+# "regex": Only use the compiled regex. The parse library is used if the format can't be compiled.
+# "parse": Only use the parse library (slower, but supports the fields formats e.g. {status:d}).
+# LOG_PARSER = "auto"
+
+# Maximum number of parsed user agents kept in cache. 0 to disable the cache.
+# USER_AGENT_CACHE_SIZE = 10000
+
+# Size of the geolocation cache of the last ips seen, and lifetime of its entries in seconds (None to keep them)
+# GEOIP_CACHE_SIZE = 100000
+# GEOIP_CACHE_TTL_SECS = 86400
+
 # List of client ips and requests to be excluded from the statistics
 EXCLUDE_REMOTE_IP = []
 EXCLUDE_REQUESTS = ["/metrics"]
@@ -58,7 +100,9 @@ SERVER_URL = "www.example.org"
 LOG_ENRICHERS_ROOT = "/config/log_enrichers"
 # Custom log enrichers, defined by the location of the main python file, and the class name.
 # All enrichers must inherit LogEnrichers (see collector/log_enrichers.py for more details).
-# Each enricher will be called with every parsed log entry, and can add auxiliary informations to them
+# Each enricher will be called with every batch of parsed logs, and can add auxiliary informations to them
+# Enrichers calling external services can inherit IOBoundEnricherPlugin, to run their lookups in a pool of
+# threads with a timeout, their config setting the workers, timeout_secs, cache_size and cache_ttl_secs.
 LOG_ENRICHERS = [
     {
         'class_path': "enricher_example.py",
@@ -77,9 +121,35 @@ LOG_ENRICHERS = [
 # PORT = 9333  # ports < 1024 need root
 # DEBUG = True  # if True, enable reloader and debugger
 
+# Number of dashboard worker processes, served by gunicorn (pip install gunicorn). If 0, the dashboards are served
+# by the development server, next to the collector thread. With workers, the collector runs in the main process and
+# saves the logs in SNAPSHOT_PATH (required) every SNAPSHOT_PERIOD_SECS, which should then be short (e.g. 10), only
+# the new logs being written. Each worker keeps a copy of the logs, checks for a new snapshot every
+# SNAPSHOT_RELOAD_SECS to add the new logs, and serves the requests with DASHBOARD_THREADS threads.
+# DASHBOARD_WORKERS = 0
+# DASHBOARD_THREADS = 16
+# SNAPSHOT_RELOAD_SECS = 2.0
+
+# Responses of at least RESPONSE_COMPRESSION_MIN_BYTES are compressed for the clients accepting it, with brotli if
+# installed, or gzip. If None, responses are not compressed. Responses are serialized with orjson if installed.
+# RESPONSE_COMPRESSION_MIN_BYTES = 1024
+
+# Responses are computed once per dataset update, and cached for the RESPONSES_CACHE_SIZE most recent requests
+# (dashboards, table pages, searches and sorts). If 0, responses are not cached.
+# RESPONSES_CACHE_SIZE = 128
+
 # Preset refresh times in seconds
 # REFRESH_TIMES = [30, 60, 300, 600]
 
+# By default the dashboards are updated live: the server notifies the pages when new logs are added, at most every
+# EVENTS_MIN_PERIOD_SECS, and sends a keep alive every EVENTS_KEEPALIVE_SECS when there are no new logs.
+# EVENTS_MIN_PERIOD_SECS = 2.0
+# EVENTS_KEEPALIVE_SECS = 30.0
+# Each live page holds a server thread: at most EVENTS_MAX_CLIENTS pages (per worker process) are updated live, the
+# others being refreshed periodically. If None, the live pages are not limited, or limited to half the
+# DASHBOARD_THREADS with workers.
+# EVENTS_MAX_CLIENTS = None
+
 # Format of the time for start and end date displayed in the dashboard
 # DASHBOARD_RANGE_TIME_FORMAT = "%c"
 
@@ -108,6 +178,14 @@ LOG_ENRICHERS = [
 #     count_title:    Column title for the count of duplicates, if group_by_cols is specified. Default to "count"
 #     group_by_cols:  List of columns to group by unique values, removing duplicates and add a column with
 #                     the occurrences count of each value. No grouping or counting if empty or None
+#     top_n:          With group_by_cols, only the top_n groups with the largest counts are displayed. The badge
+#                     still counts all the groups.
+#     approximate:    With top_n, if True the logs are only counted for the most frequent groups (top_n * 10) as
+#                     they are added, with a memory and a cost not depending on the number of distinct groups.
+#                     Counts can be lower than the actual ones by at most the max error, and the badge only counts
+#                     the groups kept. Counts of a time range are exact. For high cardinality columns.
+#                     Default to False
+#     error_title:    Column title for the max error of the approximate counts. No error column if not specified
 #     time_title:     Column title for the count per time period, if time_group is specified. Default to "tcount"
 #     time_group:     Group by the specified time period. For format of the time period , see:
 #                     https://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html#offset-aliases
@@ -128,6 +206,9 @@ LOG_ENRICHERS = [
 #     on_click:       Name of the contextual dashboard to display when a row is clicked
 #                     Unused for contextual dashboards.
 #     large:          If True, the dashboard will take the whole width of the screen. Default is False
+#     server_side:    If True, the table rows are not sent with the dashboards data, only the page displayed is
+#                     requested, sorted and searched by the server. For large tables, e.g. of all logs.
+#                     Default is False
 DASHBOARDS_CONFIG = {
     "requests": {
         "table_title": "Requests",
@@ -233,6 +314,11 @@ DASHBOARDS_CONFIG = {
         "count_title": "URLs count",
         "display_cols": ["http_url"],
         "group_by_cols": ['http_url'],
+        # To only display the most frequent URLs, counted approximately to bound the memory used with many
+        # distinct URLs:
+        # "top_n": 50,
+        # "approximate": True,
+        # "error_title": "Max error",
         "table_order": "URLs count",
         "graph_config": {
             'data': [{'type': 'bar', 'x': "http_url", 'y': "URLs count"}],
@@ -311,6 +397,7 @@ DASHBOARDS_CONFIG = {
         "table_title": "Logs",
         "count_title": None,
         "large": True,
+        "server_side": True,
         "allow_empty": True,
         "display_cols": [
             "timestamp",
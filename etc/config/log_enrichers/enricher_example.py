@@ -27,13 +27,15 @@ class ExampleEnricher(LogEnricherPlugin):
         self._enable = self._config["enable_example"],
 
     def enrich_log(self, log_data):
-        # This method is called for every new log collected, after parsing
+        # This method is called for every new log collected, after parsing, by the default enrich_batch().
+        # As this example overrides enrich_batch(), it is only used if enrich_batch() is removed
 
         if self._enable:
             # Logdata is the parsed log, containing all fields listed in dataset.weblogdata.LOG_INFOS
             # All those information can be used and accessed as fields, e.g. log_data.http_url.
             # They are not meant to be altered.
-            # But if needed, they must be uddated through the internal dict: log_data._data['http_url'] = "xxx"
+            # But if needed, they can be updated as attributes: log_data.http_url = "xxx", and the logs are stored
+            # with the updated values
             url_params = log_data.http_url.split('?')
 
             # A logger is provided
@@ -42,3 +44,16 @@ class ExampleEnricher(LogEnricherPlugin):
             # Any new field can be added to the logs. they will be automatically prefixed with "aux_".
             # In this example, a new data column "aux_param" will be created and can be used in dashboards
             log_data.add_aux_info("param", url_params[1] if len(url_params) > 0 else None)
+
+    def enrich_batch(self, logs):
+        # Optional: this method is called with batches of logs, and calls enrich_log() for each log by default.
+        # It can be overridden to process all logs at once, which is much faster for large volumes of logs.
+
+        # Logs is a pandas dataframe, with a column per field, including the auxiliary fields of previous enrichers
+        if not self._enable:
+            return {}
+        url_params = logs["http_url"].str.split("?", n=1).str[1]
+
+        # Return the new fields with their values for all logs, they will be prefixed with "aux_" as well.
+        # Fields of the logs can be updated by returning their name with the new values, e.g. "http_url": urls
+        return {"param": url_params}
@@ -1,5 +1,6 @@
 from pyweblogalyzer.collector.app import CollectorApp  # ignore F401
-from pyweblogalyzer.collector.enrichers import LogEnricherPlugin, install_and_import  # ignore F401
+from pyweblogalyzer.collector.enrichers import IOBoundEnricherPlugin, LogEnricherPlugin  # ignore F401
+from pyweblogalyzer.collector.enrichers import install_and_import  # ignore F401
 from pyweblogalyzer.dashboard.app import DashboardApp  # ignore F401
 from pyweblogalyzer.dataset.weblog import WebLogDataSet  # ignore F401
 from pyweblogalyzer.dataset.weblogdata import WebLogData  # ignore F401
@@ -0,0 +1,77 @@
+import time
+
+from collections import OrderedDict
+
+# Value returned by LRUCache.lookup() for keys not in cache
+MISSING = object()
+
+
+class LRUCache:
+    """Cache of computed values, holding at most maxsize entries and evicting the least recently used ones.
+
+    Hits and misses are counted to monitor the cache efficiency. A maxsize of 0 disables the cache.
+    If a ttl is specified, entries older than ttl seconds are computed again.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        """Return the cached value for the key, or compute it with compute(key) and cache it."""
+        value = self.lookup(key)
+        if value is MISSING:
+            value = compute(key)
+            self.put(key, value)
+        return value
+
+    def lookup(self, key):
+        """Return the cached value for the key, or MISSING if it is not cached or expired."""
+        try:
+            value, expiry = self._entries[key]
+            if not self._ttl or time.monotonic() < expiry:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        except KeyError:
+            pass
+        self.misses += 1
+        return MISSING
+
+    def put(self, key, value):
+        if self._maxsize:
+            self._entries[key] = value, time.monotonic() + self._ttl if self._ttl else None
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def merge_stats(*all_stats):
+    """Sum up the counters of caches stats, as dicts of caches names and their stats."""
+    merged = {}
+    for stats in all_stats:
+        for name, cache_stats in stats.items():
+            merged_cache_stats = merged.setdefault(name, {})
+            for counter, value in cache_stats.items():
+                merged_cache_stats[counter] = merged_cache_stats.get(counter, 0) + value
+    return merged
+
+
+def format_stats(stats):
+    """Format caches stats to be logged."""
+    formatted = []
+    for name, cache_stats in stats.items():
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        hit_rate = 100 * cache_stats["hits"] / lookups if lookups else 0
+        formatted.append(f"{name}: {cache_stats['size']} entries, {hit_rate:.1f}% hits of {lookups} lookups")
+    return ", ".join(formatted)
@@ -1,10 +1,16 @@
 import logging
+import os
+
+from flask import Config
+from flask.helpers import get_root_path
 
 import pyweblogalyzer
 from pyweblogalyzer import CollectorApp, DashboardApp, WebLogDataSet
+from pyweblogalyzer.dashboard.workers import SnapshotReloader, gunicorn_installed, run_workers
 from importlib import metadata
 
 ENVVAR_CONFIG="PYWEBLOGALYZER_CONFIG"
+CONFIG_CLASS = "pyweblogalyzer.config.Config"
 log = logging.getLogger(__name__)
 
 
@@ -16,14 +22,61 @@ def setup_logging(logfile=None, loglevel=logging.INFO):
     )
 
 
-def main() -> None:
-    """Main entry point."""
+def load_config():
+    """Load the configuration as the dashboard app does, without creating it."""
+    config = Config(get_root_path(DashboardApp.__module__))
+    config.from_object(CONFIG_CLASS)
+    if os.environ.get(ENVVAR_CONFIG):
+        config.from_envvar(ENVVAR_CONFIG)
+    return config
+
+
+def create_app():
+    """WSGI app of a dashboard worker process, serving the logs of the snapshots saved by the collector process."""
     dataset = WebLogDataSet()
-    dashboard = DashboardApp(dataset, "pyweblogalyzer.config.Config", ENVVAR_CONFIG)
-    collector = CollectorApp(dataset, dashboard.config)
+    dashboard = DashboardApp(dataset, CONFIG_CLASS, ENVVAR_CONFIG)
     setup_logging(logfile=dashboard.config["LOG_FILE"], loglevel=dashboard.config.get("LOG_LEVEL"))
+    if dashboard.config.get("EVENTS_MAX_CLIENTS") is None:
+        # Live pages hold a thread each, keep threads for the other requests
+        dashboard.config["EVENTS_MAX_CLIENTS"] = max(dashboard.config.get("DASHBOARD_THREADS", 16) // 2, 1)
+    reloader = SnapshotReloader(
+        dataset, dashboard.config["SNAPSHOT_PATH"], dashboard.config.get("SNAPSHOT_RELOAD_SECS", 2.0)
+    )
+    # Serve the last snapshot as soon as the worker starts
+    reloader.reload()
+    reloader.start()
+    return dashboard
+
+
+def _use_workers(config):
+    """Return True if the dashboards can be served by worker processes, as configured."""
+    if not config.get("DASHBOARD_WORKERS"):
+        return False
+    if not config.get("SNAPSHOT_PATH"):
+        log.error("DASHBOARD_WORKERS requires a SNAPSHOT_PATH, serving the dashboards from the collector process")
+        return False
+    if not gunicorn_installed():
+        log.error("DASHBOARD_WORKERS requires gunicorn, serving the dashboards from the collector process")
+        return False
+    return True
+
+
+def main() -> None:
+    """Main entry point."""
+    config = load_config()
+    setup_logging(logfile=config["LOG_FILE"], loglevel=config.get("LOG_LEVEL"))
     log.info(f"Started pyweblogalyzer {metadata.version('pyweblogalyzer')}")
 
+    dataset = WebLogDataSet()
+    if _use_workers(config):
+        # The collector process only adds logs and saves snapshots, the dashboards being computed by the workers
+        collector = CollectorApp(dataset, config)
+        collector.start()
+        run_workers(config)
+        return
+
+    dashboard = DashboardApp(dataset, CONFIG_CLASS, ENVVAR_CONFIG)
+    collector = CollectorApp(dataset, dashboard.config)
     # Todo: start flask in a thread, so that we can kill the other task if one stops,
     # or pass the collector task to the dashboard app ?
     collector.start()
@@ -1,76 +1,154 @@
-import gzip
 import logging
+import multiprocessing
 import os
-import socket
 import time
-import parse
-# import pandas
-import geoip2.database
-import user_agents
 
-from datetime import datetime
-from ipaddress import ip_address, ip_network
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 from threading import Thread
-from pyweblogalyzer.dataset.weblogdata import WebLogData
+from pyweblogalyzer.cache import format_stats, merge_stats
+from .archives import Archives, is_archive, open_archive
 from .enrichers import LogEnrichers
+from .follower import FileWatcher, LogFollower
+from .parser import LogParser, init_worker, parse_file_chunk
 
 
 class CollectorApp(Thread):
-    LOG_KEY_REMOTE_ADDR = "remote_ip"
-    LOG_KEY_DATETIME = "datetime"
-    LOG_KEY_REQUEST = "request"
-    LOG_KEY_STATUS = "status"
-    LOG_KEY_BYTES_SENT = "bytes_sent"
-    LOG_KEY_HTTP_REFERER = "referer"
-    LOG_KEY_HOSTNAME = "hostname"
-    LOG_KEY_USER_AGENT = "user_agent"
-    LOG_KEY_REQUEST_TIME = "request_time"
+    MODE_POLL = "poll"
+    MODE_FOLLOW = "follow"
+    # Size of the blocks read from the log files, or of decompressed data read from the archives
+    READ_BLOCK_BYTES = 1024 * 1024
 
     def __init__(self, dataset, config):
         super().__init__(name=__name__, daemon=True)
         self._log_positions = {}
-        self._geoip_cache = {}
         self._config = config
         self.log = logging.getLogger(__name__)
         self._dataset = dataset
         self._running = False
         self._period = self._config['COLLECTION_DELAY_SECS']
-        self._log_parser = parse.compile(self._config['LOG__FORMAT'])
-        self._dt_parser = self._config['LOG_DATE_TIME_FORMAT']
+        self._workers = self._config.get('COLLECTION_WORKERS', 0)
+        self._chunk_size = self._config.get('COLLECTION_CHUNK_BYTES', 0)
+        self._pool = None
+        self._workers_stats = {}
+        self._mode = self._config.get('COLLECTION_MODE', self.MODE_POLL)
+        self._follow_period = self._config.get('FOLLOW_MAX_WAIT_SECS', 1.0)
+        self._batch_lines = self._config.get('COLLECTION_BATCH_LINES', 1000)
+        self._snapshot_path = self._config.get('SNAPSHOT_PATH')
+        self._snapshot_period = self._config.get('SNAPSHOT_PERIOD_SECS', 300)
+        self._snapshot_time = time.monotonic()
+        self._snapshot_generation = None
+        self._retention_max_age = self._config.get('RETENTION_MAX_AGE_SECS')
+        self._retention_max_rows = self._config.get('RETENTION_MAX_ROWS')
 
-        self._enricher = LogEnrichers(config)
-        self._local_networks = [ip_network(local_net) for local_net in self._config['LOCAL_NETWORKS']]
-        self._geoloc_city = self._init_geoloc(self._config.get('GEOIP_CITY_DB'))
-        self._geoloc_asn = self._init_geoloc(self._config.get('GEOIP_ASN_DB'))
+        self._archives = Archives()
 
-        self._set_server_info()
+        self._enricher = LogEnrichers(config)
+        self._parser = LogParser(config)
 
     def run(self):
-        """Run the thread periodically polling log files."""
+        """Run the thread periodically polling log files, or following them."""
         self._running = True
+        self._restore()
+        if self._mode == self.MODE_FOLLOW:
+            self._follow()
         while self._running:
             self.log.info("Collector running")
 
+            # The dataset is not locked while parsing, parsed logs are added by batches
             logfiles = self._build_file_list()
-            self._dataset.lock()
-            for logfile in logfiles:
-                # TODO: async reading of all files ?
-                self.log.info(f"Parsing {logfile}")
-                self._parse_log_file(logfile)
-
-            self._dataset.unlock()
-            self.log.info("Collector finished")
+            if self._workers:
+                self._parse_log_files_parallel(logfiles)
+            else:
+                for logfile in logfiles:
+                    self.log.info(f"Parsing {logfile}")
+                    self._parse_log_file(logfile)
+
+            self.log.info(f"Collector finished, caches stats: {format_stats(self.stats())}")
+            self._apply_retention()
+            self._checkpoint()
             time.sleep(self._period)
 
-    def _set_server_info(self):
-        server_url = self._config.get('SERVER_URL')
-        if server_url:
-            self._server_ip = socket.gethostbyname(server_url)
-            self._server_city, self._server_asn = self._get_geoloc(self._server_ip)
-        else:
-            self._server_ip = None
-            self._server_city = None
-            self._server_asn = None
+    def stats(self):
+        """Return the parsers caches stats, summed up for all the workers."""
+        return merge_stats(self._parser.stats(), *self._workers_stats.values())
+
+    def stop(self):
+        """Stop collecting logs, after the current pass."""
+        self._running = False
+
+    def _restore(self):
+        """Load the logs of the last snapshot, if any, and resume reading the log files from the saved positions.
+        Archives already read are skipped."""
+        if not self._snapshot_path:
+            return
+        try:
+            collector_state = self._dataset.load_snapshot(self._snapshot_path)
+            self._log_positions.update(collector_state.get("positions", {}))
+            self._archives.consumed.update(collector_state.get("archives", []))
+            self._snapshot_generation = self._dataset.generation
+            self.log.info(f"Loaded {len(self._dataset)} logs from snapshot {self._snapshot_path}")
+        except Exception as e:
+            self.log.error(f"Cannot load snapshot {self._snapshot_path}, parsing all logs: {e}")
+
+    def _apply_retention(self):
+        """Evict the logs older than the retention max age, or exceeding the retention max rows."""
+        if self._retention_max_age is None and self._retention_max_rows is None:
+            return
+        min_timestamp = None
+        if self._retention_max_age is not None:
+            min_timestamp = datetime.now(timezone.utc) - timedelta(seconds=self._retention_max_age)
+        evicted = self._dataset.evict(min_timestamp, self._retention_max_rows)
+        if evicted:
+            self.log.info(f"Evicted {evicted} logs from the dataset")
+
+    def _checkpoint(self):
+        """Save a snapshot of the dataset and the positions in the log files, if new logs were added since the last
+        one and the snapshot period is elapsed. Must be called when all the logs read have been added.
+        """
+        if not self._snapshot_path or time.monotonic() - self._snapshot_time < self._snapshot_period:
+            return
+        self._snapshot_time = time.monotonic()
+        generation = self._dataset.generation
+        if generation == self._snapshot_generation:
+            return
+        try:
+            self._dataset.save_snapshot(
+                self._snapshot_path, {"positions": self._log_positions, "archives": sorted(self._archives.consumed)}
+            )
+            self._snapshot_generation = generation
+            self.log.info(f"Saved snapshot {self._snapshot_path}")
+        except Exception as e:
+            self.log.error(f"Cannot save snapshot {self._snapshot_path}: {e}")
+
+    def _follow(self):
+        """Follow the log files, adding new lines as soon as they are written."""
+        follower = LogFollower(self._log_positions, self.READ_BLOCK_BYTES)
+        watcher = FileWatcher(self._config['WEB_LOG_PATH'])
+        self.log.info("Collector following log files")
+        try:
+            while self._running:
+                logfiles = self._build_file_list()
+                # Archives don't change, only the ones not already read are parsed
+                for logfile in logfiles:
+                    if is_archive(logfile):
+                        self._parse_archive(logfile)
+
+                for _, log_lines in follower.poll([logfile for logfile in logfiles if not is_archive(logfile)]):
+                    for idx in range(0, len(log_lines), self._batch_lines):
+                        self._add_log_lines(log_lines[idx:idx + self._batch_lines])
+                self._apply_retention()
+                self._checkpoint()
+                watcher.wait(self._follow_period)
+        finally:
+            follower.close()
+            watcher.close()
+
+    def _add_log_lines(self, log_lines):
+        """Parse and enrich log lines, and add them to the dataset as a single batch."""
+        batch = self._parser.parse_lines(log_lines)
+        self._enricher.enrich_batch(batch)
+        self._dataset.add_batch(batch)
 
     def _build_file_list(self):
         """Build the list of log files to parse."""
@@ -91,120 +169,146 @@ class CollectorApp(Thread):
 
     def _parse_log_file(self, logfile):
         """Load and parse all new logs in the specified file."""
-        # Get the last read position in this file, or read from start if new file
-        is_gzip = logfile.endswith("gz")
-        last_pos = self._log_positions.get(logfile, 0)
-        try:
-            file = gzip.open(logfile, 'rb') if is_gzip else open(logfile, "rb")
-
-            # Set the file pointer, read from start if the last pos exceeds the file, it means the file has changed
-            if (not is_gzip) and (last_pos > os.fstat(file.fileno()).st_size):
-                last_pos = 0
-            file.seek(last_pos)
+        if is_archive(logfile):
+            self._parse_archive(logfile)
+            return
 
-            # Read all new lines and update final position in file
-            log_line = file.readline().decode()
-            while log_line:
-                try:
-                    self._parse_log_line(log_line.strip())
-                except Exception as e:
-                    self.log.error(f"Error parsing log {log_line}: {e}")
-                log_line = file.readline().decode()
-            self._log_positions[logfile] = file.tell()
+        try:
+            with open(logfile, "rb") as file:
+                # Read from start if the last pos exceeds the file, it means the file has changed
+                pos = self._log_positions.get(logfile, 0)
+                if pos > os.fstat(file.fileno()).st_size:
+                    pos = 0
+                # The last line may still be written, it is read in the next pass
+                self._parse_blocks(logfile, file, pos, last_line=False)
         except Exception as e:
             self.log.error(f"Error reading log file {logfile}: {e}")
-        finally:
-            if file:
-                file.close()
 
-    def is_remote_ip(self, ip_str):
-        # If the ip is loopback, v6, or v4 to local network, it is not remote
-        client_ip = ip_address(ip_str)
-        if client_ip.is_loopback or client_ip.version == 6:
-            return False
-        for local_net in self._local_networks:
-            if client_ip in local_net:
-                return False
-        return True
-
-    def _init_geoloc(self, mmdb_path):
+    def _parse_archive(self, logfile):
+        """Load and parse the logs of a gzip archive, unless it was already read."""
         try:
-            if mmdb_path:
-                return geoip2.database.Reader(mmdb_path)
+            fingerprint = self._archives.fingerprint(logfile)
+            if fingerprint in self._archives.consumed:
+                return
+            self.log.info(f"Parsing {logfile}")
+            with open_archive(logfile) as file:
+                # Resume from the last position if an error occurred while reading the archive
+                self._parse_blocks(logfile, file, self._log_positions.get(logfile, 0), last_line=True)
+            self._archives.set_consumed(fingerprint)
+            self._log_positions.pop(logfile, None)
         except Exception as e:
-            self.log.error(f"Cannot open geoloc database with path {mmdb_path}: {e}")
-        return None
-
-    def _get_geoloc(self, ipaddr):
-        city = None
-        asn = None
-        if self.is_remote_ip(ipaddr):
-            if ipaddr in self._geoip_cache:
-                return self._geoip_cache[ipaddr]
-            else:
-                if self._geoloc_city:
-                    city = self._geoloc_city.city(ipaddr)
-                if self._geoloc_asn:
-                    asn = self._geoloc_asn.asn(ipaddr)
-                self._geoip_cache[ipaddr] = city, asn
-        else:
-            return self._server_city, self._server_asn
-        return city, asn
-
-    def _is_excluded(self, parsed_log):
-        """Check if a log is configured to be ignored."""
-        for filter in self._config["EXCLUDE_REQUESTS"]:
-            if filter in parsed_log[self.LOG_KEY_REQUEST]:
-                # TODO:Increment statistics of ignored reauest for filter parsed_log[self.LOG_KEY_REQUEST]
-                return True
-        if parsed_log[self.LOG_KEY_REQUEST] in self._config["EXCLUDE_REMOTE_IP"]:
-            # TODO:Increment statistics of ignored reauest for filter parsed_log[self.LOG_KEY_REQUEST]
-            return True
-        else:
-            return False
+            self.log.error(f"Error reading log file {logfile}: {e}")
 
-    def _parse_log_line(self, log_line):
-        """Execute the command, and process the results."""
-        parsed_log = self._log_parser.parse(log_line)
+    def _parse_blocks(self, logfile, file, pos, last_line):
+        """Parse the logs of a file from a position, read by large blocks split in lines in bulk.
 
-        # Extract info according to custom format configured
-        if not parsed_log:
-            self.log.error(f"Log entry not matching configured format: {log_line}")
-            return
+        The end of the last line of a block is kept for the next block. At the end of the file, a last line with no
+        end of line is parsed if last_line is True, or left for the next pass otherwise. The position in the file is
+        updated after each block.
+        """
+        file.seek(pos)
+        partial = b""
+        block = file.read(self.READ_BLOCK_BYTES)
+        while block:
+            data = partial + block
+            block = file.read(self.READ_BLOCK_BYTES)
+            cut = len(data) if last_line and not block else data.rfind(b"\n") + 1
+            partial = data[cut:]
+            log_lines = data[:cut].decode().split("\n")
+            # Ignore the empty string after the last end of line
+            if not log_lines[-1]:
+                log_lines.pop()
+            for idx in range(0, len(log_lines), self._batch_lines):
+                self._add_log_lines(log_lines[idx:idx + self._batch_lines])
+            pos += cut
+            self._log_positions[logfile] = pos
 
-        if self._is_excluded(parsed_log):
-            return
+    def _get_pool(self):
+        """Return the pool of ingestion workers, created on first use."""
+        if not self._pool:
+            # Spawn rather than fork workers, as the process is running other threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(dict(self._config),),
+            )
+        return self._pool
+
+    def _split_log_file(self, logfile):
+        """Split the new data of a log file in chunks of lines to be parsed by the workers.
+
+        Returns a list of (start, end) positions. Gzip files can't be split, and are read until the end.
+        """
+        last_pos = self._log_positions.get(logfile, 0)
+        if is_archive(logfile):
+            return [(last_pos, None)]
+
+        with open(logfile, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            # Read from start if the last pos exceeds the file, it means the file has changed
+            if last_pos > size:
+                last_pos = 0
+            chunks = []
+            start = last_pos
+            while self._chunk_size and size - start > self._chunk_size:
+                # End the chunk after the end of the line at the chunk size
+                file.seek(start + self._chunk_size)
+                file.readline()
+                end = file.tell()
+                if end >= size:
+                    break
+                chunks.append((start, end))
+                start = end
+        if start < size:
+            chunks.append((start, size))
+        return chunks
+
+    def _parse_log_files_parallel(self, logfiles):
+        """Parse the new logs of all files in the workers processes, and add them to the dataset."""
+        pool = self._get_pool()
+        chunks = {}
+        files_chunks = {}
+        archives = {}
+        for logfile in logfiles:
+            try:
+                # Archives already read are skipped, the others are read by a single worker
+                if is_archive(logfile):
+                    archives[logfile] = self._archives.fingerprint(logfile)
+                    if archives[logfile] in self._archives.consumed:
+                        continue
+                for start, end in self._split_log_file(logfile):
+                    future = pool.submit(parse_file_chunk, logfile, start, end)
+                    chunks[future] = logfile, start
+                    files_chunks.setdefault(logfile, []).append(start)
+            except Exception as e:
+                self.log.error(f"Error reading log file {logfile}: {e}")
+
+        # Add the logs of the chunks of each file in order, as soon as they and the previous ones are parsed. Chunks
+        # after a failed one are not added, the file position staying after the last added chunk.
+        parsed = {}
+        failed = set()
+        for future in as_completed(chunks):
+            logfile, start = chunks[future]
+            if logfile in failed:
+                continue
+            parsed[logfile, start] = future
+            starts = files_chunks[logfile]
+            while starts and (logfile, starts[0]) in parsed:
+                start = starts.pop(0)
+                try:
+                    batch, end, (worker_pid, worker_stats) = parsed.pop((logfile, start)).result()
+                    self._workers_stats[worker_pid] = worker_stats
+                    self._enricher.enrich_batch(batch)
+                    self._dataset.add_batch(batch)
+                    self._log_positions[logfile] = end
+                except Exception as e:
+                    self.log.error(f"Error parsing chunk at {start} of log file {logfile}: {e}")
+                    failed.add(logfile)
+                    break
+            if not starts and logfile not in failed and logfile in archives:
+                self._archives.set_consumed(archives[logfile])
+                self._log_positions.pop(logfile, None)
 
-        # Enrich basic information
-        geoloc, asnloc = self._get_geoloc(parsed_log[self.LOG_KEY_REMOTE_ADDR])
-        operation, url, protocol = parsed_log[self.LOG_KEY_REQUEST].split()
-        user_agent = user_agents.parse(parsed_log[self.LOG_KEY_USER_AGENT])
-
-        # Create a new data entry
-        log_data = WebLogData(
-            remote_ip=parsed_log[self.LOG_KEY_REMOTE_ADDR],
-            http_referer=parsed_log[self.LOG_KEY_HTTP_REFERER],
-            hostname=parsed_log[self.LOG_KEY_HOSTNAME],
-            # timestamp=pandas.to_datetime(parsed_log[self.LOG_KEY_DATETIME], format=self._dt_parser),
-            timestamp=datetime.strptime(parsed_log[self.LOG_KEY_DATETIME], self._dt_parser),
-            bytes_sent=int(parsed_log[self.LOG_KEY_BYTES_SENT]),
-            request_time=float(parsed_log[self.LOG_KEY_REQUEST_TIME]),
-            request_status=int(parsed_log['status']),
-            city=geoloc.city.name if geoloc else "unknown",
-            country=geoloc.country.name if geoloc else "unknown",
-            lat=geoloc.location.latitude if geoloc else 0.0,
-            long=geoloc.location.longitude if geoloc else 0.0,
-            asn=asnloc.autonomous_system_organization if asnloc else "unknown",
-            http_operation=operation,
-            http_url=url,
-            protocol=protocol,
-            browser=user_agent.browser.family,
-            os=user_agent.os.family,
-            device=user_agent.device.family,
-        )
-
-        # Run custom enrichers
-        self._enricher.enrich_log(log_data)
-
-        # Append to the global dataset
-        self._dataset.add(log_data)
+    def is_remote_ip(self, ip_str):
+        return self._parser.is_remote_ip(ip_str)
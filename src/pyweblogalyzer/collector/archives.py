@@ -0,0 +1,49 @@
+import gzip
+import hashlib
+import os
+
+try:
+    # Faster decompression, if python-isal is installed
+    from isal import igzip as gzip_module
+except ImportError:
+    gzip_module = gzip
+
+# Size of the start of the archives hashed to fingerprint them. It includes the gzip header, with its timestamp.
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def is_archive(logfile):
+    return logfile.endswith("gz")
+
+
+def open_archive(logfile):
+    """Open a gzip archive, to read its decompressed data."""
+    return gzip_module.open(logfile, "rb")
+
+
+class Archives:
+    """Track the archives fully read, to skip them in the next passes.
+
+    Archives are identified by a fingerprint of their content, their size and the hash of their start, so that they
+    are still recognized when renamed by log rotations, and not when an archive is replaced by another one.
+    """
+
+    def __init__(self, consumed=()):
+        self.consumed = set(consumed)
+        # Fingerprints per path, with the file status they were computed for
+        self._fingerprints = {}
+
+    def fingerprint(self, logfile):
+        stat = os.stat(logfile)
+        status = stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+        cached = self._fingerprints.get(logfile)
+        if cached and cached[0] == status:
+            return cached[1]
+        with open(logfile, "rb") as file:
+            head = file.read(FINGERPRINT_BYTES)
+        fingerprint = f"{stat.st_size}-{hashlib.sha1(head).hexdigest()}"
+        self._fingerprints[logfile] = status, fingerprint
+        return fingerprint
+
+    def set_consumed(self, fingerprint):
+        self.consumed.add(fingerprint)
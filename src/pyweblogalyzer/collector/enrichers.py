@@ -3,6 +3,13 @@ import logging
 import sys
 from abc import ABC, abstractmethod
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+
+import pandas
+
+from pyweblogalyzer.cache import MISSING, LRUCache
+from pyweblogalyzer.dataset.weblogdata import LOG_AUX_INFO_PREFIX, LOG_INFOS, WebLogData
 
 
 def install(package):
@@ -31,9 +38,13 @@ class LogEnricherPlugin(ABC):
     Each will be checked and installed if needed.
     The LOG_ENRICHERS_ROOT module is imported, so all enriched can import local packages in this folder,
     e.g. from some_module import SomeClass, where SomeClass is declared in LOG_ENRICHERS_ROOT/some_module.py
-    The enrich_log() method is called with every parsed log entry, and the add_aux_info() method can be used
-    to add any additional info to be used in dashboards. Those fields will always be prefixed with "aux_".
-    Note that ALL logs must be added a value for the additional fields (can be None), not just some.
+    Logs are enriched by batches with enrich_batch(), which by default calls enrich_log() with each log of the batch,
+    whose add_aux_info() method can be used to add any additional info to be used in dashboards. Those fields will
+    always be prefixed with "aux_". Note that ALL logs must be added a value for the additional fields (can be None),
+    not just some. enrich_batch() can be overridden to process all logs of a batch at once, e.g. with vectorized
+    pandas operations, enrich_log() being then only called if the enricher calls it.
+    Info fields (dataset.weblogdata.LOG_INFOS) can also be updated, e.g. log_data.http_url = "xxx" in enrich_log(),
+    or by returning their new values from enrich_batch().
     """
 
     def __init__(self, config):
@@ -44,6 +55,100 @@ class LogEnricherPlugin(ABC):
     def enrich_log(self, log_data):
         pass
 
+    def enrich_batch(self, logs):
+        """Enrich a batch of logs, as a dataframe with a column per field, and return the additional info columns.
+
+        Returns a dict of additional fields names (prefixed with "aux_" once added) and their values for all logs.
+        Info fields names can be returned as well, with the values replacing the ones of the logs.
+        """
+        columns = {}
+        fields = logs.columns.tolist()
+        for idx, values in enumerate(logs.itertuples(index=False, name=None)):
+            log_fields = dict(zip(fields, values))
+            log_data = WebLogData(**log_fields)
+            self.enrich_log(log_data)
+            # Info fields updated by enrich_log() are returned with all their values
+            for field, value in zip(LOG_INFOS, log_data.to_arrays()[1]):
+                if value is not log_fields.get(field):
+                    columns.setdefault(field, logs[field].tolist() if field in log_fields else [None] * len(logs))
+                    columns[field][idx] = value
+            for field, value in log_data.aux_infos().items():
+                columns.setdefault(field[len(LOG_AUX_INFO_PREFIX):], [None] * len(logs))[idx] = value
+        return columns
+
+
+class IOBoundEnricherPlugin(LogEnricherPlugin):
+    """Base class for enrichers looking up external services, e.g. with http requests.
+
+    lookup() is called with the value of the KEY_FIELD log field, and returns a dict of the additional fields
+    (FIELDS_DEFAULTS keys) and their values. For a batch, the distinct keys are looked up concurrently in a pool of
+    threads, and the results are cached. Logs whose lookup is not completed before the timeout, or failed, get the
+    FIELDS_DEFAULTS values, and are not cached. A late result is cached when completed, for the next logs.
+    The enricher config can set the pool size, the timeout of a batch lookups, the cache size and the lifetime of
+    its entries, with the workers, timeout_secs, cache_size and cache_ttl_secs keys.
+    """
+
+    KEY_FIELD = "remote_ip"
+    FIELDS_DEFAULTS = {}
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._timeout = self._config.get("timeout_secs", 2.0)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self._config.get("workers", 8), thread_name_prefix=self.__class__.__name__
+        )
+        # Lookups are cached by the pool threads as they complete
+        self._cache = LRUCache(self._config.get("cache_size", 10000), self._config.get("cache_ttl_secs", 3600))
+        self._cache_lock = Lock()
+
+    @abstractmethod
+    def lookup(self, key):
+        pass
+
+    def _cached_lookup(self, key):
+        result = self.lookup(key)
+        with self._cache_lock:
+            self._cache.put(key, result)
+        return result
+
+    def enrich_log(self, log_data):
+        with self._cache_lock:
+            result = self._cache.lookup(getattr(log_data, self.KEY_FIELD))
+        if result is MISSING:
+            result = self.enrich_batch(pandas.DataFrame({self.KEY_FIELD: [getattr(log_data, self.KEY_FIELD)]}))
+            result = {name: values[0] for name, values in result.items()}
+        for name, value in result.items():
+            log_data.add_aux_info(name, value)
+
+    def enrich_batch(self, logs):
+        keys = logs[self.KEY_FIELD].tolist()
+        results = {}
+        futures = {}
+        with self._cache_lock:
+            for key in dict.fromkeys(keys):
+                result = self._cache.lookup(key)
+                if result is MISSING:
+                    futures[self._pool.submit(self._cached_lookup, key)] = key
+                else:
+                    results[key] = result
+
+        done, not_done = wait(futures, timeout=self._timeout)
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                self.log.warning(f"{self.__class__.__name__} lookup of {futures[future]} failed: {e}")
+        if not_done:
+            self.log.warning(f"{self.__class__.__name__}: {len(not_done)} lookups timed out, using default values")
+            for future in not_done:
+                # Lookups not started are cancelled, the running ones are cached when completed
+                future.cancel()
+
+        return {
+            name: [results.get(key, self.FIELDS_DEFAULTS).get(name, default) for key in keys]
+            for name, default in self.FIELDS_DEFAULTS.items()
+        }
+
 
 class LogEnrichers:
     CONFIG_KEY_ENRICHERS_ROOT = "LOG_ENRICHERS_ROOT"
@@ -88,6 +193,33 @@ class LogEnrichers:
             raise Exception("Not a subclass of LogEnricherPlugin")
         return enricher
 
-    def enrich_log(self, log_data):
+    def enrich_batch(self, batch):
+        """Run the enrichers on a columns batch, adding the auxiliary fields columns to the batch, and updating the
+        info fields columns returned by the enrichers."""
+        if not self._enrichers or not len(batch["timestamp"]):
+            return
+        logs = pandas.DataFrame(batch)
+        logs["timestamp"] = pandas.to_datetime(logs["timestamp"], utc=True)
         for plugin in self._enrichers:
-            plugin.enrich_log(log_data)
+            try:
+                columns = plugin.enrich_batch(logs)
+            except Exception as e:
+                self.log.exception(f"Error running enricher {plugin.__class__.__name__}: {e}")
+                continue
+            for name, values in columns.items():
+                values = list(values)
+                if len(values) != len(logs):
+                    self.log.error(f"Enricher {plugin.__class__.__name__} returned {len(values)} values for {name}, "
+                                   f"expected {len(logs)}")
+                    continue
+                # Following enrichers get the fields added or updated by the previous ones
+                if name == "timestamp":
+                    timestamps = pandas.to_datetime(values, utc=True).as_unit("ns")
+                    logs[name] = timestamps
+                    batch[name] = timestamps.asi8
+                elif name in LOG_INFOS:
+                    logs[name] = values
+                    batch[name] = values
+                else:
+                    logs[LOG_AUX_INFO_PREFIX + name] = values
+                    batch[LOG_AUX_INFO_PREFIX + name] = values
@@ -0,0 +1,186 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import time
+
+
+class Inotify:
+    """Minimal inotify binding, only used to wake up when files in watched folders are modified."""
+
+    IN_MODIFY = 0x00000002
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = IN_MODIFY | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "Cannot initialize inotify")
+
+    def add_watch(self, path):
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.WATCH_MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {path}")
+
+    def wait(self, timeout):
+        """Wait until some events are received or the timeout expires. Returns True if events were received."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return False
+        # Events are not decoded, all followed files are checked whenever something changed
+        try:
+            while os.read(self._fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self._fd)
+
+
+class FileWatcher:
+    """Wait for changes in a log folder, using inotify if available or a fixed period otherwise."""
+
+    def __init__(self, path):
+        self.log = logging.getLogger(__name__)
+        folder = path if os.path.isdir(path) else os.path.dirname(path) or "."
+        try:
+            self._inotify = Inotify()
+            self._inotify.add_watch(folder)
+        except Exception as e:
+            self.log.warning(f"Cannot use inotify to watch {folder}, polling files: {e}")
+            self._inotify = None
+
+    def wait(self, timeout):
+        """Wait at most timeout seconds, or less if inotify notified changes."""
+        if self._inotify:
+            self._inotify.wait(timeout)
+        else:
+            time.sleep(timeout)
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+
+
+class FollowedFile:
+    """Log file kept open, and read as data is appended."""
+
+    def __init__(self, path, pos=0):
+        self.file = open(path, "rb")
+        stat = os.fstat(self.file.fileno())
+        self.inode = stat.st_dev, stat.st_ino
+        # Read from start if the position exceeds the file, it means the file has changed
+        self.file.seek(pos if pos <= stat.st_size else 0)
+        self._partial = b""
+
+    @property
+    def position(self):
+        """Position after the last complete line read."""
+        return self.file.tell() - len(self._partial)
+
+    def truncated(self, size):
+        return size < self.position
+
+    def rewind(self):
+        self.file.seek(0)
+        self._partial = b""
+
+    def read_lines(self, block_bytes):
+        """Read the new complete lines by blocks of block_bytes, yielding the list of lines of each block.
+
+        The end of a line still being written is kept for the next read.
+        """
+        block = self.file.read(block_bytes)
+        while block:
+            log_lines = (self._partial + block).split(b"\n")
+            self._partial = log_lines.pop()
+            if log_lines:
+                yield [log_line.decode() for log_line in log_lines]
+            block = self.file.read(block_bytes)
+
+    def close(self):
+        self.file.close()
+
+
+class LogFollower:
+    """Follow log files, keeping them open to read lines as they are appended.
+
+    Rotations are detected when the inode of a file path changes: the remaining lines of the previous file are
+    read, and the new file is read from the start. If the rotated file is still in the followed paths (e.g. renamed
+    from access.log to access.log.1), it keeps being followed from its position, instead of being read again.
+    """
+
+    def __init__(self, positions, block_bytes=1024 * 1024):
+        """Follow files from the specified positions dict, which is updated with the position of the lines read."""
+        self.log = logging.getLogger(__name__)
+        self._files = {}
+        self._positions = positions
+        self._block_bytes = block_bytes
+
+    def poll(self, paths):
+        """Read the new complete lines of each file by blocks, yielding the path and list of lines of each block.
+
+        The position of a file is updated once the lines of a block are processed, when the next one is requested.
+        """
+        inodes = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                inodes[path] = stat.st_dev, stat.st_ino
+            except OSError:
+                pass
+
+        # Move all the files renamed in the followed paths at once, so that the files of a rotation chain (e.g.
+        # access.log.1 to access.log.2 and access.log to access.log.1) keep being followed from their position
+        paths_by_inode = {inode: path for path, inode in inodes.items()}
+        files = {}
+        rotated = []
+        for path, followed in self._files.items():
+            new_path = path if inodes.get(path) == followed.inode else paths_by_inode.get(followed.inode)
+            if new_path is None:
+                rotated.append((path, followed))
+                continue
+            if new_path != path:
+                self.log.info(f"Log file {path} rotated to {new_path}")
+            files[new_path] = followed
+        for path in self._files:
+            if path not in files:
+                # A new file replaced the followed one, read it from the start
+                self._positions.pop(path, None)
+        self._files = files
+
+        # Rotated out of the followed paths, read the remaining lines
+        for path, followed in rotated:
+            try:
+                for log_lines in followed.read_lines(self._block_bytes):
+                    yield path, log_lines
+            except Exception as e:
+                self.log.error(f"Error reading log file {path}: {e}")
+            finally:
+                followed.close()
+
+        for path in inodes:
+            try:
+                if path not in self._files:
+                    self._files[path] = FollowedFile(path, self._positions.get(path, 0))
+                followed = self._files[path]
+                if followed.truncated(os.fstat(followed.file.fileno()).st_size):
+                    self.log.info(f"Log file {path} truncated, reading from start")
+                    followed.rewind()
+                for log_lines in followed.read_lines(self._block_bytes):
+                    yield path, log_lines
+                    self._positions[path] = followed.position
+                self._positions[path] = followed.position
+            except Exception as e:
+                self.log.error(f"Error reading log file {path}: {e}")
+
+    def close(self):
+        for followed in self._files.values():
+            followed.close()
+        self._files = {}
@@ -0,0 +1,327 @@
+import logging
+import os
+import re
+import socket
+import parse
+import geoip2.database
+import user_agents
+
+from datetime import datetime, timedelta, timezone
+from ipaddress import ip_address, ip_network
+from pyweblogalyzer.collector.archives import is_archive, open_archive
+from pyweblogalyzer.cache import LRUCache
+from pyweblogalyzer.dataset.weblogdata import WebLogData, logs_to_batch
+
+
+# Usual web servers date format, parsed without strptime
+COMMON_LOG_DATE_TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+MONTHS = {month: idx + 1 for idx, month in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+)}
+
+
+def compile_log_format(log_format):
+    """Compile a log format in a regex matching the lines, or return None if the format is not supported.
+
+    Fields are matched until the first character of the following text, e.g. '"{request}"' is matched with
+    '"(?P<request>[^"]*)"'. Only named and anonymous fields are supported, not fields types or formats.
+    """
+    pattern = ""
+    tokens = [token for token in re.split(r"({[^{}]*})", log_format) if token]
+    for idx, token in enumerate(tokens):
+        if not (token.startswith("{") and token.endswith("}")):
+            pattern += re.escape(token)
+            continue
+        name = token[1:-1]
+        if name and not name.isidentifier():
+            return None
+        next_text = tokens[idx + 1] if idx + 1 < len(tokens) else ""
+        if next_text.startswith("{"):
+            # Two consecutive fields can't be delimited
+            return None
+        field = f"[^{re.escape(next_text[0])}]*" if next_text else ".*"
+        pattern += f"(?P<{name}>{field})" if name else field
+    try:
+        return re.compile(pattern + "$")
+    except re.error:
+        return None
+
+
+class DateTimeParser:
+    """Parse log dates, reusing the last result for the logs of the same second."""
+
+    def __init__(self, date_format):
+        self._date_format = date_format
+        self._parse = self._parse_common if date_format == COMMON_LOG_DATE_TIME_FORMAT else self._parse_strptime
+        self._last = None
+        self._last_parsed = None
+
+    def _parse_strptime(self, date_str):
+        return datetime.strptime(date_str, self._date_format)
+
+    def _parse_common(self, date_str):
+        """Parse dates like '10/Oct/2000:13:55:36 -0700'."""
+        if len(date_str) != 26:
+            return self._parse_strptime(date_str)
+        try:
+            offset = int(date_str[22:24]) * 60 + int(date_str[24:26])
+            return datetime(
+                int(date_str[7:11]),
+                MONTHS[date_str[3:6]],
+                int(date_str[0:2]),
+                int(date_str[12:14]),
+                int(date_str[15:17]),
+                int(date_str[18:20]),
+                tzinfo=timezone(timedelta(minutes=-offset if date_str[21] == "-" else offset)),
+            )
+        except (KeyError, IndexError, ValueError):
+            # Not exactly in the expected form, let strptime handle it or report the error
+            return self._parse_strptime(date_str)
+
+    def parse(self, date_str):
+        if date_str != self._last:
+            self._last_parsed = self._parse(date_str)
+            self._last = date_str
+        return self._last_parsed
+
+
+class LocalNetworks:
+    """Set of IPv4 networks, matching addresses by looking up their prefixes instead of testing each network."""
+
+    def __init__(self, networks):
+        # Network prefixes by prefix length
+        self._prefixes = {}
+        for network in map(ip_network, networks):
+            if network.version == 4:
+                shift = 32 - network.prefixlen
+                self._prefixes.setdefault(shift, set()).add(int(network.network_address) >> shift)
+
+    def __contains__(self, ip):
+        value = int(ip)
+        return any((value >> shift) in prefixes for shift, prefixes in self._prefixes.items())
+
+
+class LogParser:
+    """Parse log lines according to the configured format, and add the geolocation and user agent info."""
+
+    LOG_KEY_REMOTE_ADDR = "remote_ip"
+    LOG_KEY_DATETIME = "datetime"
+    LOG_KEY_REQUEST = "request"
+    LOG_KEY_STATUS = "status"
+    LOG_KEY_BYTES_SENT = "bytes_sent"
+    LOG_KEY_HTTP_REFERER = "referer"
+    LOG_KEY_HOSTNAME = "hostname"
+    LOG_KEY_USER_AGENT = "user_agent"
+    LOG_KEY_REQUEST_TIME = "request_time"
+
+    # Parser types: use the regex compiled from the format and the parse library for lines not matching it (auto),
+    # or only the regex, or only the parse library
+    PARSER_AUTO = "auto"
+    PARSER_REGEX = "regex"
+    PARSER_PARSE = "parse"
+
+    def __init__(self, config):
+        self._config = config
+        self.log = logging.getLogger(__name__)
+        self._geoip_cache = LRUCache(
+            self._config.get('GEOIP_CACHE_SIZE', 100000), self._config.get('GEOIP_CACHE_TTL_SECS', 86400)
+        )
+        self._log_parser = parse.compile(self._config['LOG__FORMAT'])
+        self._log_regex = None
+        parser_type = self._config.get('LOG_PARSER', self.PARSER_AUTO)
+        if parser_type != self.PARSER_PARSE:
+            self._log_regex = compile_log_format(self._config['LOG__FORMAT'])
+            if not self._log_regex:
+                self.log.warning("Log format not supported by the regex parser, using the parse library")
+        self._regex_only = parser_type == self.PARSER_REGEX and self._log_regex
+        self._dt_parser = DateTimeParser(self._config['LOG_DATE_TIME_FORMAT'])
+        self._user_agents_cache = LRUCache(self._config.get('USER_AGENT_CACHE_SIZE', 10000))
+
+        self._local_networks = LocalNetworks(self._config['LOCAL_NETWORKS'])
+        self._geoloc_city = self._init_geoloc(self._config.get('GEOIP_CITY_DB'))
+        self._geoloc_asn = self._init_geoloc(self._config.get('GEOIP_ASN_DB'))
+
+        self._set_server_info()
+
+    def _set_server_info(self):
+        server_url = self._config.get('SERVER_URL')
+        if server_url:
+            self._server_ip = socket.gethostbyname(server_url)
+            self._server_city, self._server_asn = self._locate(self._server_ip)
+        else:
+            self._server_ip = None
+            self._server_city = None
+            self._server_asn = None
+
+    def is_remote_ip(self, ip_str):
+        # If the ip is loopback, v6, or v4 to local network, it is not remote
+        client_ip = ip_address(ip_str)
+        if client_ip.is_loopback or client_ip.version == 6:
+            return False
+        return client_ip not in self._local_networks
+
+    def _init_geoloc(self, mmdb_path):
+        try:
+            if mmdb_path:
+                return geoip2.database.Reader(mmdb_path)
+        except Exception as e:
+            self.log.error(f"Cannot open geoloc database with path {mmdb_path}: {e}")
+        return None
+
+    def _locate(self, ipaddr):
+        """Look up the city and ASN of an ip in the geoloc databases, None if the ip is not found."""
+        city = None
+        asn = None
+        try:
+            if self._geoloc_city:
+                city = self._geoloc_city.city(ipaddr)
+        except Exception as e:
+            self.log.debug(f"Cannot find the city of {ipaddr}: {e}")
+        try:
+            if self._geoloc_asn:
+                asn = self._geoloc_asn.asn(ipaddr)
+        except Exception as e:
+            self.log.debug(f"Cannot find the ASN of {ipaddr}: {e}")
+        return city, asn
+
+    def _lookup_geoloc(self, ipaddr):
+        if self.is_remote_ip(ipaddr):
+            return self._locate(ipaddr)
+        return self._server_city, self._server_asn
+
+    def _get_geoloc(self, ipaddr):
+        # Local ips and lookup failures are cached as well, as the server location or None
+        return self._geoip_cache.get(ipaddr, self._lookup_geoloc)
+
+    def stats(self):
+        """Return the parser caches stats."""
+        return {"user_agents": self._user_agents_cache.stats(), "geoip": self._geoip_cache.stats()}
+
+    @staticmethod
+    def _parse_user_agent(user_agent_str):
+        """Return the browser, os and device of a user agent."""
+        user_agent = user_agents.parse(user_agent_str)
+        return user_agent.browser.family, user_agent.os.family, user_agent.device.family
+
+    def _is_excluded(self, parsed_log):
+        """Check if a log is configured to be ignored."""
+        for filter in self._config["EXCLUDE_REQUESTS"]:
+            if filter in parsed_log[self.LOG_KEY_REQUEST]:
+                # TODO:Increment statistics of ignored reauest for filter parsed_log[self.LOG_KEY_REQUEST]
+                return True
+        if parsed_log[self.LOG_KEY_REQUEST] in self._config["EXCLUDE_REMOTE_IP"]:
+            # TODO:Increment statistics of ignored reauest for filter parsed_log[self.LOG_KEY_REQUEST]
+            return True
+        else:
+            return False
+
+    def _match(self, log_line):
+        """Extract the log format fields from a line, or return None if it is not matching."""
+        if self._log_regex:
+            match = self._log_regex.match(log_line)
+            if match or self._regex_only:
+                return match
+        return self._log_parser.parse(log_line)
+
+    def parse_line(self, log_line):
+        """Parse a log line and return its data, or None if it is not matching the format or excluded."""
+        parsed_log = self._match(log_line)
+
+        # Extract info according to custom format configured
+        if not parsed_log:
+            self.log.error(f"Log entry not matching configured format: {log_line}")
+            return None
+
+        if self._is_excluded(parsed_log):
+            return None
+
+        # Enrich basic information
+        geoloc, asnloc = self._get_geoloc(parsed_log[self.LOG_KEY_REMOTE_ADDR])
+        operation, url, protocol = parsed_log[self.LOG_KEY_REQUEST].split()
+        user_agent = parsed_log[self.LOG_KEY_USER_AGENT]
+        browser, os_name, device = self._user_agents_cache.get(user_agent, self._parse_user_agent)
+
+        # Create a new data entry
+        return WebLogData(
+            remote_ip=parsed_log[self.LOG_KEY_REMOTE_ADDR],
+            http_referer=parsed_log[self.LOG_KEY_HTTP_REFERER],
+            hostname=parsed_log[self.LOG_KEY_HOSTNAME],
+            timestamp=self._dt_parser.parse(parsed_log[self.LOG_KEY_DATETIME]),
+            bytes_sent=int(parsed_log[self.LOG_KEY_BYTES_SENT]),
+            request_time=float(parsed_log[self.LOG_KEY_REQUEST_TIME]),
+            request_status=int(parsed_log['status']),
+            city=geoloc.city.name if geoloc else "unknown",
+            country=geoloc.country.name if geoloc else "unknown",
+            lat=geoloc.location.latitude if geoloc else 0.0,
+            long=geoloc.location.longitude if geoloc else 0.0,
+            asn=asnloc.autonomous_system_organization if asnloc else "unknown",
+            http_operation=operation,
+            http_url=url,
+            protocol=protocol,
+            browser=browser,
+            os=os_name,
+            device=device,
+        )
+
+    def parse_lines(self, log_lines):
+        """Parse log lines, and return the parsed logs as a columns batch."""
+        return logs_to_batch(self.parse_logs(log_lines))
+
+    def parse_logs(self, log_lines):
+        """Parse log lines, and return the list of parsed logs. Lines that can't be parsed are logged and skipped."""
+        logs = []
+        for log_line in log_lines:
+            try:
+                log_data = self.parse_line(log_line.strip())
+                if log_data:
+                    logs.append(log_data)
+            except Exception as e:
+                self.log.error(f"Error parsing log {log_line}: {e}")
+        return logs
+
+
+# Parser of the ingestion worker processes, created when the worker starts
+_worker_parser = None
+# Size of the blocks read by the ingestion workers, from the log files or of decompressed data from the archives
+WORKER_READ_BLOCK_BYTES = 1024 * 1024
+
+
+def init_worker(config):
+    """Initialize an ingestion worker process."""
+    global _worker_parser
+    from pyweblogalyzer.cli import setup_logging
+
+    setup_logging(logfile=config["LOG_FILE"], loglevel=config.get("LOG_LEVEL"))
+    _worker_parser = LogParser(config)
+
+
+def parse_file_chunk(logfile, start, end=None):
+    """Parse the logs of a file between the start and end positions, run in an ingestion worker.
+
+    Files are read by blocks, so that only the lines of a block are held in memory. Gzip files are read until the end,
+    positions being in the uncompressed data. In other files, a last line with no end of line may still be written,
+    it is left for the next pass.
+    Returns the columns batch of parsed logs, the position after the last read log, and the worker process id with
+    its parser stats.
+    """
+    archive = is_archive(logfile)
+    logs = []
+    pos = start
+    partial = b""
+    with (open_archive(logfile) if archive else open(logfile, "rb")) as file:
+        file.seek(start)
+        while True:
+            size = WORKER_READ_BLOCK_BYTES if end is None else min(WORKER_READ_BLOCK_BYTES, end - pos - len(partial))
+            block = file.read(size) if size > 0 else b""
+            data = partial + block
+            cut = len(data) if archive and not block else data.rfind(b"\n") + 1
+            partial = data[cut:]
+            log_lines = data[:cut].decode().split("\n")
+            # Ignore the empty string after the last end of line
+            if not log_lines[-1]:
+                log_lines.pop()
+            logs.extend(_worker_parser.parse_logs(log_lines))
+            pos += cut
+            if not block:
+                break
+    return logs_to_batch(logs), pos, (os.getpid(), _worker_parser.stats())
@@ -6,10 +6,15 @@ import re
 import time
 import urllib.parse
 from copy import deepcopy
+from threading import Lock
 
+import numpy
 import pandas
-from flask import Blueprint, Flask, current_app, render_template
+from flask import Blueprint, Flask, Response, abort, current_app, make_response, render_template, request
 
+from pyweblogalyzer.cache import MISSING, LRUCache
+from pyweblogalyzer.dashboard.encoding import OrjsonProvider, compress, orjson, select_encoding
+from pyweblogalyzer.dataset.aggregates import TimeGroupAggregate, build_aggregate
 from pyweblogalyzer.dataset.weblogdata import WebLogData
 
 appblueprint = Blueprint("dashboard", __name__)
@@ -46,12 +51,18 @@ class DashboardApp(Flask):
     CONFIG_KEY_TIME_TITLE = "time_title"
     CONFIG_KEY_GRAPH = "graph_config"
     CONFIG_KEY_ALLOW_EMPTY = "allow_empty"
+    CONFIG_KEY_SERVER_SIDE = "server_side"
+    CONFIG_KEY_TOP_N = "top_n"
+    CONFIG_KEY_APPROXIMATE = "approximate"
+    CONFIG_KEY_ERROR_TITLE = "error_title"
     CONFIG_TEXT_RENDERER_REGEX = "\{\{(?P<key>[\d\s\w]*)\}\}"
     DEFAULT_GEO_MARKER_MAX_SIZE = 100
     DEFAULT_BADGE_TYPE = "gray"
 
     def __init__(self, dataset, config_class, config_env: None):
         super().__init__(__name__)
+        if orjson:
+            self.json = OrjsonProvider(self)
         self._dataset = dataset
         self.renderer_parser = re.compile(self.CONFIG_TEXT_RENDERER_REGEX)
 
@@ -59,7 +70,40 @@ class DashboardApp(Flask):
         if config_env and os.environ.get(config_env):
             self.config.from_envvar(config_env)
 
+        # Computed responses of the most recent requests, for the dataset generation they were computed for
+        self._responses_generation = None
+        self._responses_cache = LRUCache(self.config.get("RESPONSES_CACHE_SIZE", 128))
+        self._responses_lock = Lock()
+        # Number of clients receiving the events, each holding a server thread
+        self._events_clients = 0
+        self._events_lock = Lock()
+
         self.register_blueprint(appblueprint)
+        self._register_aggregates()
+
+    def _register_aggregates(self):
+        """Register in the dataset the dashboards tables that can be computed incrementally as logs are added, and
+        the indexes of the columns filtered by the contextual dashboards."""
+        for dashboard_id, dashboard in self.config[self.CONFIG_KEY_DASHBOARDS].items():
+            if dashboard.get(self.CONFIG_KEY_CONTEXTUAL, False):
+                filter = dashboard.get(self.CONFIG_KEY_FILTER)
+                if filter and filter != "timestamp":
+                    self._dataset.add_index(filter)
+            else:
+                aggregate = build_aggregate(
+                    display_cols=dashboard.get(self.CONFIG_KEY_DISPLAY_COLS, []),
+                    groupby_cols=dashboard.get(self.CONFIG_KEY_GROUP_BY_COLS),
+                    count_title=dashboard.get(self.CONFIG_KEY_COUNT_TITLE, "count"),
+                    time_group=dashboard.get(self.CONFIG_KEY_TIME_GROUP),
+                    time_title=dashboard.get(self.CONFIG_KEY_TIME_TITLE, "tcount"),
+                    allow_empty=dashboard.get(self.CONFIG_KEY_ALLOW_EMPTY, False),
+                    rollup=self.config.get('RETENTION_ROLLUP', True),
+                    top_n=dashboard.get(self.CONFIG_KEY_TOP_N),
+                    approximate=dashboard.get(self.CONFIG_KEY_APPROXIMATE, False),
+                    error_title=dashboard.get(self.CONFIG_KEY_ERROR_TITLE),
+                )
+                if aggregate:
+                    self._dataset.add_aggregate(dashboard_id, aggregate)
 
     def run(self):
         """Start the web app."""
@@ -67,6 +111,16 @@ class DashboardApp(Flask):
         super().run(host=self.config["HOST"], port=self.config["PORT"], debug=self.config["DEBUG"], use_reloader=False)
         self.logger.info("Dashboard started, listening on port {self.config['PORT']}")
 
+    @staticmethod
+    def _filter_value(value):
+        """Convert a filter value to int or float if it represents a number."""
+        if value.isdigit():
+            return int(value)
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
     def get_dashboard_table_data(
         self,
         logdata,
@@ -89,19 +143,11 @@ class DashboardApp(Flask):
                 try:
                     start_time = pandas.Timestamp(value)
                     time_delta = pandas.Timedelta(filter)
-                    tabledata = logdata.loc[start_time:start_time + time_delta]
+                    tabledata = logdata[(logdata.index >= start_time) & (logdata.index <= start_time + time_delta)]
                 except ValueError:
                     self.logger.warning(f"Filter {filter} value {value} is not a column nor a time period, ignoring")
             else:
-                # Convert the value to int or float if it represents a number
-                if value.isdigit():
-                    value = int(value)
-                else:
-                    try:
-                        value = float(value)
-                    except ValueError:
-                        pass
-                tabledata = tabledata[tabledata[filter] == value]
+                tabledata = tabledata[tabledata[filter] == self._filter_value(value)]
 
         # Filter out to keep specify columns
         if display_cols:
@@ -112,17 +158,14 @@ class DashboardApp(Flask):
 
         # If grouping specified, add a column with the duplicates count
         if groupby_cols:
-            tabledata[count_title] = tabledata.groupby(groupby_cols)[groupby_cols[0]].transform('size')
+            tabledata[count_title] = tabledata.groupby(groupby_cols, observed=True)[groupby_cols[0]].transform('size')
             tabledata = tabledata.drop_duplicates(subset=groupby_cols)
             # Not really necessary as js will reorder re_index()
             tabledata.sort_values(by=count_title , axis=0, inplace=True, ignore_index=True, ascending=False)
 
         # If time grouping is specified
         if time_group:
-            # Create a column with a unit to be summed up by period, and set the ts col to 1 to avoid it being removed
-            tabledata[time_title] = 1
-            tabledata['timestamp'] = 1
-            tabledata = tabledata.groupby(pandas.Grouper(freq=time_group)).sum()
+            tabledata = TimeGroupAggregate.group_by_period(tabledata, time_group, time_title)
             # Update the timestamp column with a string version of the period time
             tabledata['timestamp'] = tabledata.index.strftime(WebLogData.DASHBOARD_TIMESTAMP_EXPORT_FORMAT)
             # tabledata['timestamp'] = tabledata.index.astype(numpy.int64) // 10 ** 6
@@ -130,6 +173,118 @@ class DashboardApp(Flask):
         # print(f"pipo {tabledata}")
         return tabledata
 
+    def _export_columns(self, tabledata):
+        """Return the table as a dict of its columns names, and of the list of serializable values of each column."""
+        return {
+            "columns": tabledata.columns.tolist(),
+            "values": [self._export_values(tabledata.iloc[:, idx]) for idx in range(len(tabledata.columns))],
+        }
+
+    def _export_values(self, column):
+        """Return the values of a column as a list, datetimes being converted to strings, and missing values to None,
+        to be serializable (NaN is not valid JSON)."""
+        if pandas.api.types.is_datetime64_any_dtype(column.dtype):
+            column = column.dt.strftime(WebLogData.DASHBOARD_TIMESTAMP_EXPORT_FORMAT)
+        if column.isna().any():
+            column = column.astype(object).where(column.notna(), None)
+        return column.tolist()
+
+    def _export_table(self, tabledata):
+        """Return the table rows as lists of serializable values."""
+        columns = [self._export_values(tabledata.iloc[:, idx]) for idx in range(len(tabledata.columns))]
+        return [list(row) for row in zip(*columns)]
+
+    def cached_response(self, compute, *args):
+        """Build the response of a request, computed only once per dataset generation for the RESPONSES_CACHE_SIZE
+        most recent requests.
+
+        The response etag is based on the generation, so that a client sending it back in If-None-Match
+        gets an empty "not modified" response as long as no new logs have been added.
+        """
+        generation = self._dataset.generation
+        # Generations restart with the dataset origin, and are the same for the workers serving the same snapshot
+        etag = f"{self._dataset.origin}-{generation}"
+        # Etags are weak, as the responses are compressed or not depending on the client
+        if request.if_none_match.contains_weak(etag):
+            response = make_response("", 304)
+        else:
+            cache_key = (compute.__name__,) + args
+            with self._responses_lock:
+                if self._responses_generation != generation:
+                    # Drop the responses computed for previous generations
+                    self._responses_cache = LRUCache(self.config.get("RESPONSES_CACHE_SIZE", 128))
+                    self._responses_generation = generation
+                cache = self._responses_cache
+                cached = cache.lookup(cache_key)
+            if cached is MISSING:
+                # Computed data, with its serialized bodies per content encoding, computed out of the lock so that
+                # requests are not serialized
+                cached = (compute(*args), {})
+                with self._responses_lock:
+                    cache.put(cache_key, cached)
+            response = self._encoded_response(*cached)
+        response.set_etag(etag, weak=True)
+        # Clients must check if the data changed before using their cached version
+        response.cache_control.no_cache = True
+        return response
+
+    def _encoded_response(self, data, bodies):
+        """Build a JSON response of the data, compressed if the client accepts it. Bodies are serialized and
+        compressed only once, and kept in the bodies dict per content encoding."""
+        if not isinstance(data, (dict, list)):
+            return make_response(data)
+        if None not in bodies:
+            bodies[None] = self.json.dumps(data).encode()
+        encoding = None
+        min_bytes = self.config.get("RESPONSE_COMPRESSION_MIN_BYTES")
+        if min_bytes is not None and len(bodies[None]) >= min_bytes:
+            encoding = select_encoding(request.accept_encodings)
+        if encoding not in bodies:
+            bodies[encoding] = compress(bodies[None], encoding)
+        response = make_response(bodies[encoding])
+        response.mimetype = "application/json"
+        if encoding:
+            response.content_encoding = encoding
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def add_events_client(self):
+        """Count a new client of the events. Returns False if there are already EVENTS_MAX_CLIENTS clients."""
+        max_clients = self.config.get("EVENTS_MAX_CLIENTS")
+        with self._events_lock:
+            if max_clients is not None and self._events_clients >= max_clients:
+                return False
+            self._events_clients += 1
+            return True
+
+    def remove_events_client(self):
+        with self._events_lock:
+            self._events_clients -= 1
+
+    def events(self, last_generation=None):
+        """Generate the server-sent events notifying that new logs were added, for the pages to request their data.
+
+        An update event is sent when the dataset generation differs from the last one notified, at most every
+        EVENTS_MIN_PERIOD_SECS, with the generation as event id. A comment is sent every EVENTS_KEEPALIVE_SECS with
+        no update, to keep the connection open and detect closed ones.
+        """
+        min_period = self.config.get("EVENTS_MIN_PERIOD_SECS", 2.0)
+        keepalive = self.config.get("EVENTS_KEEPALIVE_SECS", 30.0)
+        # Delay of the clients reconnections. Clients reconnecting with the current generation have the latest data.
+        yield f"retry: {int(min_period * 1000)}\n\n"
+        generation = self._dataset.generation
+        while True:
+            if generation != last_generation:
+                yield f"event: update\nid: {generation}\ndata: {self._dataset.origin}-{generation}\n\n"
+                last_generation = generation
+                # Batches added in a row are notified once
+                time.sleep(min_period)
+                generation = self._dataset.generation
+            else:
+                generation = self._dataset.wait_generation(last_generation, keepalive)
+                if generation == last_generation:
+                    yield ": keepalive\n\n"
+
     def _render_config(self, graph_config):
         """Update the chart.js graph config to fill missing fields and replace labels and datasets.
         If the config is not valid; the graph will be ignored
@@ -262,6 +417,8 @@ class DashboardApp(Flask):
                     cols.append(db[self.CONFIG_KEY_COUNT_TITLE])
                 if db.get(self.CONFIG_KEY_TIME_TITLE):
                     cols.append(db[self.CONFIG_KEY_TIME_TITLE])
+                if db.get(self.CONFIG_KEY_ERROR_TITLE):
+                    cols.append(db[self.CONFIG_KEY_ERROR_TITLE])
 
                 # If this db is large, but not at the beginning of a row, add an empty db
                 if db.get(self.CONFIG_KEY_LARGE) and len(dashboards) % 2 != 0:
@@ -272,6 +429,7 @@ class DashboardApp(Flask):
                     "columns": cols,
                     "order": db.get(self.CONFIG_KEY_TABLE_ORDER),
                     "hide": db.get(self.CONFIG_KEY_TABLE_HIDE, []),
+                    "server_side": db.get(self.CONFIG_KEY_SERVER_SIDE, False),
                 }
 
                 # If context db, add filter column
@@ -291,43 +449,80 @@ class DashboardApp(Flask):
 
         return render_template('index.html', badges=badges, dashboards=dashboards, config=self.config)
 
-    def get_dashboard_data(self):
-        """Get dashboard data to fill the html page."""
+    def get_time_range(self, args):
+        """Return the start and end timestamps of the request parameters, None if not specified."""
+        time_range = []
+        for arg in ("start", "end"):
+            value = args.get(arg)
+            timestamp = pandas.Timestamp(value) if value else None
+            # Dates with no timezone are in UTC, like the logs timestamps
+            if timestamp is not None and timestamp.tzinfo is None:
+                timestamp = timestamp.tz_localize("UTC")
+            time_range.append(timestamp)
+        return tuple(time_range)
+
+    def _get_table(self, dashboard_id, dashboard, logdata, all_logs):
+        """Return the table of a dashboard: the incrementally maintained table if all logs are selected and there is
+        one, otherwise the table computed from the selected logs."""
+        tabledata = self._dataset.get_aggregate(dashboard_id) if all_logs else None
+        if tabledata is None:
+            tabledata = self.get_dashboard_table_data(
+                logdata,
+                display_cols=dashboard.get(self.CONFIG_KEY_DISPLAY_COLS, []),
+                groupby_cols=dashboard.get(self.CONFIG_KEY_GROUP_BY_COLS),
+                count_title=dashboard.get(self.CONFIG_KEY_COUNT_TITLE, "count"),
+                time_group=dashboard.get(self.CONFIG_KEY_TIME_GROUP),
+                time_title=dashboard.get(self.CONFIG_KEY_TIME_TITLE, "tcount"),
+                allow_empty=dashboard.get(self.CONFIG_KEY_ALLOW_EMPTY, False)
+            )
+            error_title = dashboard.get(self.CONFIG_KEY_ERROR_TITLE)
+            if error_title and dashboard.get(self.CONFIG_KEY_GROUP_BY_COLS):
+                # Counts computed from the logs are exact
+                tabledata = tabledata.assign(**{error_title: 0})
+        return tabledata
+
+    def _top_rows(self, dashboard, tabledata):
+        """Keep the top_n rows of a grouped table, its rows being sorted by decreasing counts."""
+        top_n = dashboard.get(self.CONFIG_KEY_TOP_N)
+        if top_n and dashboard.get(self.CONFIG_KEY_GROUP_BY_COLS):
+            return tabledata.head(top_n)
+        return tabledata
+
+    def get_dashboard_data(self, start=None, end=None):
+        """Get dashboard data to fill the html page, with the logs between start and end if specified."""
         start_time = time.time()
         # Get the latest data
-        logdata = self._dataset.get_dataframe()
+        logdata = self._dataset.get_dataframe(start, end)
+        all_logs = start is None and end is None
 
         # Build a widget for each dashboard in the config
         display_data = []
         for dashboard_id, dashboard in self.config[self.CONFIG_KEY_DASHBOARDS].items():
             if not dashboard.get(self.CONFIG_KEY_CONTEXTUAL, False):
                 db_data = {}
-                tabledata = self.get_dashboard_table_data(
-                    logdata,
-                    display_cols=dashboard.get(self.CONFIG_KEY_DISPLAY_COLS, []),
-                    groupby_cols=dashboard.get(self.CONFIG_KEY_GROUP_BY_COLS),
-                    count_title=dashboard.get(self.CONFIG_KEY_COUNT_TITLE, "count"),
-                    time_group=dashboard.get(self.CONFIG_KEY_TIME_GROUP),
-                    time_title=dashboard.get(self.CONFIG_KEY_TIME_TITLE, "tcount"),
-                    allow_empty=dashboard.get(self.CONFIG_KEY_ALLOW_EMPTY, False)
-                )
+                tabledata = self._get_table(dashboard_id, dashboard, logdata, all_logs)
 
                 # If this db has a badge
                 if dashboard.get(self.CONFIG_KEY_BADGE_TITLE):
                     db_data["badge_id"] = self._get_badge_id(dashboard_id)
                     db_data["badge_value"] = len(tabledata)
+                tabledata = self._top_rows(dashboard, tabledata)
 
-                # Dashboard table data
+                # Dashboard table data by columns, server side tables rows are requested by page
                 db_data["db_id"] = dashboard_id
-                db_data["table_data"] = tabledata.values.tolist()
+                server_side = dashboard.get(self.CONFIG_KEY_SERVER_SIDE, False)
+                if not server_side:
+                    db_data["table"] = self._export_columns(tabledata)
 
                 graph_config = dashboard.get(self.CONFIG_KEY_GRAPH)
                 if graph_config and 'layout' in graph_config:
+                    # Graphs axis refer to the table columns, computed values are sent in graph data
+                    graph_columns = {}
                     graph_data = {}
                     for dataset in graph_config['data']:
                         for key in self._get_dataset_axis_labels(dataset):
-                            graph_data.setdefault(key, [])
-                            graph_data[key].append(tabledata[dataset[key]].tolist())
+                            graph_columns.setdefault(key, [])
+                            graph_columns[key].append(dataset[key])
                         # For geo graphs, render text property
                         if dataset.get("type") == 'scattergeo':
                             if 'text' in dataset:
@@ -341,18 +536,83 @@ class DashboardApp(Flask):
                                     graph_data.setdefault('marker', [])
                                     graph_data['marker'].append(self._render_marker_size(tabledata, dataset))
 
+                    db_data["graph_columns"] = graph_columns
                     db_data["graph_data"] = graph_data
+                    # Server side tables only send the columns of the graph
+                    if server_side:
+                        columns = list(dict.fromkeys(col for cols in graph_columns.values() for col in cols))
+                        db_data["table"] = self._export_columns(tabledata[columns])
                 display_data.append(db_data)
 
         page_data = {
             "dashboards": display_data,
-            "start_date": logdata.index[0].strftime(self.config['DASHBOARD_RANGE_TIME_FORMAT']),
-            "end_date": logdata.index[len(logdata) - 1].strftime(self.config['DASHBOARD_RANGE_TIME_FORMAT']),
+            "start_date": logdata.index.min().strftime(self.config['DASHBOARD_RANGE_TIME_FORMAT']),
+            "end_date": logdata.index.max().strftime(self.config['DASHBOARD_RANGE_TIME_FORMAT']),
         }
 
         self.logger.info(f"Request exec time: {time.time()-start_time}")
         return page_data
 
+    @staticmethod
+    def _search_mask(tabledata, search):
+        """Return the mask of the rows with a column containing the search string (case insensitive).
+
+        Strings columns are searched in their distinct values only, numbers columns are only matched if equal to the
+        search string number, and dates are not searched.
+        """
+        mask = numpy.zeros(len(tabledata), dtype=bool)
+        number = pandas.to_numeric(search, errors="coerce")
+        for col in tabledata.columns:
+            values = tabledata[col]
+            if isinstance(values.dtype, pandas.CategoricalDtype):
+                found = values.cat.categories.astype(str).str.contains(search, case=False, regex=False)
+                mask |= numpy.isin(values.cat.codes.to_numpy(), numpy.flatnonzero(found))
+            elif values.dtype == object or pandas.api.types.is_string_dtype(values.dtype):
+                mask |= values.astype(str).str.contains(search, case=False, regex=False).to_numpy()
+            elif pandas.api.types.is_numeric_dtype(values.dtype) and not pandas.isna(number):
+                mask |= (values == number).to_numpy()
+        return mask
+
+    @staticmethod
+    def _sort_keys(values):
+        """Return keys sorting the values of a column, categories being sorted by value rather than by code."""
+        if isinstance(values.dtype, pandas.CategoricalDtype):
+            ranks = numpy.empty(len(values.cat.categories) + 1, dtype=numpy.int64)
+            ranks[:-1] = numpy.argsort(numpy.argsort(values.cat.categories.astype(str), kind="stable"))
+            # Missing values (code -1) are sorted first
+            ranks[-1] = -1
+            return ranks[values.cat.codes.to_numpy()]
+        if isinstance(values.dtype, pandas.DatetimeTZDtype):
+            return pandas.DatetimeIndex(values).asi8
+        return values.to_numpy()
+
+    def get_table_page(self, dashboard_id, offset=0, length=10, order_col=None, order_dir="asc", search=None,
+                       start=None, end=None):
+        """Get a page of the table of a dashboard, for tables paged, sorted and searched by the server.
+
+        The table rows matching the search are sorted by the order column index, and only the rows of the page
+        are exported. Returns the page rows with the total and filtered rows counts.
+        """
+        dashboard = self.config[self.CONFIG_KEY_DASHBOARDS][dashboard_id]
+        all_logs = start is None and end is None
+        tabledata = self._get_table(dashboard_id, dashboard, self._dataset.get_dataframe(start, end), all_logs)
+        tabledata = self._top_rows(dashboard, tabledata)
+        total = len(tabledata)
+
+        positions = numpy.arange(total)
+        if search:
+            positions = positions[self._search_mask(tabledata, search)]
+        if order_col is not None and 0 <= order_col < len(tabledata.columns):
+            keys = self._sort_keys(tabledata.iloc[:, order_col])[positions]
+            order = numpy.argsort(keys, kind="stable")
+            positions = positions[order[::-1] if order_dir == "desc" else order]
+        page = positions[offset:offset + length] if length >= 0 else positions[offset:]
+        return {
+            "recordsTotal": total,
+            "recordsFiltered": len(positions),
+            "data": self._export_table(tabledata.iloc[page]),
+        }
+
     def _render_marker_size(self, tabledata, dataset):
         marker_data = deepcopy(dataset['marker'])
         size = dataset['marker'].get('size')
@@ -365,7 +625,7 @@ class DashboardApp(Flask):
         marker_data["size"] = [int(sizes[idx] * ratio) for idx in range(len(tabledata))]
         return marker_data
 
-    def context_data(self, dashboard, key):
+    def context_data(self, dashboard, key, start=None, end=None):
         parent_dashboard_config = self.config[self.CONFIG_KEY_DASHBOARDS].get(dashboard)
         ctxt_db = parent_dashboard_config.get(self.CONFIG_KEY_ONCLICK)
         # Only proceed further if a contextual dashboard is configured
@@ -379,7 +639,12 @@ class DashboardApp(Flask):
                 filter = parent_time_group
 
             if dashboard_config:
-                logdata = self._dataset.get_dataframe()
+                # Get the logs matching the key from the filter column index if any, otherwise filter all logs
+                logdata = self._dataset.find(filter, self._filter_value(key), start, end) if key else None
+                if logdata is not None:
+                    filter = None
+                else:
+                    logdata = self._dataset.get_dataframe(start, end)
                 tabledata = self.get_dashboard_table_data(
                     logdata,
                     display_cols=dashboard_config.get(self.CONFIG_KEY_DISPLAY_COLS, []),
@@ -392,7 +657,7 @@ class DashboardApp(Flask):
                 modal_data = {}
                 modal_data["table_id"] = "db-modal-table"
                 modal_data["table_cols"] = tabledata.columns.tolist()
-                modal_data["table_data"] = tabledata.values.tolist()
+                modal_data["table_data"] = self._export_table(tabledata)
                 modal_data["html"] = render_template('modal.html', modal_data=modal_data, table_title=title)
                 return modal_data
             else:
@@ -405,9 +670,51 @@ def get_index():
     return current_app.get_dashboard()
 
 
+def get_time_range():
+    """Return the time range of the request start and end parameters, or an error if they are not valid dates."""
+    try:
+        return current_app.get_time_range(request.args)
+    except ValueError as e:
+        abort(400, f"Invalid time range: {e}")
+
+
 @appblueprint.route("/data", methods=["GET"])
 def get_data():
-    return current_app.get_dashboard_data()
+    return current_app.cached_response(current_app.get_dashboard_data, *get_time_range())
+
+
+@appblueprint.route("/table/<string:dashboard>", methods=["GET"])
+def get_table_data(dashboard):
+    decoded_dashboard = urllib.parse.unquote(dashboard)
+    dashboard_config = current_app.config[current_app.CONFIG_KEY_DASHBOARDS].get(decoded_dashboard)
+    if not dashboard_config or dashboard_config.get(current_app.CONFIG_KEY_CONTEXTUAL, False):
+        abort(404, f"No dashboard {decoded_dashboard}")
+    # Parameters of DataTables server side processing, the rows offset being renamed to not clash with the time range
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        length = int(request.args.get("length", 10))
+        order_col = int(request.args["order_col"]) if request.args.get("order_col") else None
+    except ValueError as e:
+        abort(400, f"Invalid table parameters: {e}")
+    order_dir = request.args.get("order_dir", "asc")
+    search = request.args.get("search") or None
+    return current_app.cached_response(
+        current_app.get_table_page, decoded_dashboard, offset, length, order_col, order_dir, search, *get_time_range()
+    )
+
+
+@appblueprint.route("/events", methods=["GET"])
+def get_events():
+    last_generation = request.headers.get("Last-Event-ID", type=int)
+    # Pages refused live updates refresh their data periodically
+    if not current_app.add_events_client():
+        abort(503)
+    response = Response(current_app.events(last_generation), mimetype="text/event-stream")
+    response.call_on_close(current_app.remove_events_client)
+    response.cache_control.no_cache = True
+    # Don't let proxies buffer the events
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @appblueprint.route("/context/<string:dashboard>/<string:key>", methods=["GET"])
@@ -415,4 +722,4 @@ def get_context_data(dashboard, key):
     # Declode parameters. dashboard is escaped, and key is base64 encoded
     decoded_dashboard = urllib.parse.unquote(dashboard)
     decoded_key = base64.b64decode(key.encode()).decode()
-    return current_app.context_data(decoded_dashboard, decoded_key)
+    return current_app.cached_response(current_app.context_data, decoded_dashboard, decoded_key, *get_time_range())
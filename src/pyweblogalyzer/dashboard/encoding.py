@@ -0,0 +1,49 @@
+import gzip
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    # Faster serialization, if orjson is installed
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # Smaller responses for the browsers supporting it, if brotli is installed
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider serializing with orjson. NaN values are serialized as null."""
+
+    def dumps(self, obj, **kwargs):
+        # Options specific to the json module are only supported by the default provider
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def select_encoding(accept_encodings):
+    """Return the best content encoding accepted by the client, or None to send the response uncompressed."""
+    if brotli and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    """Compress a response body with a content encoding returned by select_encoding()."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
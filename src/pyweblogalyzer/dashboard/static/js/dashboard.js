@@ -1,14 +1,21 @@
 var getDashboardsDatatUrl = null;
 var getDashBoardContextUrl = null;
+var getDashBoardTableUrl = null;
 var graphConfigs = null;
 var getCalendarUrl = null;
 var dashboardsGraphs = {};
 var dtTimeformat = "";
 var refreshTimer = null;
+var getDashboardsEventsUrl = null;
+var eventSource = null;
+var liveFallbackRefreshSecs = 60;
 
-function initParameters(dashBoardDataUrl, dashBoardContextUrl, graphConfig, dtformat)
+function initParameters(dashBoardDataUrl, dashBoardContextUrl, dashBoardTableUrl, dashBoardEventsUrl, graphConfig,
+                        dtformat)
 {
+    getDashboardsEventsUrl = dashBoardEventsUrl;
     getDashBoardContextUrl = dashBoardContextUrl;
+    getDashBoardTableUrl = dashBoardTableUrl;
     getDashboardsDatatUrl = dashBoardDataUrl;
     graphConfigs = graphConfig;
     dtTimeformat = dtformat;
@@ -17,19 +24,74 @@ function initParameters(dashBoardDataUrl, dashBoardContextUrl, graphConfig, dtfo
 function buildContextUrl(db_id, db_key) {
     return getDashBoardContextUrl.replace(
         '__DB_ID__', encodeURIComponent(db_id)).replace('__DB_KEY__', encodeURIComponent(db_key)
-    );
+    ) + timeRangeParams();
+}
+
+function requestTablePage(db_id, data, callback) {
+    // Request a page of a server side table, with the DataTables paging, sorting and search parameters
+    var params = {
+        offset: data.start,
+        length: data.length,
+        order_col: data.order.length ? data.order[0].column : '',
+        order_dir: data.order.length ? data.order[0].dir : 'asc',
+        search: data.search.value,
+    };
+    var url = getDashBoardTableUrl.replace('__DB_ID__', encodeURIComponent(db_id)) + timeRangeParams();
+    $.get(url, params, function(page) {
+        // Echo the draw counter, for DataTables to ignore the responses of outdated requests
+        callback(Object.assign({draw: data.draw}, page));
+    });
+}
+
+function timeRangeParams() {
+    // Forward the start and end parameters of the page url, to only display the logs in this time range
+    var params = new URLSearchParams(window.location.search);
+    var range = new URLSearchParams();
+    ['start', 'end'].forEach(function(param) {
+        if (params.get(param)) range.set(param, params.get(param));
+    });
+    return range.toString() ? '?' + range.toString() : '';
 }
 
 function set_refresh(period_sec) {
+    // Refresh the dashboards every period, or when notified of new logs if 'live'
     clearInterval(refreshTimer);
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
     $(".refresh_nav").each(function() {$(this).removeClass("active")});
     $("#refresh-" + period_sec).addClass("active");
-    if (period_sec > 0) refreshTimer = setInterval(refreshDashboards, period_sec*1000);
+    if (period_sec === 'live') {
+        // The server notifies an update as soon as the page is connected, and whenever new logs are added
+        eventSource = new EventSource(getDashboardsEventsUrl + timeRangeParams());
+        eventSource.addEventListener('update', function(event) {refreshDashboards();});
+        eventSource.onerror = function() {
+            // Live updates are refused when too many pages are connected, refresh the page periodically instead
+            if (eventSource && eventSource.readyState === EventSource.CLOSED) set_refresh(liveFallbackRefreshSecs);
+        };
+    }
+    else if (period_sec > 0) refreshTimer = setInterval(refreshDashboards, period_sec*1000);
 }
 
 function refreshDashboards() {
     console.log(new Date(Date.now()).toISOString() + ": Requesting dashboard data");
-    $.get(getDashboardsDatatUrl, function(data) {dataReceived(data);});
+    $.get(getDashboardsDatatUrl + timeRangeParams(), function(data) {dataReceived(data);});
+}
+
+function tableColumns(table) {
+    // Map the columns names of a table sent by columns to their values
+    var columns = {};
+    table.columns.forEach(function(col, idx) {columns[col] = table.values[idx];});
+    return columns;
+}
+
+function tableRows(table) {
+    // Transpose the columns of a table to the rows displayed by the datatables
+    if (!table.values.length) return [];
+    return table.values[0].map(function(_, row) {
+        return table.values.map(function(values) {return values[row];});
+    });
 }
 
 function dataReceived(json_resp)
@@ -38,23 +100,32 @@ function dataReceived(json_resp)
     $("#start_date").html(json_resp.start_date)
     $("#end_date").html(json_resp.end_date)
     for (i = 0; i < json_resp.dashboards.length; i++) {
+        var db = json_resp.dashboards[i];
         // Update badge if there is one
-        if (json_resp.dashboards[i].hasOwnProperty('badge_id') &&
-            json_resp.dashboards[i].hasOwnProperty('badge_value'))
+        if (db.hasOwnProperty('badge_id') && db.hasOwnProperty('badge_value'))
         {
-            $("#" + json_resp.dashboards[i].badge_id).html(json_resp.dashboards[i].badge_value);
+            $("#" + db.badge_id).html(db.badge_value);
         }
 
-        // Update graph if there is one
-        if (json_resp.dashboards[i].hasOwnProperty('graph_data')) {
-            Plotly.restyle("db-card-chart-" + json_resp.dashboards[i].db_id, json_resp.dashboards[i].graph_data);
+        // Update graph if there is one, its axis data being the table columns they refer to
+        if (db.hasOwnProperty('graph_columns')) {
+            var columns = tableColumns(db.table);
+            var graphData = Object.assign({}, db.graph_data);
+            for (var key in db.graph_columns) {
+                graphData[key] = db.graph_columns[key].map(function(col) {return columns[col];});
+            }
+            Plotly.restyle("db-card-chart-" + db.db_id, graphData);
         }
 
-        // Update tables
-        dt = $("#db-card-table-" + json_resp.dashboards[i].db_id).DataTable();
-        dt.clear(); // TODO: only send new elements, then don't clear
-        dt.rows.add(json_resp.dashboards[i].table_data)
-        dt.draw()
+        // Update tables, server side tables request their current page again
+        dt = $("#db-card-table-" + db.db_id).DataTable();
+        if (dt.init().serverSide) {
+            dt.ajax.reload(null, false);
+        } else {
+            dt.clear(); // TODO: only send new elements, then don't clear
+            dt.rows.add(tableRows(db.table))
+            dt.draw()
+        }
     }
     $("#last_update").html("Last updated: " + new Date(Date.now()).toLocaleTimeString())
     $('#loadsign').hide();
@@ -118,10 +189,16 @@ function createDashboardTable(tableId, ctxt = false, tab_data=null)
         if ($(this).hasClass('order_column')) order_key = index;
     });
 
+    var serverSide = $('#' + tableId).data('server-side') === true;
     var dbTable = $('#'+tableId).DataTable( {
         // "columns": [{ "width": 25 },{  }],
         // "initComplete": function( settings, json ) {},
-        data: tab_data,
+        data: serverSide ? null : tab_data,
+        serverSide: serverSide,
+        processing: serverSide,
+        ajax: serverSide ? function(data, callback, settings) {
+            requestTablePage(tableId.split("db-card-table-")[1], data, callback);
+        } : null,
         columnDefs: [
             {
                 targets: "datetime_column",
@@ -256,6 +333,10 @@ function pageStart()
     initDashboardTables();
     initDashboardGraphs();
 
-    // Request dashboards data
-    refreshDashboards();
+    // Request dashboards data when the server notifies new logs, or only once if not supported by the browser
+    if (window.EventSource) set_refresh('live');
+    else {
+        set_refresh(0);
+        refreshDashboards();
+    }
 }
@@ -0,0 +1,60 @@
+import importlib.util
+import logging
+import subprocess
+import sys
+import time
+
+from threading import Thread
+
+# WSGI app of the dashboard worker processes
+WORKER_APP = "pyweblogalyzer.cli:create_app()"
+
+
+class SnapshotReloader(Thread):
+    """Thread of a dashboard worker process, reloading its dataset when the collector process saves a new snapshot."""
+
+    def __init__(self, dataset, path, period):
+        super().__init__(name=__name__, daemon=True)
+        self._dataset = dataset
+        self._path = path
+        self._period = period
+        self.log = logging.getLogger(__name__)
+
+    def run(self):
+        while True:
+            time.sleep(self._period)
+            self.reload()
+
+    def reload(self):
+        """Reload the dataset if a new snapshot was saved. Errors are logged, the snapshot being checked again later."""
+        try:
+            if self._dataset.reload_snapshot(self._path):
+                self.log.debug(f"Reloaded {len(self._dataset)} logs from snapshot {self._path}")
+        except Exception as e:
+            self.log.error(f"Cannot reload snapshot {self._path}: {e}")
+
+
+def gunicorn_installed():
+    return importlib.util.find_spec("gunicorn") is not None
+
+
+def run_workers(config, app=WORKER_APP):
+    """Serve the dashboards with DASHBOARD_WORKERS gunicorn processes, until they stop. Returns their exit code.
+
+    Workers use threads, so that the live pages waiting for events don't hold a whole process.
+    """
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "--workers", str(config["DASHBOARD_WORKERS"]),
+        "--worker-class", "gthread",
+        "--threads", str(config.get("DASHBOARD_THREADS", 16)),
+        "--bind", f"{config['HOST']}:{config['PORT']}",
+        app,
+    ]
+    process = subprocess.Popen(command)
+    try:
+        return process.wait()
+    finally:
+        if process.poll() is None:
+            process.terminate()
+            process.wait()
@@ -0,0 +1,322 @@
+from abc import ABC, abstractmethod
+
+import numpy
+import pandas
+
+from pyweblogalyzer.dataset.weblogdata import WebLogData
+
+# Number of groups counted by the approximate aggregates, per group displayed
+APPROXIMATE_COUNTERS_FACTOR = 10
+
+
+class Aggregate(ABC):
+    """Base class for aggregates maintained by the dataset.
+
+    The dataset calls update() with a dataframe of each batch of logs added, so that the aggregate is updated
+    incrementally, the cost being proportional to the batch size and the number of groups, and not the total
+    number of logs. result() returns the aggregated table, computed again only after an update.
+    When the oldest logs are evicted from the dataset, evict() is called with a dataframe of the evicted logs, and
+    reset() is called when all the logs are replaced.
+    """
+
+    def __init__(self):
+        self._result = None
+
+    def update(self, batch):
+        self._update(batch)
+        self._result = None
+
+    def evict(self, batch):
+        self._evict(batch)
+        self._result = None
+
+    def reset(self):
+        self._reset()
+        self._result = None
+
+    def result(self):
+        if self._result is None:
+            self._result = self._compute_result()
+        # Shallow copy, so that callers adding columns don't alter the cached result
+        return self._result.copy(deep=False)
+
+    @abstractmethod
+    def _update(self, batch):
+        pass
+
+    @abstractmethod
+    def _evict(self, batch):
+        pass
+
+    @abstractmethod
+    def _reset(self):
+        pass
+
+    @abstractmethod
+    def _compute_result(self):
+        pass
+
+
+def _select(batch, display_cols, allow_empty):
+    """Keep the displayed columns, and remove the rows with missing values unless allowed."""
+    batch = batch[display_cols]
+    if not allow_empty:
+        batch = batch.dropna()
+    return batch
+
+
+class GroupCounts:
+    """Counts of logs per unique values of groupby_cols, with the displayed values of the first log of each group.
+
+    Each group has an id, indexing the arrays of counts and displayed values, which grow by doubling their size.
+    Batches are grouped on their own codes, and only their distinct groups are looked up by value, so that adding or
+    removing a batch costs the batch size and not the number of groups. The store codes of the categories are not
+    used, as they change when logs are evicted and differ between snapshots. Rows with a missing group value are
+    not counted, and with allow_empty False, neither are rows with a missing displayed value.
+    """
+
+    def __init__(self, display_cols, groupby_cols, allow_empty=False):
+        self._display_cols = display_cols
+        self._groupby_cols = groupby_cols
+        self._allow_empty = allow_empty
+        self.clear()
+
+    def clear(self):
+        self._ids = {}
+        self._size = 0
+        self.counts = numpy.zeros(0, dtype=numpy.int64)
+        self._values = {col: numpy.empty(0, dtype=object) for col in self._display_cols}
+
+    def __len__(self):
+        """Number of groups ids, including the groups with no remaining logs until compact() is called."""
+        return self._size
+
+    def _distinct(self, batch):
+        """Return the distinct groups of a batch: their keys, the position of their first row, and their rows count."""
+        valid = numpy.ones(len(batch), dtype=bool)
+        if not self._allow_empty:
+            for col in self._display_cols:
+                valid &= batch[col].notna().to_numpy()
+        codes = None
+        columns = []
+        for col in self._groupby_cols:
+            col_codes, col_uniques = pandas.factorize(batch[col])
+            valid &= col_codes >= 0
+            # Codes of the combined values, factorized again to stay below the batch size
+            codes = col_codes if codes is None else pandas.factorize(codes * len(col_uniques) + col_codes)[0]
+            columns.append((col_codes, numpy.asarray(col_uniques, dtype=object)))
+        rows = numpy.flatnonzero(valid)
+        _, first, counts = numpy.unique(codes[rows], return_index=True, return_counts=True)
+        positions = rows[first]
+        keys = list(zip(*[uniques[col_codes[positions]].tolist() for col_codes, uniques in columns]))
+        return keys, positions, counts
+
+    def _reserve(self, size):
+        if size <= len(self.counts):
+            return
+        capacity = max(size, 2 * len(self.counts), 1024)
+        counts = numpy.zeros(capacity, dtype=numpy.int64)
+        counts[:self._size] = self.counts[:self._size]
+        self.counts = counts
+        for col, values in self._values.items():
+            self._values[col] = numpy.empty(capacity, dtype=object)
+            self._values[col][:self._size] = values[:self._size]
+
+    def add(self, batch):
+        keys, positions, counts = self._distinct(batch)
+        if not keys:
+            return
+        self._reserve(self._size + len(keys))
+        ids = numpy.fromiter((self._ids.setdefault(key, len(self._ids)) for key in keys), numpy.int64, len(keys))
+        self._size = len(self._ids)
+        # Groups with no remaining logs get the values of their new first log
+        new = self.counts[ids] == 0
+        if new.any():
+            for col, values in self._values.items():
+                values[ids[new]] = batch[col].take(positions[new]).to_numpy(dtype=object)
+        self.counts[ids] += counts
+
+    def remove(self, batch):
+        """Subtract the logs of a batch from the counts of their groups, counts staying positive."""
+        keys, _, counts = self._distinct(batch)
+        ids = numpy.fromiter((self._ids.get(key, -1) for key in keys), numpy.int64, len(keys))
+        known = ids >= 0
+        ids = ids[known]
+        self.counts[ids] = numpy.maximum(self.counts[ids] - counts[known], 0)
+
+    def compact(self):
+        """Remove the groups with no remaining logs."""
+        kept = numpy.flatnonzero(self.counts[:self._size] > 0)
+        if len(kept) == self._size:
+            return
+        keys = list(self._ids)
+        self._ids = {keys[group_id]: new_id for new_id, group_id in enumerate(kept.tolist())}
+        self.counts = self.counts[kept]
+        self._values = {col: values[kept] for col, values in self._values.items()}
+        self._size = len(kept)
+
+    def frame(self, count_title):
+        """Return the displayed values and the count of each group with logs, by decreasing counts."""
+        present = numpy.flatnonzero(self.counts[:self._size] > 0)
+        tabledata = pandas.DataFrame({col: values[present] for col, values in self._values.items()}).infer_objects()
+        tabledata[count_title] = self.counts[present]
+        return tabledata.sort_values(by=count_title, ascending=False, ignore_index=True)
+
+
+class GroupCountAggregate(Aggregate):
+    """Count of logs per unique values of groupby_cols, other displayed columns having the first log values."""
+
+    def __init__(self, display_cols, groupby_cols, count_title, allow_empty=False):
+        super().__init__()
+        self._display_cols = display_cols
+        self._count_title = count_title
+        self._groups = GroupCounts(display_cols, groupby_cols, allow_empty)
+
+    def _update(self, batch):
+        self._groups.add(batch)
+
+    def _evict(self, batch):
+        self._groups.remove(batch)
+        # Groups with no remaining logs are removed, once they are most of the groups
+        if numpy.count_nonzero(self._groups.counts[:len(self._groups)]) < len(self._groups) / 2:
+            self._groups.compact()
+
+    def _reset(self):
+        self._groups.clear()
+
+    def _compute_result(self):
+        if not len(self._groups):
+            return pandas.DataFrame(columns=self._display_cols + [self._count_title])
+        return self._groups.frame(self._count_title)
+
+
+class TopCountAggregate(Aggregate):
+    """Approximate count of logs per unique values of groupby_cols, for the most frequent groups only.
+
+    Counts are kept for at most `counters` groups (Misra-Gries summary), so that the memory and the cost of an update
+    don't depend on the number of distinct groups. Each batch counts are added, and if there are too many groups, the
+    count of the (counters + 1)th largest group is subtracted from all and the groups left with no count are dropped.
+    Counts are lower bounds of the actual counts, which are at most error higher. A group with more than
+    1 / (counters + 1) of the logs is always counted.
+    """
+
+    def __init__(self, display_cols, groupby_cols, count_title, counters, error_title=None, allow_empty=False):
+        super().__init__()
+        self._display_cols = display_cols
+        self._count_title = count_title
+        self._counters = counters
+        self._error_title = error_title
+        self._groups = GroupCounts(display_cols, groupby_cols, allow_empty)
+        self._error = 0
+
+    @property
+    def error(self):
+        """Max difference between the counts and the actual counts of logs."""
+        return self._error
+
+    def _update(self, batch):
+        self._groups.add(batch)
+        counts = self._groups.counts[:len(self._groups)]
+        if len(counts) > self._counters:
+            threshold = int(numpy.partition(counts, len(counts) - self._counters - 1)[len(counts) - self._counters - 1])
+            counts -= threshold
+            numpy.maximum(counts, 0, out=counts)
+            self._error += threshold
+            self._groups.compact()
+
+    def _evict(self, batch):
+        # Counts are still lower bounds once the evicted logs are subtracted, the error being unchanged
+        self._groups.remove(batch)
+        self._groups.compact()
+
+    def _reset(self):
+        self._groups.clear()
+        self._error = 0
+
+    def _compute_result(self):
+        columns = self._display_cols + [self._count_title] + ([self._error_title] if self._error_title else [])
+        if not len(self._groups):
+            return pandas.DataFrame(columns=columns)
+        tabledata = self._groups.frame(self._count_title)
+        if self._error_title:
+            tabledata[self._error_title] = self._error
+        return tabledata[columns]
+
+
+class TimeGroupAggregate(Aggregate):
+    """Count of logs per time period, and sum of the numeric displayed columns.
+
+    With rollup, the periods sums of the evicted logs are kept, so that the history is still displayed once the
+    logs are no longer in the dataset.
+    """
+
+    def __init__(self, display_cols, time_group, time_title, allow_empty=False, rollup=True):
+        super().__init__()
+        self._display_cols = display_cols
+        self._time_group = time_group
+        self._time_title = time_title
+        self._allow_empty = allow_empty
+        self._rollup = rollup
+        self._sums = None
+
+    @staticmethod
+    def group_by_period(tabledata, time_group, time_title):
+        """Count rows and sum up numeric columns by time period. The timestamp column is set to the period start."""
+        # Create a column with a unit to be summed up by period, and set the ts col to 1 to avoid it being removed
+        tabledata = tabledata.assign(**{time_title: 1, 'timestamp': 1})
+        # Periods are aligned on the epoch, for the periods of different batches to match
+        tabledata = tabledata.groupby(pandas.Grouper(freq=time_group, origin="epoch")).sum(numeric_only=True)
+        return tabledata
+
+    def _update(self, batch):
+        batch = _select(batch, self._display_cols, self._allow_empty)
+        if batch.empty:
+            return
+        sums = self.group_by_period(batch, self._time_group, self._time_title)
+        if self._sums is None:
+            self._sums = sums
+        else:
+            self._sums = self._sums.add(sums, fill_value=0).astype(sums.dtypes.to_dict())
+
+    def _evict(self, batch):
+        batch = _select(batch, self._display_cols, self._allow_empty)
+        if self._rollup or batch.empty or self._sums is None:
+            return
+        sums = self.group_by_period(batch, self._time_group, self._time_title)
+        sums = self._sums.sub(sums, fill_value=0).astype(self._sums.dtypes.to_dict())
+        # Remove the leading periods with no remaining logs
+        remaining = sums[self._time_title].to_numpy().nonzero()[0]
+        self._sums = sums.iloc[remaining[0]:] if len(remaining) else None
+
+    def _reset(self):
+        self._sums = None
+
+    def _compute_result(self):
+        if self._sums is None:
+            return pandas.DataFrame(columns=self._display_cols + [self._time_title])
+        # Group again to add the empty periods between batches
+        tabledata = self._sums.groupby(pandas.Grouper(freq=self._time_group, origin="epoch")).sum()
+        # Update the timestamp column with a string version of the period time
+        tabledata['timestamp'] = tabledata.index.strftime(WebLogData.DASHBOARD_TIMESTAMP_EXPORT_FORMAT)
+        return tabledata
+
+
+def build_aggregate(display_cols, groupby_cols=None, count_title=None, time_group=None, time_title=None,
+                    allow_empty=False, rollup=True, top_n=None, approximate=False, error_title=None):
+    """Build the aggregate computing a dashboard table, or None if it can't be maintained incrementally.
+
+    With rollup, time aggregates keep counting the logs evicted from the dataset. With approximate and top_n, groups
+    are only counted for the top_n * APPROXIMATE_COUNTERS_FACTOR most frequent ones, with the counts max error in
+    the error_title column if specified.
+    """
+    if not display_cols:
+        return None
+    if groupby_cols and not time_group:
+        if approximate and top_n:
+            return TopCountAggregate(
+                display_cols, groupby_cols, count_title, top_n * APPROXIMATE_COUNTERS_FACTOR, error_title, allow_empty
+            )
+        return GroupCountAggregate(display_cols, groupby_cols, count_title, allow_empty)
+    if time_group and not groupby_cols:
+        return TimeGroupAggregate(display_cols, time_group, time_title, allow_empty, rollup)
+    return None
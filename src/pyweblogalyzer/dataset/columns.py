@@ -0,0 +1,430 @@
+import copy
+import json
+import os
+
+import numpy
+import pandas
+
+KIND_DATETIME = "datetime"
+KIND_INT = "int"
+KIND_FLOAT = "float"
+KIND_CATEGORY = "category"
+
+# Numpy type used to store each kind of column. Datetimes are stored as UTC nanoseconds since epoch,
+# and categories as the code of the value in the column categories
+KIND_DTYPES = {
+    KIND_DATETIME: numpy.int64,
+    KIND_INT: numpy.int64,
+    KIND_FLOAT: numpy.float64,
+    KIND_CATEGORY: numpy.int32,
+}
+
+# Description of the columns of a saved store, their data being saved in a numpy file per column
+COLUMNS_FILE = "columns.json"
+
+# Value used to fill rows of a column missing from an appended batch
+KIND_MISSING = {
+    KIND_DATETIME: numpy.iinfo(numpy.int64).min,  # NaT
+    KIND_INT: 0,
+    KIND_FLOAT: numpy.nan,
+    KIND_CATEGORY: -1,
+}
+
+
+class Categories:
+    """Dictionary encoding of a column: each distinct value is stored once, rows only hold its integer code."""
+
+    def __init__(self):
+        self._codes = {}
+        self._values = []
+        self._index = None
+
+    def __len__(self):
+        return len(self._values)
+
+    @classmethod
+    def from_values(cls, values):
+        categories = cls()
+        categories._values = list(values)
+        categories._codes = {value: code for code, value in enumerate(categories._values)}
+        return categories
+
+    @property
+    def values(self):
+        return self._values
+
+    def copy(self):
+        categories = Categories()
+        categories._values = self._values.copy()
+        categories._codes = self._codes.copy()
+        return categories
+
+    def encode(self, values):
+        """Return the codes of the values, adding the unknown ones to the categories. None is encoded as -1."""
+        codes, uniques = pandas.factorize(numpy.asarray(values, dtype=object))
+        # Map each batch local code to its global code, the last item maps the missing values code -1 to itself
+        mapping = numpy.empty(len(uniques) + 1, dtype=numpy.int32)
+        for local_code, value in enumerate(uniques):
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self._values)
+                self._values.append(value)
+            mapping[local_code] = code
+        mapping[-1] = -1
+        return mapping[codes]
+
+    def code(self, value):
+        """Return the code of a value, or None if it is not in the categories."""
+        return self._codes.get(value)
+
+    def index(self):
+        """Return the categories as an index, rebuilt only when new values were added."""
+        if self._index is None or len(self._index) != len(self._values):
+            self._index = pandas.Index(self._values)
+        return self._index
+
+
+class Column:
+    """Typed column array, with a capacity allowing to append rows in place."""
+
+    def __init__(self, kind, capacity):
+        self.kind = kind
+        self.categories = Categories() if kind == KIND_CATEGORY else None
+        self.data = numpy.full(capacity, KIND_MISSING[kind], dtype=KIND_DTYPES[kind])
+
+    @classmethod
+    def from_data(cls, kind, data, categories=None):
+        """Build a column on an existing array, which is only read: rows are appended after moving them."""
+        column = cls(kind, 0)
+        column.data = data
+        if categories is not None:
+            column.categories = categories
+        return column
+
+    def view(self, size):
+        """Return a column with the first size rows, sharing the memory of this column."""
+        return Column.from_data(self.kind, self.data[:size], self.categories.copy() if self.categories else None)
+
+    def resize(self, capacity, size):
+        """Move the first size rows to a new array, previous arrays are left untouched for current readers."""
+        data = numpy.full(capacity, KIND_MISSING[self.kind], dtype=KIND_DTYPES[self.kind])
+        data[:size] = self.data[:size]
+        self.data = data
+
+    def rows(self, start, end):
+        """Return the data of the rows between start and end, and the categories only used by these rows, their
+        codes being remapped to the returned categories."""
+        codes = self.data[start:end]
+        if self.categories is None:
+            return codes, None
+        used = numpy.unique(codes[codes >= 0])
+        # Map the used codes to their new codes, the last item maps the missing values code -1 to itself
+        mapping = numpy.full(len(self.categories) + 1, -1, dtype=numpy.int32)
+        mapping[used] = numpy.arange(len(used), dtype=numpy.int32)
+        return mapping[codes], Categories.from_values([self.categories.values[code] for code in used])
+
+    def drop(self, nrows, capacity, size):
+        """Remove the first nrows of the size rows, moving the others to a new array. Categories only used by the
+        removed rows are removed as well."""
+        data = numpy.full(capacity, KIND_MISSING[self.kind], dtype=KIND_DTYPES[self.kind])
+        codes, categories = self.rows(nrows, size)
+        if categories is not None:
+            self.categories = categories
+        data[:size - nrows] = codes
+        self.data = data
+
+    def write(self, pos, values):
+        """Write the values starting at the specified row. Categories values can be a pandas Categorical, only its
+        categories being encoded."""
+        if self.kind == KIND_CATEGORY and isinstance(values, pandas.Categorical):
+            # The last item maps the missing values code -1 to itself
+            mapping = numpy.append(self.categories.encode(values.categories), numpy.int32(-1))
+            encoded = mapping[values.codes]
+        elif self.kind == KIND_CATEGORY:
+            encoded = self.categories.encode(values)
+        elif self.kind == KIND_DATETIME:
+            encoded = numpy.asarray(values, dtype=numpy.int64)
+        else:
+            encoded = numpy.asarray(values)
+            if self.kind == KIND_INT and encoded.dtype.kind not in "iub":
+                # Integers columns with missing or decimal values are turned into float columns
+                self.kind = KIND_FLOAT
+                self.data = self.data.astype(numpy.float64)
+                encoded = numpy.asarray(values, dtype=numpy.float64)
+        self.data[pos:pos + len(encoded)] = encoded
+
+    def to_pandas(self, start, end):
+        """Return the rows as a pandas array, sharing the column memory when possible."""
+        return self._to_pandas(self.data[start:end])
+
+    def take(self, positions):
+        """Return the rows at the positions as a pandas array."""
+        return self._to_pandas(self.data[positions])
+
+    def _to_pandas(self, values):
+        if self.kind == KIND_CATEGORY:
+            return pandas.Categorical.from_codes(values, categories=self.categories.index(), validate=False)
+        if self.kind == KIND_DATETIME:
+            return pandas.DatetimeIndex(values.view("M8[ns]")).tz_localize("UTC")
+        return values
+
+
+class ValueIndex:
+    """Positions of the rows of each value of a column, to select the rows of a value without scanning the column.
+
+    The index is updated when queried: the positions of the rows are sorted by value, and the rows of a value found
+    by binary search. Rows appended since the merge of the others are sorted apart, and merged with them once they
+    are a fraction of them, so that queries following small appends don't sort all the rows again.
+    """
+
+    MERGE_FRACTION = 4
+
+    def __init__(self):
+        self._size = 0
+        # Sorted values and positions of their rows, for the merged rows and the ones appended after them
+        self._merged = self._recent = self._empty()
+
+    @staticmethod
+    def _empty():
+        return numpy.empty(0, dtype=numpy.int32), numpy.empty(0, dtype=numpy.int64)
+
+    @staticmethod
+    def _sort(values, positions):
+        # Stable sort, the positions of each value staying in rows order
+        order = numpy.argsort(values, kind="stable")
+        return values[order], positions[order]
+
+    def _update(self, values):
+        """Add the rows appended since the last update, values being the values of all the rows of the column."""
+        if len(values) == self._size:
+            return
+        self._recent = self._sort(
+            numpy.concatenate([self._recent[0], values[self._size:]]),
+            numpy.concatenate([self._recent[1], numpy.arange(self._size, len(values))]),
+        )
+        self._size = len(values)
+        if len(self._recent[0]) * self.MERGE_FRACTION > len(self._merged[0]):
+            self._merged = self._sort(*(numpy.concatenate(part) for part in zip(self._merged, self._recent)))
+            self._recent = self._empty()
+
+    def get(self, values, value):
+        """Return the positions of the rows with the value, in rows order. Values are the values of all the rows of
+        the column, which are only read."""
+        self._update(values)
+        parts = []
+        for sorted_values, positions in (self._merged, self._recent):
+            first = numpy.searchsorted(sorted_values, value, side="left")
+            last = numpy.searchsorted(sorted_values, value, side="right")
+            parts.append(positions[first:last])
+        return numpy.concatenate(parts)
+
+
+class BlockIndex:
+    """Min and max values of the index column per block of rows.
+
+    Rows are not sorted, but mostly in order, so the running max of the blocks max values and the reversed running
+    min of their min values are sorted, and binary searched to find the rows containing a range of values.
+    """
+
+    BLOCK_ROWS = 4096
+
+    def __init__(self):
+        self._min = numpy.empty(0, dtype=numpy.int64)
+        self._max = numpy.empty(0, dtype=numpy.int64)
+        self._bounds = None
+
+    def update(self, values, start):
+        """Update the blocks from the one containing the start row, values being the index values of all rows."""
+        first = start // self.BLOCK_ROWS
+        values = values[first * self.BLOCK_ROWS:]
+        offsets = numpy.arange(0, len(values), self.BLOCK_ROWS)
+        # Arrays are replaced and not modified, so that copies of the index are not altered
+        if len(values):
+            self._min = numpy.concatenate([self._min[:first], numpy.minimum.reduceat(values, offsets)])
+            self._max = numpy.concatenate([self._max[:first], numpy.maximum.reduceat(values, offsets)])
+        else:
+            self._min = self._min[:first]
+            self._max = self._max[:first]
+        self._bounds = None
+
+    def rows(self, size, min_value=None, max_value=None):
+        """Return the (start, end) range of rows containing all the rows with values between min_value and
+        max_value included. The range can also contain rows out of bounds, to be filtered.
+        """
+        if self._bounds is None:
+            self._bounds = numpy.maximum.accumulate(self._max), numpy.minimum.accumulate(self._min[::-1])[::-1]
+        running_max, reversed_running_min = self._bounds
+        start = 0 if min_value is None else int(numpy.searchsorted(running_max, min_value, "left")) * self.BLOCK_ROWS
+        end = size if max_value is None else int(
+            numpy.searchsorted(reversed_running_min, max_value, "right")
+        ) * self.BLOCK_ROWS
+        start = min(start, size)
+        return start, max(start, min(end, size))
+
+
+class ColumnStore:
+    """Append-only columnar storage.
+
+    Each column is a typed numpy array, strings and auxiliary values being dictionary encoded as categories.
+    Arrays are allocated by chunks of CHUNK_ROWS rows, and new rows are written in place after the existing ones,
+    which are never modified. Reading the store returns a dataframe built on views of the arrays, with no copy nor
+    conversion of the stored rows. When the capacity is exceeded, or the oldest rows are evicted, rows are moved to
+    new arrays, dataframes previously returned keep using the old ones.
+    Rows are kept in the order they were added.
+    Stores can be saved in a folder, and loaded back with the arrays memory mapped from the saved files.
+    """
+
+    CHUNK_ROWS = 65536
+
+    def __init__(self, kinds, index_col="timestamp", default_kind=KIND_CATEGORY):
+        self._kinds = kinds
+        self._default_kind = default_kind
+        self._index_col = index_col
+        self._columns = {}
+        self._capacity = 0
+        self._size = 0
+        self._blocks = BlockIndex()
+        self._indexes = {}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def columns(self):
+        return list(self._columns.keys())
+
+    def _reserve(self, nrows):
+        """Make sure there is room to append nrows, growing the arrays by whole chunks."""
+        required = self._size + nrows
+        if required > self._capacity:
+            capacity = max(required, 2 * self._capacity)
+            self._capacity = -(-capacity // self.CHUNK_ROWS) * self.CHUNK_ROWS
+            for column in self._columns.values():
+                column.resize(self._capacity, self._size)
+
+    def append(self, batch):
+        """Append a batch of rows, specified as a dict of columns name and values.
+
+        The index column values are nanoseconds timestamps. Columns missing from the batch are filled with missing
+        values, and new columns are added to the store, with missing values for the previous rows.
+        """
+        nrows = len(batch[self._index_col])
+        if not nrows:
+            return
+        self._reserve(nrows)
+        for name in batch:
+            if name not in self._columns:
+                self._columns[name] = Column(self._kinds.get(name, self._default_kind), self._capacity)
+        for name, column in self._columns.items():
+            if name in batch:
+                column.write(self._size, batch[name])
+        self._size += nrows
+        self._blocks.update(self._columns[self._index_col].data[:self._size], self._size - nrows)
+
+    def expired_rows(self, min_timestamp=None, max_rows=None):
+        """Return the number of oldest rows to evict to keep at most max_rows, and no rows older than min_timestamp.
+
+        To limit the moves of the remaining rows, old rows are evicted by whole chunks of CHUNK_ROWS rows all older
+        than min_timestamp (in nanoseconds), and rows exceeding max_rows once they are at least a chunk.
+        """
+        count = 0
+        if min_timestamp is not None:
+            index = self._columns[self._index_col].data if self._size else None
+            while count < self._size and index[count:min(count + self.CHUNK_ROWS, self._size)].max() < min_timestamp:
+                count += self.CHUNK_ROWS
+            count = min(count, self._size)
+        if max_rows is not None and self._size - count - max_rows >= min(self.CHUNK_ROWS, max(max_rows, 1)):
+            count = self._size - max_rows
+        return count
+
+    def drop(self, nrows):
+        """Evict the first nrows. The remaining rows are moved to new arrays, and the store keeps its capacity."""
+        nrows = min(nrows, self._size)
+        if not nrows:
+            return
+        for column in self._columns.values():
+            column.drop(nrows, self._capacity, self._size)
+        self._size -= nrows
+        self._blocks = BlockIndex()
+        self._blocks.update(self._columns[self._index_col].data[:self._size], 0)
+        self._indexes = {name: ValueIndex() for name in self._indexes}
+
+    def copy(self):
+        """Return a store with the current rows, sharing their memory, which is left unchanged by later appends."""
+        store = ColumnStore(self._kinds, self._index_col, self._default_kind)
+        store._columns = {name: column.view(self._size) for name, column in self._columns.items()}
+        store._capacity = store._size = self._size
+        store._blocks = copy.copy(self._blocks)
+        return store
+
+    def save(self, path, start=0, end=None):
+        """Save the rows between start and end in the path folder, as a numpy file per column. Categories columns
+        are saved with the categories of the saved rows only."""
+        end = self._size if end is None else end
+        columns = []
+        for idx, (name, column) in enumerate(self._columns.items()):
+            data, categories = column.rows(start, end)
+            numpy.save(os.path.join(path, f"column_{idx}.npy"), data)
+            columns.append({
+                "name": name,
+                "kind": column.kind,
+                "categories": categories.values if categories is not None else None,
+            })
+        with open(os.path.join(path, COLUMNS_FILE), "w") as file:
+            json.dump({"size": end - start, "index_col": self._index_col, "columns": columns}, file)
+
+    @classmethod
+    def load(cls, path, kinds, default_kind=KIND_CATEGORY):
+        """Load a store saved in the path folder. The saved arrays are memory mapped until new rows are appended."""
+        with open(os.path.join(path, COLUMNS_FILE)) as file:
+            saved = json.load(file)
+        store = cls(kinds, saved["index_col"], default_kind)
+        if saved["size"]:
+            for idx, column in enumerate(saved["columns"]):
+                data = numpy.load(os.path.join(path, f"column_{idx}.npy"), mmap_mode="r")
+                categories = Categories.from_values(column["categories"]) if column["categories"] is not None else None
+                store._columns[column["name"]] = Column.from_data(column["kind"], data, categories)
+            store._capacity = store._size = saved["size"]
+            store._blocks.update(store._columns[store._index_col].data, 0)
+        return store
+
+    def rows(self, start=0):
+        """Return the rows from the start position as a columns batch, to append them to another store. Categories
+        columns are returned as pandas Categorical sharing the codes of the store."""
+        return {
+            name: column.to_pandas(start, self._size) if column.kind == KIND_CATEGORY else column.data[start:self._size]
+            for name, column in self._columns.items()
+        }
+
+    def add_index(self, name):
+        """Maintain an index of the rows of each value of a categories or integers column, updated when queried."""
+        if name in self._indexes or self._kinds.get(name, self._default_kind) not in (KIND_CATEGORY, KIND_INT):
+            return
+        self._indexes[name] = ValueIndex()
+
+    def rows_with(self, name, value):
+        """Return the positions of the rows with the value in the column, or None if the column is not indexed."""
+        index = self._indexes.get(name)
+        column = self._columns.get(name)
+        if index is None or column is None:
+            return None
+        key = column.categories.code(value) if column.categories is not None else value
+        if key is None:
+            return numpy.empty(0, dtype=numpy.int64)
+        return index.get(column.data[:self._size], key)
+
+    def take(self, positions):
+        """Return a dataframe of the rows at the positions, indexed by the index column."""
+        data = {name: column.take(positions) for name, column in self._columns.items()}
+        return pandas.DataFrame(data, index=data[self._index_col], copy=False)
+
+    def rows_range(self, min_value=None, max_value=None):
+        """Return the (start, end) range of rows containing the rows with index values between min_value and
+        max_value, see BlockIndex.rows()."""
+        return self._blocks.rows(self._size, min_value, max_value)
+
+    def frame(self, start=0, end=None):
+        """Return a dataframe of the rows between start and end, indexed by the index column."""
+        end = self._size if end is None else end
+        data = {name: column.to_pandas(start, end) for name, column in self._columns.items()}
+        return pandas.DataFrame(data, index=data[self._index_col], copy=False)
@@ -1,44 +1,413 @@
+import json
 import logging
-from pandas import DataFrame, DatetimeIndex
-from pyweblogalyzer.dataset.weblogdata import WebLogData
-from threading import Lock
-from datetime import timezone
-import pandas
+import os
+import shutil
+import time
+import numpy
+from pandas import DataFrame, DatetimeIndex, Timestamp
+from pyweblogalyzer.dataset.columns import ColumnStore
+from pyweblogalyzer.dataset.weblogdata import LOG_INFOS_KINDS, WebLogData, logs_to_batch
+from threading import Condition, Lock
+
+
+def _in_time_range(df, start, end):
+    """Keep the logs between the start and end datetimes (included), if specified."""
+    if start is None and end is None:
+        return df
+    timestamps = df.index.asi8
+    mask = numpy.ones(len(df), dtype=bool)
+    if start is not None:
+        mask &= timestamps >= Timestamp(start).value
+    if end is not None:
+        mask &= timestamps <= Timestamp(end).value
+    return df[mask]
+
 
 class WebLogDataSet:
     # Max waait time for getting a lock is 60s
     LOCK_TIMEOUT = 60.0
+    # Number of logs added before they are written to the columns
+    FLUSH_ROWS = 10000
+    # File of a snapshot with the dataset state, its segments of logs and the collector state (e.g. positions in the
+    # log files), replaced atomically once the segments are saved
+    SNAPSHOT_DATASET_FILE = "dataset.json"
 
     def __init__(self):
-        self._fields = []
-        self._data = []
-        self._index = []
+        self._store = ColumnStore(LOG_INFOS_KINDS)
+        self._pending = []
+        self._pending_lock = Lock()
+        self._frame = None
+        self._aggregates = {}
+        self._indexes = set()
+        self._generation = 0
+        # Unique id of the dataset history, kept in the snapshots so that generations are only compared in a history
+        self._origin = f"{time.time_ns():x}"
+        # Number of logs evicted since the origin
+        self._evicted = 0
+        # Segments of the last snapshot saved or loaded, continued by the next snapshot
+        self._snapshot_segments = []
+        # Notified when the generation changes
+        self._generation_changed = Condition()
         self._dataset_lock = Lock()
         self.log = logging.getLogger(__name__)
         self._empty_df = self._build_empty_dataset()
 
+    def __len__(self):
+        return len(self._store) + len(self._pending)
+
     def _build_empty_dataset(self):
         elt = WebLogData()
         fields, values = elt.to_arrays()
         return DataFrame([values], columns=fields, index=DatetimeIndex([elt.timestamp]))
 
+    def _take_pending(self):
+        """Return the pending logs, and start a new list."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        return pending
+
     def add(self, log_data):
-        fields, values = log_data.to_arrays()
-        self._data.append(values)
-        self._index.append(log_data.timestamp)
+        """Add a log. Logs are buffered and written to the dataset by batches, or when the dataset is read."""
+        with self._pending_lock:
+            self._pending.append(log_data)
+            full = len(self._pending) >= self.FLUSH_ROWS
+        if full:
+            # Convert the logs before locking the dataset
+            pending = self._take_pending()
+            if pending:
+                self.add_batch(logs_to_batch(pending))
+
+    def add_many(self, logs):
+        """Add a list of logs, converted to a columns batch before locking the dataset."""
+        if logs:
+            self.add_batch(logs_to_batch(logs))
+
+    def _flush(self):
+        """Write the pending logs to the columns store. The dataset must be locked."""
+        pending = self._take_pending()
+        if pending:
+            self._append(logs_to_batch(pending))
+
+    def add_batch(self, batch):
+        """Add a columns batch of logs, as a dict of fields names and their list of values.
+
+        The dataset is only locked while the batch is written, readers see either all or none of its logs.
+        """
+        if self.lock():
+            try:
+                self._flush()
+                self._append(batch)
+            finally:
+                self.unlock()
+
+    def _append(self, batch):
+        """Write a columns batch to the store, and update the aggregates."""
+        start = len(self._store)
+        self._store.append(batch)
+        if len(self._store) == start:
+            return
+        self._frame = None
+        self._new_generation()
+
+        # Update the aggregates with the new logs only
+        if self._aggregates:
+            new_logs = self._store.frame(start)
+            for aggregate in self._aggregates.values():
+                aggregate.update(new_logs)
+
+    def evict(self, min_timestamp=None, max_rows=None):
+        """Evict the oldest logs to keep at most max_rows logs, and no logs older than the min_timestamp datetime.
+
+        Logs are evicted by chunks, see ColumnStore.expired_rows(). Returns the number of logs evicted.
+        """
+        if not self.lock():
+            return 0
+        try:
+            self._flush()
+            min_ts = Timestamp(min_timestamp).value if min_timestamp is not None else None
+            count = self._store.expired_rows(min_ts, max_rows)
+            if count:
+                evicted = self._store.frame(0, count)
+                self._store.drop(count)
+                self._evicted += count
+                self._frame = None
+                self._new_generation()
+                for aggregate in self._aggregates.values():
+                    aggregate.evict(evicted)
+            return count
+        finally:
+            self.unlock()
+
+    def save_snapshot(self, path, collector_state):
+        """Save the logs in the path folder with the collector state (e.g. positions in the log files).
+
+        Snapshots are append only: logs are saved in segments folders of the rows added since the origin, and the
+        logs added since the previous snapshot in a new segment, merged with the previous segments which are not
+        larger, so that each log is saved a logarithmic number of times. Segments of evicted logs are removed. The
+        dataset is only locked while selecting the logs to save, rows being never modified.
+        """
+        if not self.lock():
+            return
+        try:
+            self._flush()
+            store = self._store.copy()
+            state = {"origin": self._origin, "generation": self._generation, "evicted": self._evicted}
+        finally:
+            self.unlock()
+
+        os.makedirs(path, exist_ok=True)
+        segments = [segment for segment in self._snapshot_segments if segment["end"] > state["evicted"]]
+        start = segments[-1]["end"] if segments else state["evicted"]
+        end = state["evicted"] + len(store)
+        if end > start:
+            while segments and segments[-1]["end"] - segments[-1]["start"] <= end - start:
+                start = segments.pop()["start"]
+            start = max(start, state["evicted"])
+            segment = {"name": f"segment_{state['origin']}_{start}_{end}", "start": start, "end": end}
+            segment_path = os.path.join(path, segment["name"])
+            shutil.rmtree(segment_path, ignore_errors=True)
+            os.makedirs(segment_path)
+            store.save(segment_path, start - state["evicted"], end - state["evicted"])
+            segments.append(segment)
+
+        state.update(segments=segments, collector=collector_state)
+        state_file = os.path.join(path, self.SNAPSHOT_DATASET_FILE)
+        with open(state_file + ".new", "w") as file:
+            json.dump(state, file)
+        os.replace(state_file + ".new", state_file)
+        self._snapshot_segments = segments
+
+        # Remove the previous segments, the processes still loading them retry with the new snapshot
+        names = {segment["name"] for segment in segments} | {self.SNAPSHOT_DATASET_FILE}
+        for name in os.listdir(path):
+            if name not in names:
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    def _read_snapshot(self, path):
+        """Return the dataset state saved in a snapshot, or None if there is no snapshot."""
+        state_file = os.path.join(path, self.SNAPSHOT_DATASET_FILE)
+        if not os.path.isfile(state_file):
+            return None
+        with open(state_file) as file:
+            return json.load(file)
+
+    def _read_segments(self, path, state, start):
+        """Return the segments of a snapshot with the logs from the start row (counted since the origin), as a list
+        of their store, memory mapped, and the position of the first log to read."""
+        return [
+            (ColumnStore.load(os.path.join(path, segment["name"]), LOG_INFOS_KINDS), max(start - segment["start"], 0))
+            for segment in state["segments"]
+            if segment["end"] > start
+        ]
+
+    def _append_segments(self, segments):
+        """Append the logs of snapshot segments to the store, and index them. The dataset must be locked."""
+        for store, start in segments:
+            if not len(self._store) and not start:
+                # Keep the first segment memory mapped until logs are appended
+                self._store = store
+            else:
+                self._store.append(store.rows(start))
+        for column in self._indexes:
+            self._store.add_index(column)
+        self._frame = None
+
+    def load_snapshot(self, path):
+        """Load the logs of a snapshot in an empty dataset.
+
+        Returns the collector state saved with the logs, or an empty dict if there is no snapshot.
+        """
+        state = self._read_snapshot(path)
+        if not state:
+            return {}
+        segments = self._read_segments(path, state, state["evicted"])
+
+        if not self.lock():
+            return {}
+        try:
+            if len(self):
+                self.log.error("Cannot load a snapshot in a dataset already containing logs")
+                return {}
+            self._append_segments(segments)
+            # Continue the saved history, for the generations to keep matching the ones of the snapshots
+            self._origin, self._evicted = state["origin"], state["evicted"]
+            self._snapshot_segments = state["segments"]
+            self._new_generation(state["generation"])
+            if len(self._store):
+                for aggregate in self._aggregates.values():
+                    aggregate.update(self._store.frame())
+        finally:
+            self.unlock()
+        return state["collector"]
+
+    def reload_snapshot(self, path):
+        """Update the logs with the ones of the snapshot in the path folder, if it changed since the last reload.
+
+        Used by the processes serving the dashboards from the snapshots saved by the collector process. Only the logs
+        evicted and added since the previous snapshot are removed and appended, and the aggregates updated with
+        them. Returns True if reloaded.
+        """
+        state = self._read_snapshot(path)
+        if not state or (state["origin"], state["generation"]) == (self._origin, self._generation):
+            return False
+        end = state["segments"][-1]["end"] if state["segments"] else state["evicted"]
+        follows = (
+            state["origin"] == self._origin
+            and self._evicted <= state["evicted"]
+            and self._evicted + len(self._store) <= end
+        )
+        # First log to read from the snapshot, counted since the origin
+        start = max(self._evicted + len(self._store), state["evicted"]) if follows else state["evicted"]
+        segments = self._read_segments(path, state, start)
+        # The snapshot may have been replaced while loading it, and its segments removed
+        if self._read_snapshot(path) != state:
+            return False
+
+        if not self.lock():
+            return False
+        try:
+            if follows:
+                evicted_rows = min(state["evicted"] - self._evicted, len(self._store))
+                if evicted_rows:
+                    evicted = self._store.frame(0, evicted_rows)
+                    self._store.drop(evicted_rows)
+                    for aggregate in self._aggregates.values():
+                        aggregate.evict(evicted)
+            else:
+                # Not a following snapshot, e.g. the collector restarted with no snapshot: aggregate all logs again
+                self._store = ColumnStore(LOG_INFOS_KINDS)
+                for aggregate in self._aggregates.values():
+                    aggregate.reset()
+            kept = len(self._store)
+            self._append_segments(segments)
+            self._origin, self._evicted = state["origin"], state["evicted"]
+            self._new_generation(state["generation"])
+            if len(self._store) > kept:
+                new_logs = self._store.frame(kept)
+                for aggregate in self._aggregates.values():
+                    aggregate.update(new_logs)
+        finally:
+            self.unlock()
+        return True
+
+    def _new_generation(self, generation=None):
+        """Increment the generation, or set it to the specified one, and wake up the threads waiting for new logs.
+        The dataset must be locked."""
+        with self._generation_changed:
+            self._generation = self._generation + 1 if generation is None else generation
+            self._generation_changed.notify_all()
+
+    def wait_generation(self, generation, timeout=None):
+        """Wait until the generation differs from the specified one, or the timeout expires.
+
+        Returns the current generation. Logs buffered by add() are only written, changing the generation, when
+        the buffer is full or the dataset is read.
+        """
+        with self._generation_changed:
+            self._generation_changed.wait_for(lambda: self._generation != generation, timeout)
+        return self.generation
+
+    @property
+    def generation(self):
+        """Counter incremented every time new logs are written to the dataset."""
+        if self.lock():
+            try:
+                self._flush()
+            finally:
+                self.unlock()
+        return self._generation
+
+    @property
+    def origin(self):
+        """Id of the dataset history, generations of datasets with different origins being unrelated."""
+        return self._origin
+
+    def add_aggregate(self, name, aggregate):
+        """Register an aggregate to be maintained as logs are added. Initialized with the logs already present."""
+        if self.lock():
+            try:
+                self._flush()
+                if len(self._store):
+                    aggregate.update(self._store.frame())
+                self._aggregates[name] = aggregate
+            finally:
+                self.unlock()
+
+    def add_index(self, column):
+        """Maintain an index of the logs of each value of a column, to find them without scanning all logs."""
+        if self.lock():
+            try:
+                self._flush()
+                self._indexes.add(column)
+                self._store.add_index(column)
+            finally:
+                self.unlock()
+
+    def find(self, column, value, start=None, end=None):
+        """Return the logs with the value in the column, and between the start and end datetimes if specified.
+
+        Returns None if the column is not indexed, the logs having to be filtered from the full dataframe.
+        """
+        df = None
+        if self.lock():
+            try:
+                self._flush()
+                positions = self._store.rows_with(column, value)
+                if positions is not None:
+                    df = self._store.take(positions)
+            except Exception as e:
+                self.log.exception(f"Error finding logs with {column} {value}: {e}")
+            self.unlock()
+        if df is not None:
+            df = _in_time_range(df, start, end)
+        return df
+
+    def get_aggregate(self, name):
+        """Return the current result of an aggregate, or None if there is no such aggregate."""
+        aggregate = self._aggregates.get(name)
+        if aggregate and self.lock():
+            try:
+                self._flush()
+                return aggregate.result()
+            except Exception as e:
+                self.log.exception(f"Error getting aggregate {name}: {e}")
+            finally:
+                self.unlock()
+        return None
+
+    def get_dataframe(self, start=None, end=None):
+        """Return the logs, or only the logs between the start and end datetimes (included) if specified.
+
+        Only the rows of the blocks which can contain logs of the range are selected and filtered.
+        """
+        if start is None and end is None:
+            return self._get_full_dataframe()
+        min_ts = Timestamp(start).value if start is not None else None
+        max_ts = Timestamp(end).value if end is not None else None
+        df = None
+        if self.lock():
+            try:
+                self._flush()
+                if len(self._store):
+                    df = self._store.frame(*self._store.rows_range(min_ts, max_ts))
+            except Exception as e:
+                self.log.exception(f"Error getting dataframe: {e}")
+            self.unlock()
+        if df is None or df.empty:
+            return self._empty_df
 
-        # Only store the fields of the first log. All other logs are required to have the same ones.
-        if not self._fields:
-            self._fields = fields
+        df = _in_time_range(df, start, end)
+        return df if len(df) else self._empty_df
 
-    def get_dataframe(self):
+    def _get_full_dataframe(self):
         if self.lock():
-            # Creating a new dataframe reordered by date from the dict is the most efficient way,
-            # as updating a df makes panda copying large chunks of data
+            # The dataframe is a view on the stored columns, only built again when new logs have been added
             try:
-                # df = DataFrame(self._data, columns=self._fields, index=DatetimeIndex(self._index, dtype='datetime64[ns, Europe/London]')).sort_index()
-                df = DataFrame(self._data, columns=self._fields, index=DatetimeIndex(pandas.to_datetime(self._index, utc=True))).sort_index()
-                # return DataFrame([values], columns=fields, index=DatetimeIndex()
+                self._flush()
+                if self._frame is None:
+                    self._frame = self._store.frame() if len(self._store) else self._empty_df
+                # Shallow copy, so that callers adding columns don't alter the shared frame
+                df = self._frame.copy(deep=False)
             except Exception as e:
                 self.log.exception(f"Error getting dataframe: {e}")
                 df = self._empty_df
@@ -1,5 +1,7 @@
 from datetime import datetime
 
+import pandas
+
 # Required info fields. Accessible directly as attributes, always created at init.
 LOG_INFOS = [
     "timestamp",
@@ -24,37 +26,87 @@ LOG_INFOS = [
 
 LOG_AUX_INFO_PREFIX = "aux_"
 
+# Storage kind of the info fields in the dataset columns. Fields not listed here (including the auxiliary ones)
+# are strings or arbitrary values, stored as categories.
+LOG_INFOS_KINDS = {
+    "timestamp": "datetime",
+    "request_status": "int",
+    "bytes_sent": "int",
+    "request_time": "float",
+    "lat": "float",
+    "long": "float",
+}
+
+
+# Position of each info field in the log data values
+LOG_INFOS_INDEX = {field: idx for idx, field in enumerate(LOG_INFOS)}
+
 
 class WebLogData:
-    """Log data."""
+    """Log data.
+
+    Required info fields are stored in a list in the LOG_INFOS order, and auxiliary fields in a dict only created
+    when an enricher adds one, to keep the per log allocations low.
+    """
+    __slots__ = ("_values", "_aux")
     DASHBOARD_TIMESTAMP_EXPORT_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
 
     def __init__(self, **kwargs):
         """Initialize log data."""
-        self._data = {}
-        # Initialize all reauired attributes, using args when specified
-        for field in LOG_INFOS:
-            # For timestamps, keep the object, but put the string version in the dict to export to as as
-            # serializable datatable. That sucks but datetime are converted to pandas Timestamp, not serializable
-            if field == "timestamp":
-                self.timestamp = kwargs.get(field, datetime.now())
-                self._data[field] = self.timestamp.strftime(self.DASHBOARD_TIMESTAMP_EXPORT_FORMAT)
-            else:
-                self._data[field] = kwargs.get(field, None)
-            # self._data[field] = kwargs.get(field, None)
+        # Initialize all required attributes, using args when specified
+        values = [kwargs.get(field) for field in LOG_INFOS]
+        if values[0] is None:
+            values[0] = datetime.now()
+        self._values = values
+        self._aux = {field: value for field, value in kwargs.items() if field.startswith(LOG_AUX_INFO_PREFIX)} or None
 
     def __getattr__(self, name):
         # When an attribute is not found try to get it from the log data
-        if name in self._data:
-            return self._data[name]
+        idx = LOG_INFOS_INDEX.get(name)
+        if idx is not None:
+            return self._values[idx]
+        # Private names are the slots, which are not set yet when unpickling
+        if not name.startswith("_") and self._aux and name in self._aux:
+            return self._aux[name]
         raise AttributeError(name)
 
+    def __setattr__(self, name, value):
+        # Info fields can be set as attributes, other attributes are the slots
+        idx = LOG_INFOS_INDEX.get(name)
+        if idx is None:
+            object.__setattr__(self, name, value)
+        else:
+            self._values[idx] = value
+
     def __str__(self):
-        return str(self._data)
+        return str(dict(zip(*self.to_arrays())))
 
     def add_aux_info(self, name, value):
         """Add auxiliary (optional) info to the log data. Prefixed with 'aux_'. to be used by enrichers."""
-        self._data[LOG_AUX_INFO_PREFIX + name] = value
+        if self._aux is None:
+            self._aux = {}
+        self._aux[LOG_AUX_INFO_PREFIX + name] = value
+
+    def aux_infos(self):
+        """Return the auxiliary info, as a dict of fields names (with prefix) and values."""
+        return self._aux or {}
 
     def to_arrays(self):
-        return list(self._data.keys()), list(self._data.values())
+        aux = self.aux_infos()
+        return LOG_INFOS + list(aux.keys()), self._values + list(aux.values())
+
+
+def logs_to_batch(logs):
+    """Convert a list of logs data to a columns batch: a dict of fields names and their list of values.
+
+    Timestamps are converted to UTC nanoseconds since epoch.
+    """
+    batch = dict(zip(LOG_INFOS, map(list, zip(*(log_data._values for log_data in logs))))) if logs else {
+        field: [] for field in LOG_INFOS
+    }
+    # Auxiliary fields of all logs, in order of appearance. Logs are expected to have the same ones.
+    aux_fields = dict.fromkeys(field for log_data in logs if log_data._aux for field in log_data._aux)
+    for field in aux_fields:
+        batch[field] = [log_data._aux.get(field) if log_data._aux else None for log_data in logs]
+    batch["timestamp"] = pandas.to_datetime(batch["timestamp"], utc=True).as_unit("ns").asi8
+    return batch
@@ -0,0 +1,40 @@
+import json
+import os
+import sys
+from argparse import Namespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_dashboard import bench_size  # noqa: E402
+from bench_ingest import run  # noqa: E402
+from common import build_config, compare_results, save_results  # noqa: E402
+from loggen import LogGenerator  # noqa: E402
+from pyweblogalyzer.collector.parser import LogParser  # noqa: E402
+
+
+def test_generated_logs_match_format():
+    config = build_config()
+    log_lines = list(LogGenerator(config, ips=20, urls=10, user_agents=5).lines(500))
+    assert log_lines == list(LogGenerator(config, ips=20, urls=10, user_agents=5).lines(500))
+    batch = LogParser(config).parse_lines(log_lines)
+    assert len(batch["timestamp"]) == 500
+    assert len(set(batch["remote_ip"])) <= 20 and len(set(batch["http_url"])) <= 10
+
+
+def test_ingest_benchmark(tmp_path):
+    args = Namespace(lines=300, ips=10, urls=10, user_agents=5, seed=1, workers=0, repeat=1, config=None)
+    params, results = run(args)
+    assert params["log_bytes"] > 0
+    assert set(results) == {"parse", "collect", "memory", "end_to_end"}
+
+    save_results(tmp_path / "baseline.json", "ingest", params, results)
+    assert json.loads((tmp_path / "baseline.json").read_text())["params"]["lines"] == 300
+    slower = dict(results, parse=dict(results["parse"], value=results["parse"]["value"] / 2))
+    assert compare_results(slower, tmp_path / "baseline.json", 0.1) == ["parse"]
+
+
+def test_dashboard_benchmark():
+    args = Namespace(days=1, ips=50, urls=20, user_agents=5, seed=0, keys=2, repeat=1, no_memory=False, config=None)
+    results = bench_size(2000, args)
+    assert {"2000/dashboard_data", "2000/table/remote_ips", "2000/aggregate/urls", "2000/context/codes"} <= set(results)
+    assert all(result["p95"] >= 0 and result["peak_bytes"] > 0 for result in results.values())
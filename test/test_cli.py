@@ -4,3 +4,21 @@ from pyweblogalyzer import cli
 
 def test_cli():
     cli.main()
+
+
+def test_create_app(tmp_path, monkeypatch):
+    from test_dataset import make_log
+    from pyweblogalyzer import WebLogDataSet
+
+    dataset = WebLogDataSet()
+    dataset.add_many([make_log(0), make_log(10)])
+    dataset.save_snapshot(str(tmp_path / "snapshot"), {})
+    config_file = tmp_path / "config.py"
+    config_file.write_text(f"SNAPSHOT_PATH = {str(tmp_path / 'snapshot')!r}\nSNAPSHOT_RELOAD_SECS = 60\n")
+    monkeypatch.setenv(cli.ENVVAR_CONFIG, str(config_file))
+
+    # Workers serve the logs of the snapshot, with the etags of the collector dataset
+    response = cli.create_app().test_client().get("/data")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'W/"{dataset.origin}-{dataset.generation}"'
+    assert cli.load_config()["SNAPSHOT_RELOAD_SECS"] == 60
@@ -0,0 +1,479 @@
+from datetime import datetime, timedelta, timezone
+from ipaddress import ip_address
+
+from pyweblogalyzer import CollectorApp, WebLogDataSet
+from pyweblogalyzer.config import Config
+from pyweblogalyzer.collector.archives import Archives
+
+LOG_LINE = (
+    '{ip} - - [{time}] "GET {url} HTTP/1.1" {status} {size} "-" example.com '
+    '"Mozilla/5.0 (X11; Linux x86_64; rv:89.0) Gecko/20100101 Firefox/89.0" "0.{ms:03d}" "-"\n'
+)
+
+
+def make_config(log_path, **kwargs):
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update(WEB_LOG_PATH=str(log_path), GEOIP_CITY_DB=None, GEOIP_ASN_DB=None, **kwargs)
+    return config
+
+
+def write_logs(logfile, count, start=0, mode="w"):
+    time = datetime(2021, 6, 1, tzinfo=timezone.utc)
+    with open(logfile, mode) as file:
+        for idx in range(start, start + count):
+            file.write(LOG_LINE.format(
+                ip=f"10.0.{idx % 7}.{idx % 5}",
+                time=(time + timedelta(seconds=idx)).strftime("%d/%b/%Y:%H:%M:%S %z"),
+                url=f"/page/{idx % 11}",
+                status=404 if idx % 10 == 0 else 200,
+                size=idx,
+                ms=idx % 1000,
+            ))
+
+
+def test_parse_log_file(tmp_path):
+    write_logs(tmp_path / "access.log", 50)
+    dataset = WebLogDataSet()
+    collector = CollectorApp(dataset, make_config(tmp_path))
+    collector._parse_log_file(str(tmp_path / "access.log"))
+
+    df = dataset.get_dataframe()
+    assert len(df) == 50
+    assert df["bytes_sent"].sum() == sum(range(50))
+    assert df["browser"].iloc[0] == "Firefox"
+    assert (df["request_status"] == 404).sum() == 5
+
+    # Only new logs are parsed
+    write_logs(tmp_path / "access.log", 10, start=50, mode="a")
+    collector._parse_log_file(str(tmp_path / "access.log"))
+    assert len(dataset.get_dataframe()) == 60
+
+
+def test_parse_log_files_parallel(tmp_path):
+    write_logs(tmp_path / "access.log", 300)
+    write_logs(tmp_path / "other.access.log", 200, start=1000)
+    dataset = WebLogDataSet()
+    collector = CollectorApp(dataset, make_config(tmp_path, COLLECTION_WORKERS=2, COLLECTION_CHUNK_BYTES=4096))
+    try:
+        collector._parse_log_files_parallel(collector._build_file_list())
+        df = dataset.get_dataframe()
+        assert len(df) == 500
+        assert df["bytes_sent"].sum() == sum(range(300)) + sum(range(1000, 1200))
+
+        write_logs(tmp_path / "access.log", 20, start=300, mode="a")
+        collector._parse_log_files_parallel(collector._build_file_list())
+        assert len(dataset.get_dataframe()) == 520
+    finally:
+        collector._pool.shutdown()
+
+
+def test_failed_chunk_parsed_again(tmp_path):
+    write_logs(tmp_path / "access.log", 300)
+    dataset = WebLogDataSet()
+    collector = CollectorApp(dataset, make_config(tmp_path, COLLECTION_WORKERS=2, COLLECTION_CHUNK_BYTES=4096))
+    add_batch = dataset.add_batch
+    calls = []
+
+    def fail_second_chunk(batch):
+        calls.append(1)
+        if len(calls) == 2:
+            raise ValueError("Failed chunk")
+        add_batch(batch)
+
+    try:
+        # Chunks are added in order, the ones after the failed chunk are parsed again in the next pass
+        dataset.add_batch = fail_second_chunk
+        collector._parse_log_files_parallel(collector._build_file_list())
+        first_chunk = len(dataset.get_dataframe())
+        assert 0 < first_chunk < 300 and len(calls) == 2
+        dataset.add_batch = add_batch
+        collector._parse_log_files_parallel(collector._build_file_list())
+        df = dataset.get_dataframe()
+        assert len(df) == 300
+        assert df["bytes_sent"].sum() == sum(range(300))
+    finally:
+        collector._pool.shutdown()
+
+
+def test_parse_file_chunk_by_blocks(tmp_path, monkeypatch):
+    import gzip
+    from pyweblogalyzer.collector import parser
+
+    write_logs(tmp_path / "access.log", 40)
+    with open(tmp_path / "access.log", "rb") as file, gzip.open(tmp_path / "access.log.1.gz", "wb") as archive:
+        data = file.read()
+        # The last line of archives is parsed even with no end of line
+        archive.write(data[:-1])
+    monkeypatch.setattr(parser, "WORKER_READ_BLOCK_BYTES", 100)
+    parser.init_worker(make_config(tmp_path))
+
+    batch, pos, _ = parser.parse_file_chunk(str(tmp_path / "access.log.1.gz"), 0)
+    assert batch["bytes_sent"] == list(range(40)) and pos == len(data) - 1
+    # Chunks of files stop at their end position, and at the last end of line
+    end = data.index(b"\n", 1000) + 5
+    batch, pos, _ = parser.parse_file_chunk(str(tmp_path / "access.log"), 0, end)
+    assert pos == end - 4 and len(batch["bytes_sent"]) == data[:pos].count(b"\n")
+
+
+def poll_lines(follower, paths):
+    """Poll the followed files, returning the lines read as a dict of paths and their list of lines."""
+    new_lines = {str(path): [] for path in paths}
+    for path, log_lines in follower.poll([str(path) for path in paths]):
+        new_lines[path].extend(log_lines)
+    return new_lines
+
+
+def test_follow_log_files(tmp_path):
+    from pyweblogalyzer.collector.follower import LogFollower
+
+    logfile = tmp_path / "access.log"
+    write_logs(logfile, 5)
+    positions = {}
+    follower = LogFollower(positions)
+    assert len(poll_lines(follower, [logfile])[str(logfile)]) == 5
+
+    # A line still being written is only returned when complete
+    with open(logfile, "a") as file:
+        file.write("partial")
+    assert poll_lines(follower, [logfile])[str(logfile)] == []
+    with open(logfile, "a") as file:
+        file.write(" line\n")
+    assert poll_lines(follower, [logfile])[str(logfile)] == ["partial line"]
+    assert positions[str(logfile)] == logfile.stat().st_size
+
+    # Rotated file: the remaining lines are read, then the new file from the start, with no duplicates
+    write_logs(logfile, 2, start=5, mode="a")
+    logfile.rename(tmp_path / "access.log.1")
+    write_logs(logfile, 3, start=7)
+    new_lines = poll_lines(follower, [logfile, tmp_path / "access.log.1"])
+    assert len(new_lines[str(tmp_path / "access.log.1")]) == 2
+    assert len(new_lines[str(logfile)]) == 3
+    follower.close()
+
+
+def test_follow_rotation_chain(tmp_path):
+    from pyweblogalyzer.collector.follower import LogFollower
+
+    paths = [tmp_path / "access.log", tmp_path / "access.log.1", tmp_path / "access.log.2"]
+    write_logs(paths[1], 4)
+    write_logs(paths[0], 3, start=4)
+    positions = {}
+    # Small blocks, so that lines are read over several blocks
+    follower = LogFollower(positions, block_bytes=100)
+    new_lines = poll_lines(follower, paths)
+    assert [len(new_lines[str(path)]) for path in paths] == [3, 4, 0]
+
+    # Rotate the whole chain as logrotate does, each file keeps being followed from its position
+    write_logs(paths[1], 1, start=7, mode="a")
+    write_logs(paths[0], 2, start=8, mode="a")
+    paths[1].rename(paths[2])
+    paths[0].rename(paths[1])
+    write_logs(paths[0], 5, start=10)
+    new_lines = poll_lines(follower, paths)
+    assert [len(new_lines[str(path)]) for path in paths] == [5, 2, 1]
+    assert positions == {str(path): path.stat().st_size for path in paths}
+
+    # Rotate again, the last file being removed
+    paths[2].unlink()
+    paths[1].rename(paths[2])
+    paths[0].rename(paths[1])
+    write_logs(paths[0], 1, start=15)
+    new_lines = poll_lines(follower, paths)
+    assert [len(new_lines[str(path)]) for path in paths] == [1, 0, 0]
+    assert poll_lines(follower, paths) == {str(path): [] for path in paths}
+    follower.close()
+
+
+def test_collector_follow_mode(tmp_path):
+    import time
+
+    write_logs(tmp_path / "access.log", 10)
+    dataset = WebLogDataSet()
+    collector = CollectorApp(dataset, make_config(tmp_path, COLLECTION_MODE="follow", FOLLOW_MAX_WAIT_SECS=0.1))
+    collector.start()
+    try:
+        write_logs(tmp_path / "access.log", 5, start=10, mode="a")
+        deadline = time.time() + 5
+        while len(dataset) < 15 and time.time() < deadline:
+            time.sleep(0.05)
+        assert len(dataset.get_dataframe()) == 15
+    finally:
+        collector.stop()
+        collector.join(timeout=5)
+
+
+def test_dataset_readable_while_parsing(tmp_path):
+    import threading
+
+    write_logs(tmp_path / "access.log", 12)
+    dataset = WebLogDataSet()
+    collector = CollectorApp(dataset, make_config(tmp_path, COLLECTION_BATCH_LINES=5))
+    parsed, resume = threading.Event(), threading.Event()
+    parse_line = collector._parser.parse_line
+
+    def blocking_parse_log_line(log_line):
+        # Block the parsing of the 8th line, after a first batch was added
+        if "/page/7 " in log_line:
+            parsed.set()
+            resume.wait(5)
+        return parse_line(log_line)
+
+    collector._parser.parse_line = blocking_parse_log_line
+    thread = threading.Thread(target=collector._parse_log_file, args=(str(tmp_path / "access.log"),))
+    thread.start()
+    try:
+        assert parsed.wait(5)
+        assert dataset.lock()
+        dataset.unlock()
+        assert len(dataset.get_dataframe()) == 5
+    finally:
+        resume.set()
+        thread.join()
+    assert len(dataset.get_dataframe()) == 12
+
+
+def test_regex_parser_matches_parse_library(tmp_path):
+    from pyweblogalyzer.collector.parser import LogParser, compile_log_format
+
+    assert compile_log_format("{remote_ip} {status:d}") is None
+    assert compile_log_format("{remote_ip}{status}") is None
+
+    write_logs(tmp_path / "access.log", 20)
+    log_lines = (tmp_path / "access.log").read_text().splitlines()
+    # A quote in the user agent doesn't match the regex, and is parsed by the parse library
+    log_lines.append(log_lines[0].replace("Firefox/89.0", 'Firefox/89.0 "quoted"'))
+
+    batches = [
+        LogParser(make_config(tmp_path, LOG_PARSER=parser_type)).parse_lines(log_lines)
+        for parser_type in ["parse", "auto"]
+    ]
+    assert {field: list(values) for field, values in batches[0].items()} == {
+        field: list(values) for field, values in batches[1].items()
+    }
+    assert len(batches[1]["timestamp"]) == 21
+    assert batches[1]["timestamp"][1] - batches[1]["timestamp"][0] == 10**9
+    assert len(LogParser(make_config(tmp_path, LOG_PARSER="regex")).parse_lines(log_lines)["timestamp"]) == 20
+
+
+def test_user_agents_cache(tmp_path):
+    from pyweblogalyzer.cache import LRUCache
+    from pyweblogalyzer.collector.parser import LogParser
+
+    cache = LRUCache(2)
+    for key in ["a", "b", "a", "c", "b"]:
+        cache.get(key, str.upper)
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 4}
+
+    write_logs(tmp_path / "access.log", 20)
+    parser = LogParser(make_config(tmp_path))
+    batch = parser.parse_lines((tmp_path / "access.log").read_text().splitlines())
+    assert set(batch["browser"]) == {"Firefox"} and set(batch["os"]) == {"Linux"}
+    assert parser.stats()["user_agents"] == {"size": 1, "hits": 19, "misses": 1}
+
+
+def test_geoip_cache(tmp_path, monkeypatch):
+    from pyweblogalyzer import cache
+    from pyweblogalyzer.collector.parser import LocalNetworks, LogParser
+
+    now = [0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    ttl_cache = cache.LRUCache(10, ttl=60)
+    ttl_cache.get("a", str.upper)
+    now[0] = 30
+    ttl_cache.get("a", str.upper)
+    now[0] = 61
+    ttl_cache.get("a", str.upper)
+    assert ttl_cache.stats() == {"size": 1, "hits": 1, "misses": 2}
+
+    local = LocalNetworks(["192.168.0.0/24", "10.0.0.0/8", "fd00::/8"])
+    assert ip_address("192.168.0.12") in local and ip_address("10.20.30.40") in local
+    assert ip_address("192.168.1.12") not in local and ip_address("11.0.0.1") not in local
+
+    parser = LogParser(make_config(tmp_path, LOCAL_NETWORKS=["192.168.0.0/24"]))
+    assert not parser.is_remote_ip("192.168.0.3") and parser.is_remote_ip("8.8.8.8")
+    for ip in ["8.8.8.8", "192.168.0.3", "8.8.8.8", "192.168.0.3"]:
+        assert parser._get_geoloc(ip) == (None, None)
+    assert parser.stats()["geoip"] == {"size": 2, "hits": 2, "misses": 2}
+
+
+def test_restart_from_snapshot(tmp_path):
+    write_logs(tmp_path / "access.log", 30)
+    config = make_config(tmp_path / "access.log", SNAPSHOT_PATH=str(tmp_path / "snapshot"), SNAPSHOT_PERIOD_SECS=0)
+    collector = CollectorApp(WebLogDataSet(), config)
+    collector._parse_log_file(str(tmp_path / "access.log"))
+    collector._checkpoint()
+
+    # Only the logs written after the snapshot are parsed
+    write_logs(tmp_path / "access.log", 5, start=30, mode="a")
+    dataset = WebLogDataSet()
+    collector = CollectorApp(dataset, config)
+    collector._restore()
+    assert len(dataset) == 30
+    collector._parse_log_file(str(tmp_path / "access.log"))
+    df = dataset.get_dataframe()
+    assert len(df) == 35
+    assert df["bytes_sent"].sum() == sum(range(35))
+
+
+ENRICHERS = '''
+from pyweblogalyzer import LogEnricherPlugin
+
+
+class PageEnricher(LogEnricherPlugin):
+    def enrich_log(self, log_data):
+        log_data.add_aux_info("page", int(log_data.http_url.split("/")[-1]))
+
+
+class EvenPageEnricher(LogEnricherPlugin):
+    def enrich_log(self, log_data):
+        raise NotImplementedError()
+
+    def enrich_batch(self, logs):
+        return {"even": (logs["aux_page"] % 2 == 0).tolist()}
+
+
+class UrlEnricher(LogEnricherPlugin):
+    def enrich_log(self, log_data):
+        if log_data.aux_even:
+            log_data.http_url = "/even"
+            log_data.request_status = 418
+
+
+class StatusEnricher(LogEnricherPlugin):
+    def enrich_log(self, log_data):
+        raise NotImplementedError()
+
+    def enrich_batch(self, logs):
+        return {"request_status": logs["request_status"] + 1}
+'''
+
+
+def test_enrichers(tmp_path):
+    (tmp_path / "enrichers").mkdir()
+    (tmp_path / "enrichers" / "test_enrichers.py").write_text(ENRICHERS)
+    write_logs(tmp_path / "access.log", 30)
+    config = make_config(tmp_path / "access.log", LOG_ENRICHERS_ROOT=str(tmp_path / "enrichers"), LOG_ENRICHERS=[
+        {"class_path": "test_enrichers.py", "class_name": name, "config": {}}
+        for name in ["PageEnricher", "EvenPageEnricher", "UrlEnricher", "StatusEnricher"]
+    ])
+    dataset = WebLogDataSet()
+    CollectorApp(dataset, config)._parse_log_file(str(tmp_path / "access.log"))
+
+    df = dataset.get_dataframe()
+    even = [idx % 11 % 2 == 0 for idx in range(30)]
+    assert df["aux_page"].tolist() == [idx % 11 for idx in range(30)]
+    assert df["aux_even"].tolist() == even
+    # Info fields updated by the enrichers replace the parsed ones
+    assert df["http_url"].tolist() == ["/even" if even[idx] else f"/page/{idx % 11}" for idx in range(30)]
+    assert df["request_status"].tolist() == [
+        419 if even[idx] else 405 if idx % 10 == 0 else 201 for idx in range(30)
+    ]
+
+
+def test_io_bound_enricher():
+    import threading
+    import time
+    import urllib.request
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import pandas
+    from pyweblogalyzer import IOBoundEnricherPlugin
+
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            if self.path == "/slow":
+                time.sleep(1)
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(self.path[1:].upper().encode())
+
+        def log_message(self, *args):
+            pass
+
+    class UrlEnricher(IOBoundEnricherPlugin):
+        KEY_FIELD = "http_url"
+        FIELDS_DEFAULTS = {"name": "unknown"}
+
+        def lookup(self, key):
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}{key}") as response:
+                return {"name": response.read().decode()}
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        enricher = UrlEnricher({"timeout_secs": 0.5, "workers": 2})
+        logs = pandas.DataFrame({"http_url": ["/a", "/slow", "/b", "/a"]})
+        start = time.time()
+        assert enricher.enrich_batch(logs) == {"name": ["A", "unknown", "B", "A"]}
+        assert time.time() - start < 0.9
+        assert sorted(requests) == ["/a", "/b", "/slow"]
+
+        # Cached results, including the late one, are not requested again
+        time.sleep(1)
+        assert enricher.enrich_batch(logs) == {"name": ["A", "SLOW", "B", "A"]}
+        assert len(requests) == 3
+    finally:
+        server.shutdown()
+
+
+def test_parse_archives(tmp_path):
+    import gzip
+    import shutil
+
+    write_logs(tmp_path / "access.log.1", 40)
+    with open(tmp_path / "access.log.1", "rb") as log_file, gzip.open(tmp_path / "access.log.1.gz", "wb") as archive:
+        # No end of line after the last log
+        archive.write(log_file.read().rstrip(b"\n"))
+    (tmp_path / "access.log.1").unlink()
+    dataset = WebLogDataSet()
+    collector = CollectorApp(dataset, make_config(tmp_path))
+    collector.READ_BLOCK_BYTES = 1000
+    collector._parse_log_file(str(tmp_path / "access.log.1.gz"))
+    df = dataset.get_dataframe()
+    assert len(df) == 40 and df["bytes_sent"].sum() == sum(range(40))
+
+    # Archives already read are skipped, even when renamed, and an archive at the same path is read
+    shutil.move(tmp_path / "access.log.1.gz", tmp_path / "access.log.2.gz")
+    write_logs(tmp_path / "access.log.1", 10, start=40)
+    with open(tmp_path / "access.log.1", "rb") as log_file, gzip.open(tmp_path / "access.log.1.gz", "wb") as archive:
+        archive.write(log_file.read())
+    (tmp_path / "access.log.1").unlink()
+    collector._parse_log_file(str(tmp_path / "access.log.2.gz"))
+    collector._parse_log_file(str(tmp_path / "access.log.1.gz"))
+    assert len(dataset.get_dataframe()) == 50
+
+    consumed = collector._archives.consumed
+    assert len(consumed) == 2 and not collector._log_positions
+    collector = CollectorApp(dataset, make_config(tmp_path, COLLECTION_WORKERS=1))
+    collector._archives = Archives(consumed)
+    try:
+        collector._parse_log_files_parallel(collector._build_file_list())
+    finally:
+        collector._pool.shutdown()
+    assert len(dataset.get_dataframe()) == 50
+
+
+def test_partial_lines_read_in_next_pass(tmp_path):
+    logfile = tmp_path / "access.log"
+    write_logs(logfile, 30)
+    line = (tmp_path / "access.log").read_text().splitlines(keepends=True)[0]
+    dataset = WebLogDataSet()
+    collector = CollectorApp(dataset, make_config(tmp_path, COLLECTION_BATCH_LINES=7))
+    # Blocks ending in the middle of the lines
+    collector.READ_BLOCK_BYTES = len(line) * 3 // 2
+    with open(logfile, "a") as file:
+        file.write(line[:20])
+    collector._parse_log_file(str(logfile))
+    df = dataset.get_dataframe()
+    assert len(df) == 30 and df["bytes_sent"].sum() == sum(range(30))
+    assert collector._log_positions[str(logfile)] == logfile.stat().st_size - 20
+
+    # The line being written is read once complete
+    with open(logfile, "a") as file:
+        file.write(line[20:])
+    collector._parse_log_file(str(logfile))
+    assert len(dataset.get_dataframe()) == 31
+    assert collector._log_positions[str(logfile)] == logfile.stat().st_size
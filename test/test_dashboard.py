@@ -0,0 +1,211 @@
+import base64
+from datetime import timedelta
+
+from pyweblogalyzer import DashboardApp, WebLogDataSet
+
+from test_dataset import make_log
+
+
+def make_dashboard(logs=()):
+    dataset = WebLogDataSet()
+    for log_data in logs:
+        dataset.add(log_data)
+    return DashboardApp(dataset, "pyweblogalyzer.config.Config", None), dataset
+
+
+def test_data_cached_per_generation():
+    dashboard, dataset = make_dashboard([make_log(0), make_log(10, remote_ip="5.6.7.8")])
+    computed = []
+    get_dashboard_data = dashboard.get_dashboard_data
+    dashboard.get_dashboard_data = lambda *args: computed.append(1) or get_dashboard_data(*args)
+    client = dashboard.test_client()
+
+    response = client.get("/data")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert {db["db_id"]: db.get("badge_value") for db in response.json["dashboards"]}["remote_ips"] == 2
+
+    # Same generation: served from cache, or not modified if the client has it
+    assert client.get("/data").json == response.json
+    assert client.get("/data", headers={"If-None-Match": etag}).status_code == 304
+    assert len(computed) == 1
+
+    dataset.add(make_log(20, remote_ip="9.9.9.9"))
+    response = client.get("/data", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(computed) == 2
+
+
+def test_context_data():
+    dashboard, _ = make_dashboard([make_log(0), make_log(10, remote_ip="5.6.7.8"), make_log(20)])
+    client = dashboard.test_client()
+
+    key = base64.b64encode(b"1.2.3.4").decode()
+    response = client.get(f"/context/remote_ips/{key}")
+    assert response.status_code == 200
+    assert len(response.json["table_data"]) == 2
+    # The remote ip column is indexed, and gives the same logs as filtering all logs
+    tabledata = dashboard.get_dashboard_table_data(dashboard._dataset.get_dataframe(), [], filter="remote_ip",
+                                                   value="1.2.3.4")
+    assert dashboard._export_table(tabledata) == response.json["table_data"]
+    response = client.get(f"/context/remote_ips/{key}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_data_time_range():
+    from test_dataset import START
+
+    dashboard, _ = make_dashboard([make_log(secs, remote_ip=f"1.1.1.{secs}") for secs in (0, 60, 120, 180)])
+    client = dashboard.test_client()
+    response = client.get("/data?start=2021-06-01T00:01:00&end=2021-06-01T00:02:00Z")
+    badges = {db["db_id"]: db.get("badge_value") for db in response.json["dashboards"]}
+    assert badges["remote_ips"] == 2
+    assert response.json["start_date"] == (START + timedelta(seconds=60)).strftime(
+        dashboard.config["DASHBOARD_RANGE_TIME_FORMAT"]
+    )
+    assert client.get("/data?start=yesterday").status_code == 400
+
+
+def test_server_side_table():
+    logs = [make_log(secs, remote_ip=f"10.0.0.{secs % 7}", http_url=f"/page/{secs}", bytes_sent=secs)
+            for secs in range(30)]
+    dashboard, _ = make_dashboard(logs)
+    client = dashboard.test_client()
+
+    # The logs table rows are not sent with the dashboards data
+    dashboards = {db["db_id"]: db for db in client.get("/data").json["dashboards"]}
+    assert "table" not in dashboards["logs"] and dashboards["logs"]["badge_value"] == 30
+    assert "table" in dashboards["remote_ips"]
+
+    columns = dashboard.config["DASHBOARDS_CONFIG"]["logs"]["display_cols"]
+    page = client.get("/table/logs?offset=5&length=10&order_col=0&order_dir=desc").json
+    assert page["recordsTotal"] == page["recordsFiltered"] == 30
+    assert [row[columns.index("bytes_sent")] for row in page["data"]] == list(range(24, 14, -1))
+
+    # Categories are sorted by value, and searched case insensitively
+    page = client.get(f"/table/logs?length=-1&order_col={columns.index('http_url')}&search=PAGE/1").json
+    assert page["recordsFiltered"] == 11
+    assert [row[columns.index("http_url")] for row in page["data"]][:3] == ["/page/1", "/page/10", "/page/11"]
+    assert client.get("/table/logs?search=29").json["recordsFiltered"] == 1
+
+    page = client.get("/table/logs?start=2021-06-01T00:00:10&end=2021-06-01T00:00:19").json
+    assert page["recordsTotal"] == 10 and len(page["data"]) == 10
+    assert client.get("/table/ctxt_ips").status_code == 404
+    assert client.get("/table/logs?offset=first").status_code == 400
+
+    # Only the responses of the most recent requests are cached
+    dashboard.config["RESPONSES_CACHE_SIZE"] = 3
+    dashboard._dataset.add(make_log(30))
+    for idx in range(10):
+        assert client.get(f"/table/logs?search=/page/{idx}").status_code == 200
+    assert len(dashboard._responses_cache) == 3
+
+
+def test_table_missing_values_without_orjson(monkeypatch):
+    import json
+    from copy import deepcopy
+
+    from pyweblogalyzer.dashboard import app
+
+    monkeypatch.setattr(app, "orjson", None)
+    dashboard, dataset = make_dashboard()
+    dashboards_config = dashboard.config["DASHBOARDS_CONFIG"] = deepcopy(dashboard.config["DASHBOARDS_CONFIG"])
+    dashboards_config["cities"]["allow_empty"] = True
+    dashboard._register_aggregates()
+    log_data = make_log(10, remote_ip="5.6.7.8")
+    log_data.city, log_data.country = "Lyon", None
+    dataset.add_many([make_log(0), log_data])
+    client = dashboard.test_client()
+
+    # Missing values are null, as NaN is not valid JSON
+    rows = json.loads(client.get("/table/logs?order_col=0&order_dir=asc").get_data())["data"]
+    columns = dashboards_config["logs"]["display_cols"]
+    assert [row[columns.index("country")] for row in rows] == ["France", None]
+    # Same for the tables sent by columns with the dashboards data
+    dashboards = {db["db_id"]: db for db in json.loads(client.get("/data").get_data())["dashboards"]}
+    table = dashboards["cities"]["table"]
+    assert sorted(table["values"][table["columns"].index("country")], key=str) == ["France", None]
+
+
+def test_top_n_tables():
+    from copy import deepcopy
+
+    dashboard, dataset = make_dashboard()
+    dashboards_config = dashboard.config["DASHBOARDS_CONFIG"] = deepcopy(dashboard.config["DASHBOARDS_CONFIG"])
+    dashboards_config["remote_ips"]["top_n"] = 3
+    dashboards_config["urls"].update(top_n=2, approximate=True, error_title="error")
+    dashboard._register_aggregates()
+    logs = [make_log(secs, remote_ip=f"10.0.0.{secs % 7}", http_url=f"/page/{secs % 4}") for secs in range(30)]
+    dataset.add_many(logs)
+
+    dashboards = {db["db_id"]: db for db in dashboard.get_dashboard_data()["dashboards"]}
+    # The badge still counts all the groups
+    assert dashboards["remote_ips"]["badge_value"] == 7
+    assert dashboards["remote_ips"]["table"]["values"][-1] == [5, 5, 4]
+    # Approximate counts, with their max error
+    urls = dashboards["urls"]["table"]
+    assert urls["columns"] == ["http_url", "URLs count", "error"]
+    assert urls["values"][1:] == [[8, 8], [0, 0]]
+    # Counts of a time range are exact
+    urls = {db["db_id"]: db for db in dashboard.get_dashboard_data(end=logs[9].timestamp)["dashboards"]}["urls"]
+    assert urls["table"]["values"][1:] == [[3, 3], [0, 0]]
+
+
+def test_data_by_columns_and_compressed():
+    import gzip
+    import json
+
+    dashboard, _ = make_dashboard([make_log(secs, remote_ip=f"10.0.0.{secs % 7}") for secs in range(50)])
+    client = dashboard.test_client()
+
+    response = client.get("/data")
+    assert "Content-Encoding" not in response.headers
+    dashboards = {db["db_id"]: db for db in response.json["dashboards"]}
+    table = dashboards["remote_ips"]["table"]
+    assert table["columns"] == ["remote_ip", "city", "country", "asn", "IP count"]
+    assert sorted(table["values"][0]) == [f"10.0.0.{idx}" for idx in range(7)]
+    assert sum(table["values"][-1]) == 50
+    # Graphs refer to the table columns, rather than repeating them
+    assert dashboards["remote_ips"]["graph_columns"] == {"x": ["remote_ip"], "y": ["IP count"]}
+    assert len(dashboards["cities"]["graph_data"]["text"][0]) == 1
+
+    compressed = client.get("/data", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert json.loads(gzip.decompress(compressed.data)) == response.json
+    assert compressed.headers["ETag"] == response.headers["ETag"]
+
+
+def test_events():
+    import threading
+
+    dashboard, dataset = make_dashboard([make_log(0)])
+    dashboard.config.update(EVENTS_MIN_PERIOD_SECS=0.01, EVENTS_KEEPALIVE_SECS=0.05)
+    client = dashboard.test_client()
+
+    response = client.get("/events", buffered=False)
+    assert response.mimetype == "text/event-stream"
+    events = (chunk.decode() for chunk in response.response)
+    assert next(events).startswith("retry: ")
+    # New clients are notified of the current data
+    generation = dataset.generation
+    assert next(events) == f"event: update\nid: {generation}\ndata: {dataset.origin}-{generation}\n\n"
+    assert next(events) == ": keepalive\n\n"
+    threading.Timer(0.02, dataset.add_many, args=([make_log(10)],)).start()
+    assert next(events).startswith(f"event: update\nid: {generation + 1}\n")
+    response.close()
+
+    # Clients reconnecting with the last notified generation are only notified of new logs
+    response = client.get("/events", headers={"Last-Event-ID": str(generation + 1)}, buffered=False)
+    events = (chunk.decode() for chunk in response.response)
+    next(events)
+    assert next(events) == ": keepalive\n\n"
+
+    # Clients exceeding the max are refused, until a client disconnects
+    dashboard.config["EVENTS_MAX_CLIENTS"] = 1
+    assert client.get("/events", buffered=False).status_code == 503
+    response.close()
+    response = client.get("/events", buffered=False)
+    assert response.status_code == 200
+    response.close()
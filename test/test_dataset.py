@@ -0,0 +1,386 @@
+from datetime import datetime, timedelta, timezone
+
+from pyweblogalyzer import WebLogData, WebLogDataSet
+from pyweblogalyzer.dataset.columns import ColumnStore
+
+START = datetime(2021, 6, 1, tzinfo=timezone.utc)
+
+
+def make_log(secs, remote_ip="1.2.3.4", http_url="/", request_status=200, bytes_sent=100):
+    return WebLogData(
+        timestamp=START + timedelta(seconds=secs),
+        remote_ip=remote_ip,
+        http_url=http_url,
+        request_status=request_status,
+        bytes_sent=bytes_sent,
+        request_time=0.1,
+        city="Paris",
+        country="France",
+        lat=48.85,
+        long=2.35,
+        asn="Example ASN",
+        browser="Firefox",
+        os="Linux",
+        device="Other",
+        http_operation="GET",
+        http_referer="-",
+        hostname="example.com",
+        protocol="HTTP/1.1",
+    )
+
+
+def test_dataframe_columns():
+    dataset = WebLogDataSet()
+    dataset.add(make_log(0, remote_ip="1.1.1.1"))
+    dataset.add(make_log(10, remote_ip="2.2.2.2", bytes_sent=50))
+    dataset.add(make_log(20, remote_ip="1.1.1.1", request_status=404))
+
+    df = dataset.get_dataframe()
+    assert len(df) == 3
+    assert df["remote_ip"].tolist() == ["1.1.1.1", "2.2.2.2", "1.1.1.1"]
+    assert df["remote_ip"].dtype == "category"
+    assert df["request_status"].tolist() == [200, 200, 404]
+    assert df["bytes_sent"].sum() == 250
+    assert df["country"].tolist() == ["France"] * 3
+    assert df.index[1] == START + timedelta(seconds=10)
+    assert df["timestamp"].tolist() == df.index.tolist()
+
+
+def test_dataframe_reused_until_new_logs():
+    dataset = WebLogDataSet()
+    dataset.add(make_log(0))
+    df = dataset.get_dataframe()
+    df["extra"] = 1
+    assert "extra" not in dataset.get_dataframe().columns
+
+    dataset.add(make_log(5))
+    assert len(dataset.get_dataframe()) == 2
+    # Frames previously returned are not altered by new logs
+    assert len(df) == 1
+
+
+def test_empty_dataset():
+    dataset = WebLogDataSet()
+    assert len(dataset.get_dataframe()) == 1
+    assert dataset.get_dataframe()["remote_ip"].isna().all()
+
+
+def test_store_growth_and_new_columns():
+    ColumnStore.CHUNK_ROWS, chunk_rows = 4, ColumnStore.CHUNK_ROWS
+    try:
+        store = ColumnStore({"timestamp": "datetime", "status": "int"})
+        store.append({"timestamp": [1, 2, 3], "status": [200, 200, 404], "url": ["/a", "/b", "/a"]})
+        first = store.frame()
+        store.append({
+            "timestamp": [4, 5, 6], "status": [500, None, 200], "url": ["/c", None, "/a"], "aux_x": [1, 2, 3]
+        })
+        df = store.frame()
+    finally:
+        ColumnStore.CHUNK_ROWS = chunk_rows
+
+    assert len(first) == 3 and first.columns.tolist() == ["timestamp", "status", "url"]
+    assert df["url"].tolist()[:4] == ["/a", "/b", "/a", "/c"]
+    assert df["url"].isna().tolist() == [False, False, False, False, True, False]
+    assert df["status"].isna().sum() == 1
+    assert df["aux_x"].isna().sum() == 3
+    assert df["aux_x"].dropna().tolist() == [1, 2, 3]
+
+
+def test_aggregates_match_full_computation():
+    from pyweblogalyzer.dataset.aggregates import GroupCountAggregate, TimeGroupAggregate
+
+    dataset = WebLogDataSet()
+    dataset.add(make_log(0, remote_ip="1.1.1.1"))
+    dataset.add_aggregate("ips", GroupCountAggregate(["remote_ip", "city"], ["remote_ip"], "count"))
+    dataset.add_aggregate("time", TimeGroupAggregate(["timestamp", "bytes_sent"], "1h", "tcount"))
+    for secs, ip in [(600, "2.2.2.2"), (4000, "1.1.1.1"), (12000, "3.3.3.3"), (12001, "1.1.1.1")]:
+        dataset.add(make_log(secs, remote_ip=ip))
+        dataset.get_dataframe()
+
+    ips = dataset.get_aggregate("ips")
+    assert ips.columns.tolist() == ["remote_ip", "city", "count"]
+    assert ips.iloc[0].tolist() == ["1.1.1.1", "Paris", 3]
+    assert sorted(ips["remote_ip"].tolist()) == ["1.1.1.1", "2.2.2.2", "3.3.3.3"]
+
+    periods = dataset.get_aggregate("time")
+    assert periods.columns.tolist() == ["timestamp", "bytes_sent", "tcount"]
+    assert periods["tcount"].tolist() == [2, 1, 0, 2]
+    assert periods["bytes_sent"].tolist() == [200, 100, 0, 200]
+    assert periods["timestamp"].iloc[1] == "2021-06-01T01:00:00+0000"
+    assert dataset.get_aggregate("unknown") is None
+
+
+def test_group_count_aggregate_by_codes():
+    from pyweblogalyzer.dataset.aggregates import GroupCountAggregate
+
+    aggregate = GroupCountAggregate(["request_status", "http_url", "city"], ["request_status", "http_url"], "count")
+    dataset = WebLogDataSet()
+    dataset.add_aggregate("codes", aggregate)
+    ColumnStore.CHUNK_ROWS, chunk_rows = 2, ColumnStore.CHUNK_ROWS
+    try:
+        dataset.add_many([make_log(0, http_url="/a"), make_log(1, http_url="/b", request_status=404)])
+        dataset.add_many([make_log(2, http_url="/a"), make_log(3, http_url="/a", request_status=404)])
+        codes = dataset.get_aggregate("codes")
+        assert codes.values.tolist()[0] == [200, "/a", "Paris", 2]
+        assert sorted(codes.values.tolist()) == [
+            [200, "/a", "Paris", 2], [404, "/a", "Paris", 1], [404, "/b", "Paris", 1]
+        ]
+        assert codes["count"].dtype == "int64" and codes["request_status"].dtype == "int64"
+
+        # Store codes change once logs are evicted, groups are still found by value
+        assert dataset.evict(max_rows=2) == 2
+        dataset.add_many([make_log(4, http_url="/b", request_status=404)])
+        log = make_log(5, http_url="/c")
+        log.city = None
+        dataset.add(log)
+        codes = dataset.get_aggregate("codes")
+        assert sorted(codes.values.tolist()) == [
+            [200, "/a", "Paris", 1], [404, "/a", "Paris", 1], [404, "/b", "Paris", 1]
+        ]
+        # The log with no city is not counted
+        assert len(aggregate._groups) == 3
+    finally:
+        ColumnStore.CHUNK_ROWS = chunk_rows
+
+
+def test_top_count_aggregate():
+    import random
+    from pyweblogalyzer.dataset.aggregates import TopCountAggregate
+
+    rng = random.Random(0)
+    urls = [f"/page/{rng.paretovariate(1.2):.0f}" for _ in range(3000)]
+    dataset = WebLogDataSet()
+    dataset.add_aggregate("top", TopCountAggregate(["http_url"], ["http_url"], "count", 20, "error"))
+    for idx in range(0, len(urls), 500):
+        dataset.add_many([make_log(secs, http_url=url) for secs, url in enumerate(urls[idx:idx + 500], idx)])
+
+    # Counts are lower bounds of the actual counts, at most error lower, with a bounded number of groups
+    top = dataset.get_aggregate("top")
+    actual = dataset.get_dataframe()["http_url"].astype(str).value_counts()
+    assert 0 < len(top) <= 20 < len(actual)
+    error = top["error"].iloc[0]
+    assert 0 < error <= len(urls) / 21
+    for url, count in zip(top["http_url"], top["count"]):
+        assert count <= actual[url] <= count + error
+    # The most frequent groups are always counted
+    assert set(actual.index[actual > error]) <= set(top["http_url"])
+    assert top["http_url"].iloc[0] == actual.index[0]
+
+
+def test_snapshot(tmp_path):
+    from pyweblogalyzer.dataset.aggregates import GroupCountAggregate
+
+    dataset = WebLogDataSet()
+    for secs, ip in [(0, "1.1.1.1"), (10, "2.2.2.2"), (20, "1.1.1.1")]:
+        dataset.add(make_log(secs, remote_ip=ip))
+    dataset.save_snapshot(str(tmp_path / "snapshot"), {"positions": {"access.log": 1234}})
+    # A new snapshot replaces the previous one
+    dataset.save_snapshot(str(tmp_path / "snapshot"), {"positions": {"access.log": 5678}})
+
+    loaded = WebLogDataSet()
+    loaded.add_aggregate("ips", GroupCountAggregate(["remote_ip"], ["remote_ip"], "count"))
+    assert loaded.load_snapshot(str(tmp_path / "snapshot")) == {"positions": {"access.log": 5678}}
+    assert loaded.get_dataframe().equals(dataset.get_dataframe())
+    assert loaded.get_aggregate("ips")["count"].tolist() == [2, 1]
+
+    # Logs are added after the memory mapped ones
+    loaded.add(make_log(30, remote_ip="3.3.3.3"))
+    assert loaded.get_dataframe()["remote_ip"].tolist() == ["1.1.1.1", "2.2.2.2", "1.1.1.1", "3.3.3.3"]
+    assert WebLogDataSet().load_snapshot(str(tmp_path / "missing")) == {}
+
+
+def test_reload_snapshot(tmp_path):
+    from pyweblogalyzer.dataset.aggregates import GroupCountAggregate
+
+    path = str(tmp_path / "snapshot")
+    ColumnStore.CHUNK_ROWS, chunk_rows = 2, ColumnStore.CHUNK_ROWS
+    try:
+        collected = WebLogDataSet()
+        for secs, ip in [(0, "1.1.1.1"), (10, "2.2.2.2"), (20, "1.1.1.1")]:
+            collected.add(make_log(secs, remote_ip=ip))
+        served = WebLogDataSet()
+        served.add_aggregate("ips", GroupCountAggregate(["remote_ip"], ["remote_ip"], "count"))
+        assert not served.reload_snapshot(path)
+        collected.save_snapshot(path, {})
+        assert served.reload_snapshot(path)
+        assert served.get_dataframe().equals(collected.get_dataframe())
+        assert (served.origin, served.generation) == (collected.origin, collected.generation)
+        # Reloaded only when a new snapshot is saved
+        assert not served.reload_snapshot(path)
+
+        # Aggregates are updated with the logs evicted and added since the previous snapshot
+        collected.add(make_log(30, remote_ip="3.3.3.3"))
+        assert collected.evict(max_rows=2) == 2
+        collected.save_snapshot(path, {})
+        assert served.reload_snapshot(path)
+        assert served.get_dataframe()["remote_ip"].tolist() == ["1.1.1.1", "3.3.3.3"]
+        assert served.get_aggregate("ips").values.tolist() == [["1.1.1.1", 1], ["3.3.3.3", 1]]
+
+        # A collector restarting with no snapshot starts a new history, the aggregates are computed again
+        restarted = WebLogDataSet()
+        restarted.add(make_log(40, remote_ip="4.4.4.4"))
+        restarted.save_snapshot(path, {})
+        assert served.reload_snapshot(path)
+        assert served.get_aggregate("ips").values.tolist() == [["4.4.4.4", 1]]
+
+        # The generations continue from the snapshot loaded by the collector
+        resumed = WebLogDataSet()
+        resumed.load_snapshot(path)
+        assert (resumed.origin, resumed.generation) == (restarted.origin, restarted.generation)
+    finally:
+        ColumnStore.CHUNK_ROWS = chunk_rows
+
+
+def test_snapshot_segments(tmp_path):
+    import os
+
+    path = str(tmp_path / "snapshot")
+    ColumnStore.CHUNK_ROWS, chunk_rows = 2, ColumnStore.CHUNK_ROWS
+    try:
+        collected = WebLogDataSet()
+        served = WebLogDataSet()
+        segments = []
+        # Logs added since the previous snapshot are saved in a new segment, merged with the previous segments no
+        # larger than it
+        for count, expected in [(3, [(0, 3)]), (1, [(0, 3), (3, 4)]), (1, [(0, 3), (3, 5)]), (2, [(0, 7)])]:
+            for idx in range(len(collected), len(collected) + count):
+                collected.add(make_log(idx, remote_ip=f"1.1.1.{idx % 3}", http_url=f"/{idx}"))
+            collected.save_snapshot(path, {"count": len(collected)})
+            segments = [f"segment_{collected.origin}_{start}_{end}" for start, end in expected]
+            assert sorted(os.listdir(path)) == sorted(segments + ["dataset.json"])
+            assert served.reload_snapshot(path)
+            assert served.get_dataframe().equals(collected.get_dataframe())
+
+        # Segments of evicted logs are removed, and the served logs evicted as well
+        for idx in range(7, 10):
+            collected.add(make_log(idx, remote_ip="2.2.2.2", http_url=f"/{idx}"))
+        assert collected.evict(max_rows=3) == 7
+        collected.save_snapshot(path, {"count": len(collected)})
+        assert sorted(os.listdir(path)) == ["dataset.json", f"segment_{collected.origin}_7_10"]
+        assert served.reload_snapshot(path)
+        assert served.get_dataframe().equals(collected.get_dataframe())
+        assert served.get_dataframe()["http_url"].cat.categories.tolist() == ["/7", "/8", "/9"]
+
+        restored = WebLogDataSet()
+        assert restored.load_snapshot(path) == {"count": 3}
+        assert restored.get_dataframe().equals(collected.get_dataframe())
+    finally:
+        ColumnStore.CHUNK_ROWS = chunk_rows
+
+
+def test_retention():
+    from pyweblogalyzer.dataset.aggregates import GroupCountAggregate, TimeGroupAggregate
+
+    ColumnStore.CHUNK_ROWS, chunk_rows = 4, ColumnStore.CHUNK_ROWS
+    try:
+        dataset = WebLogDataSet()
+        dataset.add_aggregate("ips", GroupCountAggregate(["remote_ip"], ["remote_ip"], "count"))
+        dataset.add_aggregate("rollup", TimeGroupAggregate(["timestamp"], "1h", "tcount"))
+        dataset.add_aggregate("time", TimeGroupAggregate(["timestamp"], "1h", "tcount", rollup=False))
+        for idx in range(10):
+            dataset.add(make_log(idx * 1800, remote_ip="1.1.1.1" if idx < 4 else "2.2.2.2"))
+
+        # Only whole chunks of logs older than the min timestamp are evicted
+        assert dataset.evict(min_timestamp=START + timedelta(hours=2, minutes=10)) == 4
+        df = dataset.get_dataframe()
+        assert len(df) == 6 and df.index[0] == START + timedelta(hours=2)
+        assert df["remote_ip"].cat.categories.tolist() == ["2.2.2.2"]
+        assert dataset.get_aggregate("ips")["remote_ip"].tolist() == ["2.2.2.2"]
+        assert dataset.get_aggregate("rollup")["tcount"].tolist() == [2] * 5
+        assert dataset.get_aggregate("time")["tcount"].tolist() == [2] * 3
+
+        # Rows exceeding the max are evicted once they are a whole chunk
+        assert dataset.evict(max_rows=4) == 0
+        assert dataset.evict(max_rows=2) == 4
+        assert len(dataset.get_dataframe()) == 2
+        assert dataset.get_aggregate("time")["tcount"].tolist() == [2]
+    finally:
+        ColumnStore.CHUNK_ROWS = chunk_rows
+
+
+def test_dataframe_time_range():
+    from pyweblogalyzer.dataset.columns import BlockIndex
+
+    BlockIndex.BLOCK_ROWS, block_rows = 4, BlockIndex.BLOCK_ROWS
+    try:
+        dataset = WebLogDataSet()
+        # Mostly sorted logs, like logs of several files
+        for secs in [0, 10, 20, 30, 40, 5, 50, 60, 70, 80, 90, 100, 110, 35]:
+            dataset.add(make_log(secs))
+        dataset.get_dataframe()
+        start_ns = int(START.timestamp()) * 10**9
+        assert dataset._store.rows_range(max_value=start_ns + 20 * 10**9) == (0, 8)
+        assert dataset._store.rows_range(min_value=start_ns + 85 * 10**9) == (8, 14)
+
+        df = dataset.get_dataframe(START + timedelta(seconds=30), START + timedelta(seconds=60))
+        assert sorted((ts - START).seconds for ts in df.index) == [30, 35, 40, 50, 60]
+        assert len(dataset.get_dataframe(end=START + timedelta(seconds=10))) == 3
+        assert dataset.get_dataframe(START + timedelta(days=1))["remote_ip"].isna().all()
+    finally:
+        BlockIndex.BLOCK_ROWS = block_rows
+
+
+def test_find_indexed_logs():
+    ColumnStore.CHUNK_ROWS, chunk_rows = 4, ColumnStore.CHUNK_ROWS
+    try:
+        dataset = WebLogDataSet()
+        for idx in range(6):
+            dataset.add(make_log(idx, remote_ip=f"1.1.1.{idx % 3}", request_status=404 if idx % 2 else 200))
+        assert dataset.find("remote_ip", "1.1.1.1") is None
+
+        dataset.add_index("remote_ip")
+        dataset.add_index("request_status")
+        for idx in range(6, 9):
+            dataset.add(make_log(idx, remote_ip=f"1.1.1.{idx % 3}", request_status=404 if idx % 2 else 200))
+        df = dataset.get_dataframe()
+        for column, value in [("remote_ip", "1.1.1.1"), ("request_status", 404), ("remote_ip", "9.9.9.9")]:
+            assert dataset.find(column, value).equals(df[df[column] == value])
+        assert len(dataset.find("remote_ip", "1.1.1.1", end=START + timedelta(seconds=4))) == 2
+
+        # Indexes are rebuilt when logs are evicted
+        dataset.evict(max_rows=4)
+        assert dataset.find("remote_ip", "1.1.1.1").index.tolist() == [START + timedelta(seconds=7)]
+    finally:
+        ColumnStore.CHUNK_ROWS = chunk_rows
+
+
+def test_log_data_and_add_many():
+    log_data = make_log(0, remote_ip="1.1.1.1")
+    log_data.http_url = "/a?b"
+    log_data.add_aux_info("param", "b")
+    assert (log_data.http_url, log_data.aux_param, log_data.aux_infos()) == ("/a?b", "b", {"aux_param": "b"})
+    assert not hasattr(log_data, "__dict__")
+
+    dataset = WebLogDataSet()
+    dataset.add_many([log_data, make_log(10, remote_ip="2.2.2.2")])
+    df = dataset.get_dataframe()
+    assert df["remote_ip"].tolist() == ["1.1.1.1", "2.2.2.2"]
+    assert df["http_url"].tolist() == ["/a?b", "/"]
+    assert df["aux_param"].tolist()[0] == "b" and df["aux_param"].isna().tolist()[1]
+
+
+def test_wait_generation():
+    import threading
+
+    dataset = WebLogDataSet()
+    generation = dataset.generation
+    assert dataset.wait_generation(generation, timeout=0.01) == generation
+    thread = threading.Timer(0.05, dataset.add_many, args=([make_log(0)],))
+    thread.start()
+    assert dataset.wait_generation(generation, timeout=5) == generation + 1
+    thread.join()
+
+
+def test_value_index_appends():
+    store = ColumnStore({"timestamp": "datetime", "status": "int"})
+    store.add_index("ip")
+    store.add_index("status")
+    ips, statuses = [], []
+    # Queries between appends of various sizes, the recent rows being sorted apart or merged with the others
+    for size in [1, 5, 100, 3, 1, 2000, 7]:
+        start = len(ips)
+        ips.extend(f"10.0.0.{(idx * 7) % 20}" for idx in range(start, start + size))
+        statuses.extend([200, 404, 500][(idx * idx) % 3] for idx in range(start, start + size))
+        store.append({"timestamp": list(range(start, start + size)), "ip": ips[start:], "status": statuses[start:]})
+        for name, values, value in [("ip", ips, "10.0.0.3"), ("status", statuses, 404), ("status", statuses, 302)]:
+            assert store.rows_with(name, value).tolist() == [pos for pos, v in enumerate(values) if v == value]